@@ -0,0 +1,119 @@
+"""Runtime tuning of how many examples a streaming build keeps in flight.
+
+The worker pool is started with its maximum size and the tuner decides how many examples are submitted at
+once, which also bounds how many workers are busy. Every `interval` seconds it compares the throughput of
+the last window with the one before and hill-climbs: a step that made things worse is reverted, otherwise
+it keeps going in the same direction. It does not grow while the parent cannot keep up with the results,
+the CPUs are saturated or the disks are (high I/O wait), since more work in flight would only cost memory.
+"""
+
+import time
+from typing import Dict, Optional
+
+import psutil
+from absl import logging
+
+TOLERANCE = 0.05  # relative throughput change treated as noise
+MAX_CPU_PERCENT = 95.0
+MAX_IOWAIT_PERCENT = 50.0
+
+
+class InflightAutotuner:
+    """Hill-climbing controller for the number of examples in flight, see the module docstring."""
+
+    def __init__(
+        self,
+        num_workers: int,
+        interval: float = 10.0,
+        minimum: int = 1,
+        maximum: Optional[int] = None,
+    ):
+        self.num_workers = num_workers
+        self.interval = interval
+        self.minimum = minimum
+        self.maximum = maximum or 2 * num_workers
+        self.limit = max(minimum, num_workers // 4)  # start conservatively
+        self.best_rate = 0.0
+        self.best_limit = self.limit
+        self._direction = 1
+        self._previous_rate = None
+        self._window_start = time.monotonic()
+        self._num_done = 0
+        self._backlog = 0
+        self._worker_cpu: Dict[int, float] = {}
+        psutil.cpu_times_percent(interval=None)  # starts the system-wide measurement window
+
+    def observe(self, worker_pids, backlog: int) -> None:
+        """Called once per finished example with the pids of the pool workers and the number of results
+        waiting for the parent. Adjusts `limit` at the end of every window.
+        """
+        self._num_done += 1
+        self._backlog += backlog
+        elapsed = time.monotonic() - self._window_start
+        if elapsed < self.interval:
+            return
+        rate = self._num_done / elapsed
+        mean_backlog = self._backlog / self._num_done
+        busy = self._worker_busy(worker_pids, elapsed)
+        cpu = psutil.cpu_times_percent(interval=None)
+        iowait = getattr(cpu, "iowait", 0.0)
+        cpu_percent = 100.0 - cpu.idle - iowait
+
+        if rate > self.best_rate:
+            self.best_rate, self.best_limit = rate, self.limit
+        if self._previous_rate is not None and rate < self._previous_rate * (1 - TOLERANCE):
+            self._direction = -self._direction
+        if mean_backlog >= max(1.0, self.limit / 2):
+            reason = "parent is behind"
+            self._direction = -1
+        elif self._direction > 0 and cpu_percent >= MAX_CPU_PERCENT and busy >= 0.9:
+            reason = "CPUs are saturated"
+            self._direction = -1
+        elif self._direction > 0 and iowait >= MAX_IOWAIT_PERCENT:
+            reason = "storage is saturated"
+            self._direction = -1
+        else:
+            reason = "improving" if self._direction > 0 else "backing off"
+        step = max(1, self.limit // 4)
+        new_limit = min(self.maximum, max(self.minimum, self.limit + self._direction * step))
+        logging.info(
+            "Autotune: %.1f examples/s, workers %.0f%% busy, CPU %.0f%%, iowait %.0f%%, parent backlog "
+            "%.1f; %s, %d -> %d examples in flight.",
+            rate,
+            busy * 100,
+            cpu_percent,
+            iowait,
+            mean_backlog,
+            reason,
+            self.limit,
+            new_limit,
+        )
+        self.limit = new_limit
+        self._previous_rate = rate
+        self._window_start = time.monotonic()
+        self._num_done = 0
+        self._backlog = 0
+
+    def log_summary(self) -> None:
+        logging.info(
+            "Autotune: best throughput %.1f examples/s with %d examples in flight. To pin it, set "
+            "AUTOTUNE = False, NUM_WORKERS = %d, STREAMING = True and MAX_INFLIGHT = %d.",
+            self.best_rate,
+            self.best_limit,
+            min(self.best_limit, self.num_workers),
+            self.best_limit,
+        )
+
+    def _worker_busy(self, worker_pids, elapsed: float) -> float:
+        """Fraction of the window the workers that had work spent on the CPU."""
+        cpu_seconds = 0.0
+        worker_cpu = {}
+        for pid in worker_pids:
+            try:
+                times = psutil.Process(pid).cpu_times()
+            except psutil.NoSuchProcess:
+                continue
+            worker_cpu[pid] = times.user + times.system
+            cpu_seconds += worker_cpu[pid] - self._worker_cpu.get(pid, worker_cpu[pid])
+        self._worker_cpu = worker_cpu
+        return cpu_seconds / elapsed / min(self.limit, self.num_workers)
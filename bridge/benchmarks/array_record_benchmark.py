@@ -0,0 +1,171 @@
+"""Compares TFRecord and ArrayRecord output of MultiThreadedDatasetBuilder on a synthetic Bridge-shaped dataset.
+
+For each format it builds the same episodes (4 JPEG cameras and a PNG depth map per step, like bridge_dataset)
+and reports build throughput, then reads random episodes and reports the latency of fetching one serialized
+episode. ArrayRecord reads one record by index; TFRecord has to scan its shard up to the episode.
+
+    python benchmarks/array_record_benchmark.py --num_episodes 200 --mode direct_shards
+"""
+
+import argparse
+import functools
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+import tensorflow_datasets as tfds
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dataset_builder import MultiThreadedDatasetBuilder  # noqa: E402
+
+IMAGE_SIZE = (480, 640)
+
+
+@functools.lru_cache(maxsize=None)
+def synthetic_frame(seed: int, depth: bool = False) -> bytes:
+    """Encoded frame with a blocky random pattern, which compresses about as well as a real camera image."""
+    rng = np.random.default_rng(seed)
+    if depth:
+        blocks = rng.integers(0, 2**16, (30, 40, 1), dtype=np.uint16)
+        return tf.io.encode_png(np.kron(blocks, np.ones((16, 16, 1), np.uint16))).numpy()
+    blocks = rng.integers(0, 255, (30, 40, 3), dtype=np.uint8)
+    return tf.io.encode_jpeg(np.kron(blocks, np.ones((16, 16, 1), np.uint8))).numpy()
+
+
+class SyntheticBridge(MultiThreadedDatasetBuilder):
+    VERSION = tfds.core.Version("1.0.0")
+    NUM_WORKERS = 8
+    STREAMING = True
+    NUM_EPISODES = 100
+    NUM_STEPS = 30
+
+    def _info(self) -> tfds.core.DatasetInfo:
+        image = functools.partial(
+            tfds.features.Image, shape=IMAGE_SIZE + (3,), dtype=np.uint8, encoding_format="jpeg"
+        )
+        return tfds.core.DatasetInfo(
+            builder=self,
+            features=tfds.features.FeaturesDict(
+                {
+                    "steps": tfds.features.Dataset(
+                        {
+                            "observation": tfds.features.FeaturesDict(
+                                {
+                                    **{f"image_{i}": image() for i in range(4)},
+                                    "depth_0": tfds.features.Image(
+                                        shape=IMAGE_SIZE + (1,), dtype=np.uint16, encoding_format="png"
+                                    ),
+                                    "state": tfds.features.Tensor(shape=(7,), dtype=np.float32),
+                                }
+                            ),
+                            "action": tfds.features.Tensor(shape=(7,), dtype=np.float32),
+                            "language_instruction": tfds.features.Text(),
+                        }
+                    ),
+                    "episode_metadata": tfds.features.FeaturesDict(
+                        {"file_path": tfds.features.Text()}
+                    ),
+                }
+            ),
+        )
+
+    @classmethod
+    def _process_example(cls, example_input):
+        rng = np.random.default_rng(example_input)
+        steps = [
+            {
+                "observation": {
+                    **{f"image_{i}": synthetic_frame(int(rng.integers(64))) for i in range(4)},
+                    "depth_0": synthetic_frame(int(rng.integers(8)), depth=True),
+                    "state": rng.random(7, dtype=np.float32),
+                },
+                "action": rng.random(7, dtype=np.float32),
+                "language_instruction": "put the spoon in the pot",
+            }
+            for _ in range(cls.NUM_STEPS)
+        ]
+        path = f"episode_{example_input}"
+        return path, {"steps": steps, "episode_metadata": {"file_path": path}}
+
+    def _split_generators(self, dl_manager):
+        return {"train": iter(range(self.NUM_EPISODES))}
+
+
+def build(data_dir: str, file_format: str) -> tfds.core.DatasetBuilder:
+    builder = SyntheticBridge(data_dir=data_dir, file_format=file_format)
+    start = time.perf_counter()
+    builder.download_and_prepare()
+    seconds = time.perf_counter() - start
+    split = builder.info.splits["train"]
+    print(
+        f"{file_format:>12} build: {split.num_examples / seconds:7.2f} episodes/s, "
+        f"{split.num_bytes / 1e6 / seconds:7.1f} MB/s ({split.num_bytes / 1e6:.0f} MB, {len(split.shard_lengths)} shards)"
+    )
+    return builder
+
+
+def random_read_latencies(builder: tfds.core.DatasetBuilder, indices) -> np.ndarray:
+    split = builder.info.splits["train"]
+    paths = [os.fspath(path) for path in split.filepaths]
+    latencies = []
+    if builder.info.file_format == tfds.core.FileFormat.ARRAY_RECORD:
+        from array_record.python import array_record_data_source
+
+        source = array_record_data_source.ArrayRecordDataSource(paths)
+        for index in indices:
+            start = time.perf_counter()
+            source[int(index)]
+            latencies.append(time.perf_counter() - start)
+    else:
+        offsets = np.cumsum([0] + split.shard_lengths)
+        for index in indices:
+            shard = int(np.searchsorted(offsets, index, side="right")) - 1
+            start = time.perf_counter()
+            dataset = tf.data.TFRecordDataset(paths[shard]).skip(int(index - offsets[shard])).take(1)
+            next(iter(dataset))
+            latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--num_episodes", type=int, default=100)
+    parser.add_argument("--num_steps", type=int, default=30)
+    parser.add_argument("--num_workers", type=int, default=8)
+    parser.add_argument("--num_reads", type=int, default=200)
+    parser.add_argument("--shards", type=int, default=4, help="shards per split for the shard modes")
+    parser.add_argument(
+        "--mode", choices=["shuffler", "worker_shards", "direct_shards"], default="direct_shards"
+    )
+    parser.add_argument("--data_dir", help="defaults to a temporary directory that is removed afterwards")
+    args = parser.parse_args()
+
+    SyntheticBridge.NUM_EPISODES = args.num_episodes
+    SyntheticBridge.NUM_STEPS = args.num_steps
+    SyntheticBridge.NUM_WORKERS = args.num_workers
+    if args.mode == "worker_shards":
+        SyntheticBridge.WORKER_SHARDS = args.shards
+    elif args.mode == "direct_shards":
+        SyntheticBridge.DIRECT_SHARDS = args.shards
+
+    data_dir = args.data_dir or tempfile.mkdtemp()
+    indices = np.random.default_rng(0).integers(args.num_episodes, size=args.num_reads)
+    try:
+        for file_format in ["tfrecord", "array_record"]:
+            builder = build(os.path.join(data_dir, file_format), file_format)
+            latencies = random_read_latencies(builder, indices) * 1e3
+            print(
+                f"{file_format:>12} random read: p50 {np.percentile(latencies, 50):7.2f} ms, "
+                f"p99 {np.percentile(latencies, 99):7.2f} ms"
+            )
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
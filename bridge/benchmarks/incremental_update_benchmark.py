@@ -0,0 +1,104 @@
+"""Measures an INCREMENTAL update of bridge_dataset against building it from scratch, and checks the update.
+
+Writes synthetic trajectories in the raw Bridge layout, builds bridge_dataset with INCREMENTAL and
+WORKER_SHARDS set, then adds `--num_new` trajectories and changes one of the existing ones. The update only
+converts those, adds them as shards and swaps the staged dataset directory in. It must then hold the same
+trajectories as a dataset built from scratch from the changed data, which is built as well for the timing.
+
+    python benchmarks/incremental_update_benchmark.py --num_trajectories 64 --num_new 8
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import tensorflow_datasets as tfds
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from array_record_benchmark import synthetic_frame  # noqa: E402
+from readahead_benchmark import write_trajectories  # noqa: E402
+
+from bridge_dataset.bridge_dataset_dataset_builder import DEPTH, BridgeDataset  # noqa: E402
+
+
+def build(data_dir: str, manual_dir: str):
+    """Builds or updates the dataset in `data_dir`, returns the seconds taken and the trajectory, number of
+    steps and a digest of the first frame of every example by split.
+    """
+    start = time.perf_counter()
+    builder = BridgeDataset(data_dir=data_dir)
+    builder.download_and_prepare(download_config=tfds.download.DownloadConfig(manual_dir=manual_dir))
+    seconds = time.perf_counter() - start
+    builder = BridgeDataset(data_dir=data_dir)
+    trajectories = {
+        split_name: sorted(
+            (
+                example["episode_metadata"]["file_path"].numpy().decode(),
+                len(steps),
+                hashlib.md5(steps[0]["observation"]["image_0"].numpy()).hexdigest(),
+            )
+            for example in builder.as_dataset(split=split_name)
+            for steps in [list(example["steps"])]
+        )
+        for split_name in builder.info.splits
+    }
+    return seconds, trajectories
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--num_trajectories", type=int, default=32)
+    parser.add_argument("--num_new", type=int, default=4)
+    parser.add_argument("--num_steps", type=int, default=20)
+    parser.add_argument("--num_views", type=int, default=2)
+    parser.add_argument("--num_workers", type=int, default=os.cpu_count())
+    parser.add_argument("--worker_shards", type=int, default=8)
+    args = parser.parse_args()
+
+    BridgeDataset.NUM_WORKERS = args.num_workers
+    BridgeDataset.INCREMENTAL = True
+    BridgeDataset.WORKER_SHARDS = args.worker_shards
+    manual_dir, data_dir, scratch_dir = tempfile.mkdtemp(), tempfile.mkdtemp(), tempfile.mkdtemp()
+    try:
+        # trajectories are found DEPTH - 1 levels below the manual dir
+        root = os.path.join(manual_dir, *[f"level{i}" for i in range(DEPTH - 1)])
+        paths = write_trajectories(root, args.num_trajectories + args.num_new, args.num_steps, args.num_views)
+        # the new trajectories wait outside of the manual dir until the update
+        new_paths = {
+            path: os.path.join(data_dir, os.path.basename(path)) for path in paths[args.num_trajectories :]
+        }
+        for path, outside_path in new_paths.items():
+            os.rename(path, outside_path)
+        seconds, _ = build(data_dir, manual_dir)
+        print(f"{args.num_trajectories} trajectories built in {seconds:.1f}s")
+
+        for path, outside_path in new_paths.items():
+            os.rename(outside_path, path)
+        # a new first frame in a trajectory that was built already, replaced like a copy tool does, which the
+        # fingerprint sees through the modification time of the image directory
+        frame_path = os.path.join(paths[0], "images0", "im_0.jpg")
+        with open(f"{frame_path}.tmp", "wb") as f:
+            f.write(synthetic_frame(63))
+        os.replace(f"{frame_path}.tmp", frame_path)
+        update_seconds, updated = build(data_dir, manual_dir)
+        scratch_seconds, built = build(scratch_dir, manual_dir)
+        print(
+            f"{args.num_new} new and 1 changed trajectories: update {update_seconds:.1f}s, "
+            f"from scratch {scratch_seconds:.1f}s"
+        )
+        if updated != built:
+            raise AssertionError("The updated dataset differs from the one built from scratch.")
+        if os.path.exists(os.path.join(data_dir, BridgeDataset.name, f"{BridgeDataset.VERSION}.incremental")):
+            raise AssertionError("The staging directory of the update was left behind.")
+        print("The updated dataset matches the one built from scratch.")
+    finally:
+        for directory in [manual_dir, data_dir, scratch_dir]:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
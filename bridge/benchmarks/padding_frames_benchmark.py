@@ -0,0 +1,102 @@
+"""Measures the build throughput of a synthetic Bridge-shaped dataset in which most cameras are missing.
+
+bridge_dataset fills the cameras and the depth map a trajectory lacks with all-zero frames. "zeros" passes a
+new zero array for every missing frame of every step, which `encode_example` encodes again each time, and
+"encoded" passes the frames `blank_frame` encoded once per worker, as the builder does now. Both produce the
+same records.
+
+    python benchmarks/padding_frames_benchmark.py --num_views 1 --depth_fraction 0.2
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from array_record_benchmark import IMAGE_SIZE, SyntheticBridge, synthetic_frame  # noqa: E402
+from bridge_dataset.bridge_dataset_dataset_builder import blank_frame  # noqa: E402
+
+
+class SparseBridge(SyntheticBridge):
+    NUM_VIEWS = 1  # cameras present in every episode, the others are padded
+    DEPTH_FRACTION = 0.2  # fraction of the episodes with a depth map
+    PADDING = "encoded"
+
+    @classmethod
+    def _blank_image(cls):
+        if cls.PADDING == "encoded":
+            return blank_frame(3, "uint8", "jpeg")
+        return np.zeros(IMAGE_SIZE + (3,), dtype=np.uint8)
+
+    @classmethod
+    def _blank_depth(cls):
+        if cls.PADDING == "encoded":
+            return blank_frame(1, "uint16", "png")
+        return np.zeros(IMAGE_SIZE + (1,), dtype=np.uint16)
+
+    @classmethod
+    def _process_example(cls, example_input):
+        rng = np.random.default_rng(example_input)
+        has_depth = rng.random() < cls.DEPTH_FRACTION
+        steps = [
+            {
+                "observation": {
+                    **{
+                        f"image_{i}": synthetic_frame(int(rng.integers(64)))
+                        if i < cls.NUM_VIEWS
+                        else cls._blank_image()
+                        for i in range(4)
+                    },
+                    "depth_0": synthetic_frame(int(rng.integers(8)), depth=True)
+                    if has_depth
+                    else cls._blank_depth(),
+                    "state": rng.random(7, dtype=np.float32),
+                },
+                "action": rng.random(7, dtype=np.float32),
+                "language_instruction": "put the spoon in the pot",
+            }
+            for _ in range(cls.NUM_STEPS)
+        ]
+        path = f"episode_{example_input}"
+        return path, {"steps": steps, "episode_metadata": {"file_path": path}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--num_episodes", type=int, default=100)
+    parser.add_argument("--num_steps", type=int, default=30)
+    parser.add_argument("--num_workers", type=int, default=os.cpu_count())
+    parser.add_argument("--num_views", type=int, default=1)
+    parser.add_argument("--depth_fraction", type=float, default=0.2)
+    args = parser.parse_args()
+
+    SparseBridge.NUM_EPISODES = args.num_episodes
+    SparseBridge.NUM_STEPS = args.num_steps
+    SparseBridge.NUM_WORKERS = args.num_workers
+    SparseBridge.NUM_VIEWS = args.num_views
+    SparseBridge.DEPTH_FRACTION = args.depth_fraction
+    print(
+        f"{args.num_workers} workers, {args.num_views} of 4 cameras, "
+        f"depth in {args.depth_fraction:.0%} of the episodes"
+    )
+    for padding in ["zeros", "encoded"]:
+        SparseBridge.PADDING = padding
+        data_dir = tempfile.mkdtemp()
+        try:
+            builder = SparseBridge(data_dir=data_dir)
+            start = time.perf_counter()
+            builder.download_and_prepare()
+            seconds = time.perf_counter() - start
+            num_bytes = builder.info.splits["train"].num_bytes
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+        print(f"{padding:>8} padding: {args.num_episodes / seconds:7.2f} episodes/s ({num_bytes / 1e6:.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
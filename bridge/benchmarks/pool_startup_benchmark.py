@@ -0,0 +1,67 @@
+"""Measures how long MultiThreadedDatasetBuilder takes to start its worker pool with each start method.
+
+For every start method it starts the pool of the synthetic Bridge-shaped builder from
+`array_record_benchmark` and reports the time until all workers ran their initializer, and the memory
+unique to the workers (USS), i.e. what is not shared with the parent or the fork server. The first
+forkserver pool also pays for starting the fork server and its imports, later pools reuse it.
+
+    python benchmarks/pool_startup_benchmark.py --num_workers 16
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import psutil
+import tensorflow_datasets as tfds
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from array_record_benchmark import SyntheticBridge  # noqa: E402
+
+
+def worker_uss(pool) -> int:
+    uss = 0
+    for process in pool._pool:
+        try:
+            uss += psutil.Process(process.pid).memory_full_info().uss
+        except psutil.NoSuchProcess:
+            pass
+    return uss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--num_workers", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--start_methods", nargs="+", default=mp.get_all_start_methods(), help="start methods to compare"
+    )
+    args = parser.parse_args()
+
+    SyntheticBridge.NUM_WORKERS = args.num_workers
+    data_dir = tempfile.mkdtemp()
+    try:
+        builder = SyntheticBridge(data_dir=data_dir)
+        for start_method in args.start_methods:
+            builder.START_METHOD = start_method
+            seconds, uss = [], []
+            for _ in range(args.repeats):
+                split_builder = builder._make_split_builder(tfds.download.DownloadConfig())
+                start = time.perf_counter()
+                with split_builder._pool() as pool:
+                    seconds.append(time.perf_counter() - start)
+                    uss.append(worker_uss(pool))
+            print(
+                f"{start_method:>10}: {args.num_workers} workers started in {seconds[0]:6.2f}s first, "
+                f"{min(seconds):6.2f}s best of {args.repeats}, {max(uss) / 2**20:7.0f} MiB unique to the workers"
+            )
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Measures how much of the file latency the readahead of a worker hides when converting Bridge trajectories.
+
+Processes and encodes trajectories one after another in this process, like a worker does, once reading the
+files one by one and once with each READAHEAD_THREADS setting, which also reads the next trajectory while the
+current one is encoded. Without `--root`, synthetic trajectories are written to a temporary directory on the
+local disk, where a read costs almost nothing; `--latency_ms` then adds a delay to every read to stand in for
+the round trip of a network file system. Point `--root` at a directory of real trajectories on the file
+system to measure instead.
+
+    python benchmarks/readahead_benchmark.py --latency_ms 2 --threads 4 8 16
+    python benchmarks/readahead_benchmark.py --root /nfs/bridge/raw/rss/toykitchen2 --threads 8 16 32
+"""
+
+import argparse
+import glob
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from array_record_benchmark import synthetic_frame  # noqa: E402
+
+import readahead  # noqa: E402
+from bridge_dataset.bridge_dataset_dataset_builder import DEFAULT_CAMERA_TOPICS, BridgeDataset  # noqa: E402
+
+
+def write_trajectories(root: str, num_trajectories: int, num_steps: int, num_views: int):
+    """Writes synthetic trajectories in the raw Bridge layout and returns their paths."""
+    paths = []
+    for i in range(num_trajectories):
+        path = os.path.join(root, "2023-03-15_15-11-20", "raw", "traj_group0", f"traj{i}")
+        for view in range(num_views):
+            os.makedirs(os.path.join(path, f"images{view}"))
+            for step in range(num_steps):
+                with open(os.path.join(path, f"images{view}", f"im_{step}.jpg"), "wb") as f:
+                    f.write(synthetic_frame(step % 64))
+        os.makedirs(os.path.join(path, "depth_images0"))
+        for step in range(num_steps):
+            with open(os.path.join(path, "depth_images0", f"im_{step}.png"), "wb") as f:
+                f.write(synthetic_frame(step % 8, depth=True))
+        with open(os.path.join(path, "obs_dict.pkl"), "wb") as f:
+            pickle.dump({"full_state": np.zeros((num_steps, 7))}, f)
+        with open(os.path.join(path, "policy_out.pkl"), "wb") as f:
+            pickle.dump([np.zeros(7) for _ in range(num_steps - 1)], f)
+        paths.append(path)
+    return paths
+
+
+def convert(paths, features) -> float:
+    """Processes and encodes all trajectories like a worker, returns the seconds per trajectory."""
+    inputs = [(path, (path, DEFAULT_CAMERA_TOPICS)) for path in paths]
+    start = time.perf_counter()
+    for current, upcoming in zip(inputs, inputs[1:] + [None]):
+        readahead.start(current, upcoming)
+        _, example = BridgeDataset._process_example(current[1])
+        features.encode_example(example)
+    return (time.perf_counter() - start) / len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="searched for trajectories with an images0 directory")
+    parser.add_argument("--num_trajectories", type=int, default=8)
+    parser.add_argument("--num_steps", type=int, default=40)
+    parser.add_argument("--num_views", type=int, default=4)
+    parser.add_argument("--latency_ms", type=float, default=0.0, help="delay added to every read")
+    parser.add_argument("--threads", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--per_mount", type=int, help="READAHEAD_PER_MOUNT, all threads if not set")
+    args = parser.parse_args()
+
+    read = readahead._read
+    if args.latency_ms:
+
+        def read_with_latency(path):
+            time.sleep(args.latency_ms / 1e3)
+            return read(path)
+
+        readahead._read = read_with_latency
+    root = args.root or tempfile.mkdtemp()
+    try:
+        if args.root:
+            image_dirs = glob.glob(os.path.join(root, "**", "images0"), recursive=True)
+            paths = sorted(os.path.dirname(path) for path in image_dirs)[: args.num_trajectories]
+        else:
+            paths = write_trajectories(root, args.num_trajectories, args.num_steps, args.num_views)
+        features = BridgeDataset(data_dir=tempfile.mkdtemp()).info.features
+        num_files = sum(len(BridgeDataset._example_files((path, None))) for path in paths) / len(paths)
+        print(f"{len(paths)} trajectories of {num_files:.0f} files, {args.latency_ms} ms added per read")
+        convert(paths[:1], features)  # warms up TensorFlow
+        print(f"{'sequential':>12}: {convert(paths, features) * 1e3:8.1f} ms per trajectory")
+        for threads in args.threads:
+            readahead.configure(BridgeDataset._example_files, threads, args.per_mount)
+            seconds = convert(paths, features)
+            readahead.reset()
+            print(f"{threads:>4} threads: {seconds * 1e3:8.1f} ms per trajectory")
+    finally:
+        if not args.root:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Measures the build throughput of MultiThreadedDatasetBuilder with different per-worker thread limits.
+
+Builds the synthetic Bridge-shaped dataset of `array_record_benchmark` once per WORKER_THREADS setting:
+"unlimited" lets TensorFlow, OpenCV and BLAS size their thread pools for the whole machine in every worker,
+"auto" is the default of cores / workers, and a number pins it. The difference grows with the number of
+cores, on a machine with a handful of cores there is little to oversubscribe.
+
+    python benchmarks/worker_threads_benchmark.py --num_workers 16 --threads unlimited auto 1 2
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import tensorflow_datasets as tfds
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from array_record_benchmark import SyntheticBridge  # noqa: E402
+
+SETTINGS = {"unlimited": 0, "auto": None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--num_episodes", type=int, default=200)
+    parser.add_argument("--num_steps", type=int, default=30)
+    parser.add_argument("--num_workers", type=int, default=os.cpu_count())
+    parser.add_argument("--threads", nargs="+", default=["unlimited", "auto", "1"])
+    parser.add_argument(
+        "--start_method",
+        default="forkserver",
+        help="with fork, TensorFlow keeps the thread pools the parent created before forking",
+    )
+    args = parser.parse_args()
+
+    SyntheticBridge.NUM_EPISODES = args.num_episodes
+    SyntheticBridge.NUM_STEPS = args.num_steps
+    SyntheticBridge.NUM_WORKERS = args.num_workers
+    SyntheticBridge.START_METHOD = args.start_method
+    print(f"{os.cpu_count()} cores, {args.num_workers} workers, {args.start_method}")
+    with tempfile.TemporaryDirectory() as data_dir:
+        # starts the fork server, so the first setting does not pay for it
+        split_builder = SyntheticBridge(data_dir=data_dir)._make_split_builder(tfds.download.DownloadConfig())
+        with split_builder._pool():
+            pass
+    for threads in args.threads:
+        SyntheticBridge.WORKER_THREADS = SETTINGS[threads] if threads in SETTINGS else int(threads)
+        data_dir = tempfile.mkdtemp()
+        try:
+            builder = SyntheticBridge(data_dir=data_dir)
+            start = time.perf_counter()
+            builder.download_and_prepare()
+            seconds = time.perf_counter() - start
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+        print(f"{threads:>10} threads per worker: {args.num_episodes / seconds:7.2f} episodes/s")
+
+
+if __name__ == "__main__":
+    main()
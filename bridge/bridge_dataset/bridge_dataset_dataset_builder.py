@@ -1,8 +1,10 @@
-import glob
+import functools
+import io
 import json
 import os
 import pickle
-from collections import Counter
+import threading
+from collections import Counter, OrderedDict
 from datetime import datetime
 
 import numpy as np
@@ -10,7 +12,11 @@ import tensorflow_datasets as tfds
 from absl import logging
 from tqdm import tqdm
 
-from dataset_builder  import MultiThreadedDatasetBuilder
+from dataset_builder  import COST_PER_FILE, MultiThreadedDatasetBuilder, hash_fraction, stream_splits
+from image_validation import decode_sample, validate_jpeg, validate_png
+from pipeline_stats import timed
+from readahead import read_file
+from trajectory_manifest import MANIFEST_FILENAME, TrajectoryManifest
 from PIL import Image
 
 import resource
@@ -24,7 +30,28 @@ DEPTH = 5
 TRAIN_PROPORTION = 1.0
 
 ORIG_NAMES = [f"images{i}" for i in range(N_VIEWS)]
+# frame directories of a trajectory and the extension of their frames
+FRAME_DIRS = {**{name: ".jpg" for name in ORIG_NAMES}, "depth_images0": ".png"}
+# typical size of a frame file in each frame directory, estimates the memory of a trajectory from its frame counts
+FRAME_BYTES = {**{name: 48 * 2**10 for name in ORIG_NAMES}, "depth_images0": 256 * 2**10}
 NEW_NAMES = [f"image_{i}" for i in range(N_VIEWS)]
+# assumed camera topics of dated folders without a config.json
+DEFAULT_CAMERA_TOPICS = [
+    "/D435/color/image_raw",
+    "/blue/image_raw",
+    "/yellow/image_raw",
+    "/wrist/image_raw",
+]
+
+
+@functools.lru_cache(maxsize=None)
+def blank_frame(channels: int, dtype: str, encoding_format: str) -> bytes:
+    """All-zero frame standing in for a missing camera or depth map, encoded once per worker. It is encoded by
+    the same feature as the real frames, so it is byte for byte what encoding the zero array every step gave.
+    """
+    shape = IMAGE_SIZE + (channels,)
+    feature = tfds.features.Image(shape=shape, dtype=np.dtype(dtype), encoding_format=encoding_format)
+    return feature.encode_example(np.zeros(shape, dtype=dtype))
 
 
 def find_folders_matching_pattern(root_dir, pattern):
@@ -64,22 +91,48 @@ def read_image(path: str) -> np.ndarray:
     #
     # # you can speed things up significantly by skipping image decoding/re-encoding by using the line below,
     # # but then you also need to skip the checks
+    # # (`BridgeDataset.VALIDATE_IMAGES` checks the headers of the passed-through frames instead)
 
-    with open(path, "rb") as f:
-        im = f.read()
+    return read_file(path)
 
-    return im
 
+def list_frames(path):
+    """The frames of a trajectory in step order, by frame directory. Directories that do not exist are left
+    out, an empty one is kept.
+    """
+    frames = {}
+    for name, extension in FRAME_DIRS.items():
+        try:
+            with os.scandir(os.path.join(path, name)) as entries:
+                names = [
+                    entry.name for entry in entries
+                    if entry.name.startswith("im_") and entry.name.endswith(extension)
+                ]
+        except FileNotFoundError:
+            continue
+        names.sort(key=lambda x: int(x.split("_")[-1].split(".")[0]))
+        frames[name] = [os.path.join(path, name, frame) for frame in names]
+    return frames
+
+
+# frames listed by `BridgeDataset._example_files` for the readahead, taken by `_process_example` so that every
+# trajectory is listed once; only the current and the upcoming trajectory are needed
+_listed_frames = OrderedDict()
+_listed_frames_lock = threading.Lock()
+MAX_LISTED_FRAMES = 4
+
+
+def take_frames(path):
+    """The frames of a trajectory the readahead listed already, listing them if it did not."""
+    with _listed_frames_lock:
+        frames = _listed_frames.pop(path, None)
+    return list_frames(path) if frames is None else frames
 
-def process_images(path):  # processes images at a trajectory level
-    image_dirs = set(os.listdir(str(path))).intersection(set(ORIG_NAMES))
-    image_paths = [
-        sorted(
-            glob.glob(os.path.join(path, image_dir, "im_*.jpg")),
-            key=lambda x: int(x.split("_")[-1].split(".")[0]),
-        )
-        for image_dir in image_dirs
-    ]
+
+@timed("process_images", num_bytes=lambda d: sum(len(im) for v in d.values() for im in v))
+def process_images(path, frames):  # processes images at a trajectory level
+    image_dirs = [image_dir for image_dir in ORIG_NAMES if image_dir in frames]
+    image_paths = [frames[image_dir] for image_dir in image_dirs]
 
     filenames = [[path.split("/")[-1] for path in x] for x in image_paths]
     assert all(x == filenames[0] for x in filenames), (path, filenames)
@@ -92,29 +145,25 @@ def process_images(path):  # processes images at a trajectory level
     return d
 
 
-def process_depth(path):
-    depth_path = os.path.join(path, "depth_images0")
-    if os.path.exists(depth_path):
-        image_paths = sorted(
-            glob.glob(os.path.join(depth_path, "im_*.png")),
-            key=lambda x: int(x.split("_")[-1].split(".")[0]),
-        )
-        return [read_image(path) for path in image_paths]
+@timed("process_depth", num_bytes=lambda ims: sum(len(im) for im in ims or []))
+def process_depth(frames):
+    if "depth_images0" in frames:
+        return [read_image(path) for path in frames["depth_images0"]]
     else:
         return None
 
 
+@timed("process_state")
 def process_state(path):
     fp = os.path.join(path, "obs_dict.pkl")
-    with open(fp, "rb") as f:
-        x = pickle.load(f)
+    x = pickle.loads(read_file(fp))
     return x["full_state"]
 
 
+@timed("process_actions")
 def process_actions(path):
     fp = os.path.join(path, "policy_out.pkl")
-    with open(fp, "rb") as f:
-        act_list = pickle.load(f)
+    act_list = pickle.loads(read_file(fp))
     if isinstance(act_list[0], dict):
         act_list = [x["actions"] for x in act_list]
     return act_list
@@ -162,6 +211,19 @@ class BridgeDataset(MultiThreadedDatasetBuilder):
 
     NUM_WORKERS = 16
     CHUNKSIZE = 1000
+    STREAMING = True
+    MAX_INFLIGHT_BYTES = 2 * 2**30
+    CHECKPOINT = True
+    SHARED_MEMORY = True
+    EXAMPLE_TIMEOUT = 600
+    MAX_RETRIES = 1
+    QUARANTINE = True
+    TRACK_MEMORY = True
+    LONGEST_FIRST = False  # sorting by cost would wait for the whole discovery, see `_discover`
+    TRAJECTORY_MANIFEST = True  # reuse the directory listings of the last discovery, see trajectory_manifest.py
+    VALIDATE_IMAGES = True  # check size, channels and bit depth of the passed-through frames from their headers
+    VALIDATE_DECODE_FRACTION = 0.0  # also fully decode this fraction of the frames, ~5ms per decoded frame
+    READAHEAD_THREADS = 8  # read the frames of a trajectory concurrently, each one is a round trip on NFS
 
     def _info(self) -> tfds.core.DatasetInfo:
         """Dataset metadata (homepage, citation,...)."""
@@ -277,12 +339,15 @@ class BridgeDataset(MultiThreadedDatasetBuilder):
 
         out = dict()
 
-        out["images"] = process_images(path)
-        out["depth"] = process_depth(path)
+        frames = take_frames(path)
+        out["images"] = process_images(path, frames)
+        out["depth"] = process_depth(frames)
         out["state"] = process_state(path)
         out["actions"] = process_actions(path)
         out["lang"] = process_lang(path)
         out["lang_NILS"] = process_lang_nils(path)
+        if cls.VALIDATE_IMAGES:
+            out["depth"] = cls._validate_frames(path, out["images"], out["depth"])
 
         # data collected prior to 7-23 has a delay of 1, otherwise a delay of 0
         date_time = datetime.strptime(path.split("/")[-4], "%Y-%m-%d_%H-%M-%S")
@@ -366,11 +431,11 @@ class BridgeDataset(MultiThreadedDatasetBuilder):
                 new_key = orig_to_new[orig_key]
                 observation[new_key] = out["images"][orig_key][i]
             for missing in missing_keys:
-                observation[missing] = np.zeros(IMAGE_SIZE + (3,), dtype=np.uint8)
+                observation[missing] = blank_frame(3, "uint8", "jpeg")
             if episode_metadata["has_depth_0"]:
                 observation["depth_0"] = out["depth"][i]
             else:
-                observation["depth_0"] = np.zeros(IMAGE_SIZE + (1,), dtype=np.uint16)
+                observation["depth_0"] = blank_frame(1, "uint16", "png")
 
             episode.append(
                 {
@@ -395,99 +460,122 @@ class BridgeDataset(MultiThreadedDatasetBuilder):
         # use episode path as key
         return path, sample
 
-    def _split_generators(self, dl_manager: tfds.download.DownloadManager):
-        # each path is a directory that contains dated directories
-        search_pattern = os.path.join(dl_manager.manual_dir, *("*" * (DEPTH - 1)))
-        logging.info(f"Searching for data in {search_pattern}")
-        paths = glob.glob(search_pattern)
-
-
-
-        train_inputs, val_inputs = [], []
-
-        train_paths = []
-
-        paths = [path for path in paths if os.path.isdir(path) and "cache" not in path]
-
-        logging.info(f"Found {len(paths)} data directories.")
-
-
-
-
-
-        no_traj_folders = []
-
-        for path in paths:
-
-            #logging.info(f"Found {len(os.listdir(path))} dated folders in {path}.")
-
-            cur_path_files = 0
-
-
-            for dated_folder in os.listdir(path):
-                # a mystery left by the greats of the past
-                if "lmdb" in dated_folder:
-                    continue
-
-                search_path = os.path.join(
-                    path, dated_folder, "raw", "traj_group*", "traj*"
-                )
-
-                #logging.info(f"Searching for data in {search_path}")
-
-                all_traj = glob.glob(search_path)
-
-                cur_path_files += len(all_traj)
-
-
-
-                #check if any image folder is present ORIG_NAMES
-                all_traj = [traj for traj in all_traj if any([name in os.listdir(traj) for name in ORIG_NAMES])]
-
-
-                if not all_traj:
-
-                    no_traj_folders.append(search_path)
-
-                    continue
-
-                config_path = os.path.join(path, dated_folder, "config.json")
-                if os.path.exists(config_path):
-                    with open(config_path, "rb") as f:
-                        config = json.load(f)
-                    camera_topics = config["agent"]["env"][1]["camera_topics"]
-                else:
-                    # assumed camera topics if no config.json exists
-                    camera_topics = [
-                        "/D435/color/image_raw",
-                        "/blue/image_raw",
-                        "/yellow/image_raw",
-                        "/wrist/image_raw",
-                    ]
-                all_inputs = [(t, camera_topics) for t in all_traj]
-
-                train_inputs += all_inputs[: int(len(all_inputs) * TRAIN_PROPORTION)]
-                train_paths += all_traj
-
-                val_inputs += all_inputs[int(len(all_inputs) * TRAIN_PROPORTION) :]
-
-            #logging.info(f"Found {cur_path_files} trajectories in {path}.")
-
+    @classmethod
+    @timed("validate_images")
+    def _validate_frames(cls, path, images, depth):
+        """Checks the headers of the frames, see image_validation.py, raising an error for a bad frame. Depth
+        maps saved with 8 bits are converted to 16 bits like the decoding read path did, and returned.
+        """
+        for image_dir, frames in images.items():
+            validate_jpeg(frames, IMAGE_SIZE + (3,), os.path.join(path, image_dir))
+            decode_sample(frames, cls.VALIDATE_DECODE_FRACTION, os.path.join(path, image_dir))
+        if depth is not None:
+            depth_path = os.path.join(path, "depth_images0")
+            for i in validate_png(depth, IMAGE_SIZE + (1,), 16, depth_path):
+                with Image.open(io.BytesIO(depth[i])) as im:
+                    depth[i] = np.array(im).astype(np.uint16)[..., None]
+            decode_sample(
+                [frame for frame in depth if isinstance(frame, bytes)],
+                cls.VALIDATE_DECODE_FRACTION,
+                depth_path,
+            )
+        return depth
 
+    @classmethod
+    def _estimate_example_cost(cls, example_input):
+        """Decoding and re-encoding the frames dominates, so only the image and depth files count."""
+        path, _ = example_input
+        num_bytes, num_files = 0, 0
+        for name in ORIG_NAMES + ["depth_images0"]:
+            try:
+                with os.scandir(os.path.join(path, name)) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            num_bytes += entry.stat().st_size
+                            num_files += 1
+            except FileNotFoundError:
+                continue
+        return float(num_bytes + COST_PER_FILE * num_files)
 
+    @classmethod
+    def _example_files(cls, example_input):
+        """The frames of every camera and the depth maps in step order, then the state and action pickles. The
+        frames are kept for `_process_example`, see `take_frames`.
+        """
+        path, _ = example_input
+        frames = list_frames(path)
+        with _listed_frames_lock:
+            _listed_frames[path] = frames
+            while len(_listed_frames) > MAX_LISTED_FRAMES:
+                _listed_frames.popitem(last=False)
+        files = [frame for name in FRAME_DIRS for frame in frames.get(name, [])]
+        return files + [os.path.join(path, "obs_dict.pkl"), os.path.join(path, "policy_out.pkl")]
+
+    def _estimate_example_memory(self, example_input):
+        """The frames the discovery counted times their typical size, without listing the trajectory again."""
+        path, _ = example_input
+        frame_counts = self._manifest.frame_counts(path)
+        if frame_counts is None:
+            return None
+        return sum(FRAME_BYTES[name] * count for name, count in frame_counts.items() if name in FRAME_BYTES)
+
+    def _known_example_files(self, example_input):
+        """The frames the discovery counted, named `im_<step>` like the recorder does, and the pickles."""
+        path, _ = example_input
+        frame_counts = self._manifest.frame_counts(path)
+        if frame_counts is None:
+            return None
+        files = [
+            os.path.join(path, name, f"im_{step}{extension}")
+            for name, extension in FRAME_DIRS.items()
+            for step in range(frame_counts.get(name, 0))
+        ]
+        return files + [os.path.join(path, "obs_dict.pkl"), os.path.join(path, "policy_out.pkl")]
+
+    def _checkpoint_origin(self, dl_manager):
+        """Trajectories are assigned to splits by their path below the manual dir."""
+        return {
+            **super()._checkpoint_origin(dl_manager),
+            "manual_dir": os.fspath(dl_manager.manual_dir),
+            "train_proportion": TRAIN_PROPORTION,
+        }
 
+    def _checkpoint_stamp(self, example_input):
+        """Adds the modification times and frame counts the discovery recorded for the trajectory."""
+        path, _ = example_input
+        return f"{super()._checkpoint_stamp(example_input)}:{self._manifest.stamp(path)}"
 
-        logging.info(
-            "Converting %d training and %d validation files.",
-            len(train_inputs),
-            len(val_inputs),
+    def _split_generators(self, dl_manager: tfds.download.DownloadManager):
+        # each path below DEPTH - 1 levels of the manual dir contains dated directories
+        logging.info(f"Searching for data in {dl_manager.manual_dir}")
+        manifest = TrajectoryManifest(
+            os.fspath(dl_manager.manual_dir),
+            (
+                os.path.join(self._data_dir_root, self.name, MANIFEST_FILENAME)
+                if self.TRAJECTORY_MANIFEST
+                else None
+            ),
+            depth=DEPTH - 1,
         )
-
-        #logging.info("No traj folders: %s", no_traj_folders)
-        return {
-            "train": iter(train_inputs),
-            "val": iter(val_inputs),
-        }
+        self._manifest = manifest
+        return stream_splits(self._discover(manifest), ["train", "val"])
+
+    def _discover(self, manifest: TrajectoryManifest):
+        """Yields `(split_name, (trajectory, camera_topics))` as the manifest finds the trajectories, so the
+        workers start converting during discovery. A trajectory goes to train or val by a hash of its path
+        below the manual dir, which is stable across builds and does not depend on the other trajectories.
+        """
+        counts = Counter()
+        for trajectory in manifest.trajectories():
+            relative_path = os.path.relpath(trajectory.path, manifest.root)
+            split_name = "train" if hash_fraction(relative_path, "split") < TRAIN_PROPORTION else "val"
+            counts[split_name] += 1
+            camera_topics = trajectory.camera_topics
+            if camera_topics is None:
+                camera_topics = DEFAULT_CAMERA_TOPICS
+            yield split_name, (trajectory.path, camera_topics)
+        manifest.save()
+        logging.info("Found %d training and %d validation files.", counts["train"], counts["val"])
 
 
 
@@ -1,10 +1,45 @@
 """Inspired by https://github.com/kpertsch/bridge_rlds_builder/blob/f0d16c5a8384c1476aa1c274a9aef3a5f76cbada/bridge_dataset/conversion_utils.py"""
 
 import abc
+import collections
+import contextlib
+import functools
+import glob
+import hashlib
 import itertools
+import json
 import multiprocessing as mp
-from typing import Any, Callable, Dict, Iterable, Tuple, Union
+import os
+import queue
+import shutil
+import signal
+import struct
+import sys
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import pool as mp_pool
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.pool import Pool
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
+import psutil
+import tensorflow as tf
 import tensorflow_datasets as tfds
 from absl import logging
 from tensorflow_datasets.core import (
@@ -12,17 +47,99 @@ from tensorflow_datasets.core import (
     download,
     example_serializer,
     file_adapters,
+    hashing,
     naming,
+    utils,
 )
 from tensorflow_datasets.core import split_builder as split_builder_lib
 from tensorflow_datasets.core import splits as splits_lib
 from tensorflow_datasets.core import writer as writer_lib
 from tqdm import tqdm
 
+import pipeline_stats
+import profiling
+import readahead
+from autotune import InflightAutotuner
+
 Key = Union[str, int]
 Example = Dict[str, Any]
 ExampleInput = Any
 
+INCREMENTAL_MANIFEST_FILENAME = "incremental_manifest.json"
+INCREMENTAL_STAGING_SUFFIX = ".incremental"  # next to the dataset dir, e.g. `bridge_dataset/1.0.0.incremental`
+REPLACED_DIR_SUFFIX = ".replaced"
+QUARANTINE_FILENAME = "quarantine.jsonl"
+WORKER_STARTUP_TIMEOUT = 600  # seconds
+COST_PER_FILE = 2**14  # bytes; opening a file costs about as much as reading this much data
+PARTITION_ENV_VAR = "RLDS_PARTITION"  # overrides MultiThreadedDatasetBuilder.PARTITION, e.g. "0/4"
+PROFILE_ENV_VAR = "RLDS_PROFILE"  # set to 1 to enable MultiThreadedDatasetBuilder.PROFILE
+PROFILE_PARTS_DIRNAME = "profile.parts"
+# read when OpenMP, BLAS or TensorFlow is loaded, set in workers for libraries they load later and subprocesses
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+    "TF_NUM_INTEROP_THREADS",
+)
+
+
+def partition_of(key: Key, num_partitions: int) -> int:
+    """Stable assignment of an example key to one of `num_partitions` partitions."""
+    digest = hashlib.md5(str(key).encode()).digest()
+    return int.from_bytes(digest[:8], "little") % num_partitions
+
+
+def hash_fraction(key: Key, salt: str = "") -> float:
+    """Stable pseudo-random number in [0, 1) for an example key, e.g. to assign it to a split. Use a distinct
+    `salt` for every purpose, so that the assignments are independent of each other and of `partition_of`.
+    """
+    digest = hashlib.md5(f"{salt}:{key}".encode()).digest()
+    return int.from_bytes(digest[:8], "little") / 2**64
+
+
+def shard_assignment(
+    keys: Sequence[Key], num_shards: int, salt: str, disable_shuffling: bool = False
+) -> Tuple[List[int], List[int]]:
+    """Stable assignment of example keys to `num_shards` shards the way tfds shuffles a split, with the split
+    name as `salt`. Returns the order in which to write the examples, as indices into `keys`, and the shard
+    of every example in that order: hashed key order, with the shard given by the hashed key. If
+    `disable_shuffling` is set, the order of `keys` is kept and the shards are contiguous slices of it, at
+    most one per key.
+    """
+    if disable_shuffling:
+        boundaries = writer_lib._get_shard_boundaries(len(keys), min(num_shards, len(keys)))
+        shard_ids = [
+            shard_id
+            for shard_id, (start, end) in enumerate(zip([0] + boundaries[:-1], boundaries))
+            for _ in range(start, end)
+        ]
+        return list(range(len(keys))), shard_ids
+    hasher = hashing.Hasher(salt=salt)
+    hashed_keys = sorted((hasher.hash_key(key), i) for i, key in enumerate(keys))
+    return [i for _, i in hashed_keys], [hkey % num_shards for hkey, _ in hashed_keys]
+
+
+def stream_splits(
+    pairs: Iterable[Tuple[splits_lib.Split, ExampleInput]], split_names: Iterable[splits_lib.Split]
+) -> Dict[splits_lib.Split, Iterable[ExampleInput]]:
+    """Turns one lazy stream of `(split_name, example_input)` pairs into the generators of the splits, for a
+    `_split_generators` that assigns examples to splits while it discovers them.
+
+    Nothing is read before generation starts. The pool then takes the examples of all splits in stream order,
+    so conversion overlaps with discovery, and a split that is rare or empty does not hold up the others.
+    Iterating one split on its own buffers the examples of the other splits it passes.
+    """
+    stream = _SplitStream(pairs)
+    return {split_name: _StreamedSplit(stream, split_name) for split_name in split_names}
+
+
+def partition_data_dir(data_dir: str, index: int, num_partitions: int) -> str:
+    """Data dir the given partition is built into before the partitions are merged into `data_dir`."""
+    return os.path.join(data_dir, "partitions", f"{index}-of-{num_partitions}")
+
 
 class MultiThreadedSplitBuilder(split_builder_lib.SplitBuilder):
     """Multithreaded version of tfds.core.SplitBuilder. Removes Apache Beam support, only supporting Python generators."""
@@ -32,6 +149,39 @@ class MultiThreadedSplitBuilder(split_builder_lib.SplitBuilder):
         process_fn: Callable[[ExampleInput], Example],
         num_workers: int,
         chunksize: int,
+        streaming: bool = False,
+        max_inflight: Optional[int] = None,
+        max_inflight_bytes: Optional[int] = None,
+        worker_shards: Optional[int] = None,
+        key_fn: Optional[Callable[[ExampleInput], Key]] = None,
+        checkpoint_dir: Optional[str] = None,
+        stamp_fn: Optional[Callable[[ExampleInput], str]] = None,
+        checkpoint_interval: int = 100,
+        shared_memory: bool = False,
+        example_timeout: Optional[float] = None,
+        max_retries: int = 0,
+        quarantine_path: Optional[str] = None,
+        autotune: bool = False,
+        direct_shards: Optional[int] = None,
+        start_method: Optional[str] = None,
+        preload_modules: Iterable[str] = (),
+        write_queue_size: int = 16,
+        profile_dir: Optional[str] = None,
+        profile_interval: float = 0.01,
+        profile_every: int = 20,
+        track_memory: bool = False,
+        memory_fn: Optional[Callable[[ExampleInput], Optional[int]]] = None,
+        memory_ceiling: Optional[int] = None,
+        large_example_concurrency: int = 1,
+        worker_max_examples: Optional[int] = None,
+        worker_max_rss: Optional[int] = None,
+        longest_first: bool = False,
+        cost_fn: Optional[Callable[[ExampleInput], float]] = None,
+        worker_threads: Optional[int] = None,
+        files_fn: Optional[Callable[[ExampleInput], Optional[List[str]]]] = None,
+        known_files_fn: Optional[Callable[[ExampleInput], Optional[List[str]]]] = None,
+        readahead_threads: int = 0,
+        readahead_per_mount: Optional[int] = None,
         *args,
         **kwargs,
     ):
@@ -39,93 +189,2006 @@ class MultiThreadedSplitBuilder(split_builder_lib.SplitBuilder):
         self._process_fn = process_fn
         self.num_workers = num_workers
         self.chunksize = chunksize
+        self.streaming = streaming
+        self.max_inflight = max_inflight or 2 * num_workers
+        self.max_inflight_bytes = max_inflight_bytes
+        self.worker_shards = worker_shards
+        self._key_fn = key_fn
+        self.checkpoint_dir = checkpoint_dir
+        self._stamp_fn = stamp_fn or (lambda example_input: "")
+        self.checkpoint_interval = checkpoint_interval
+        self.shared_memory = shared_memory
+        self.example_timeout = example_timeout
+        self.max_retries = max_retries
+        self.quarantine_path = quarantine_path
+        self.num_quarantined = 0
+        self.autotune = autotune
+        self.direct_shards = direct_shards
+        self.start_method = start_method
+        self.preload_modules = list(preload_modules)
+        self.write_queue_size = write_queue_size
+        self.profile_dir = profile_dir
+        self.profile_interval = profile_interval
+        self.profile_every = profile_every
+        self.track_memory = track_memory
+        # estimates are made in the parent and sent along with the examples, see `_with_estimates`
+        self._memory_fn = memory_fn if track_memory or memory_ceiling else None
+        self.memory_ceiling = memory_ceiling
+        self.large_example_concurrency = large_example_concurrency
+        self.worker_max_examples = worker_max_examples
+        self.worker_max_rss = worker_max_rss
+        self.longest_first = longest_first
+        self._cost_fn = cost_fn
+        self._cost_etas: Dict[splits_lib.Split, _CostEta] = {}
+        self.worker_threads = worker_threads
+        self._files_fn = files_fn if readahead_threads else None
+        self._known_files_fn = known_files_fn
+        self.readahead_threads = readahead_threads
+        self.readahead_per_mount = readahead_per_mount
+        self.written_shards = {}
+        self._shared_pool = None
+        self.stats = pipeline_stats.PipelineStats()
 
     def submit_split_generation(
         self,
         split_name: splits_lib.Split,
-        generator: Iterable[Tuple[Key, ExampleInput]],
+        generator: Iterable[ExampleInput],
         filename_template: naming.ShardedFileTemplate,
         disable_shuffling: bool = False,
-    ) -> splits_lib.SplitInfo:
-        if self._max_examples_per_split is not None:
+    ) -> Optional[splits_lib.SplitInfo]:
+        """Generates one split and returns its split info, or None if it has no examples."""
+        split_infos = self.submit_split_generations(
+            {split_name: generator}, {split_name: filename_template}, disable_shuffling
+        )
+        return split_infos[0] if split_infos else None
+
+    def submit_split_generations(
+        self,
+        generators: Dict[splits_lib.Split, Iterable[ExampleInput]],
+        filename_templates: Dict[splits_lib.Split, naming.ShardedFileTemplate],
+        disable_shuffling: bool = False,
+    ) -> List[splits_lib.SplitInfo]:
+        """Generates several splits at once in one pool, interleaving their examples, and returns their
+        split infos in the order of `generators`. Splits without examples are left out, no shards are written
+        for them.
+        """
+        if not generators:
+            return []
+        generators = dict(generators)
+        pbars = {}
+        costs = {}
+        for position, (split_name, generator) in enumerate(generators.items()):
+            if self._max_examples_per_split is not None:
+                logging.warning(
+                    "Splits capped at %s examples max.", self._max_examples_per_split
+                )
+                generators[split_name] = itertools.islice(
+                    generator, self._max_examples_per_split
+                )
+                total_num_examples = self._max_examples_per_split
+            else:
+                # If dataset info has been pre-downloaded from the internet,
+                # we can use the pre-computed number of example for the progression bar.
+                split_info = self._split_dict.get(split_name)
+                if split_info and split_info.num_examples:
+                    total_num_examples = split_info.num_examples
+                else:
+                    total_num_examples = None
+            if self.longest_first and not self.direct_shards:
+                generators[split_name], costs[split_name] = self._prescan_costs(
+                    split_name, generators[split_name], sort=not self.worker_shards
+                )
+                total_num_examples = len(generators[split_name])
+            pbars[split_name] = tqdm(
+                total=total_num_examples,
+                desc=f"Generating {split_name} examples...",
+                unit=" examples",
+                dynamic_ncols=True,
+                miniters=1,
+                position=position,
+            )
+        self._cost_etas = {
+            split_name: _CostEta(split_costs, pbars[split_name])
+            for split_name, split_costs in costs.items()
+        }
+        if self.longest_first and self.direct_shards:
             logging.warning(
-                "Splits capped at %s examples max.", self._max_examples_per_split
+                "Not scheduling longest examples first, direct shards are processed in hashed key order."
             )
-            generator = itertools.islice(generator, self._max_examples_per_split)
-            total_num_examples = self._max_examples_per_split
-        else:
-            # If dataset info has been pre-downloaded from the internet,
-            # we can use the pre-computed number of example for the progression bar.
-            split_info = self._split_dict.get(split_name)
-            if split_info and split_info.num_examples:
-                total_num_examples = split_info.num_examples
+
+        try:
+            with self._pool() as pool:
+                if self.worker_shards:
+                    logging.info(
+                        "Using %d workers writing %d shards per split.",
+                        self.num_workers,
+                        self.worker_shards,
+                    )
+                    written = self._write_worker_shards(
+                        pool, generators, filename_templates, disable_shuffling, pbars
+                    )
+                elif self.direct_shards:
+                    written = self._write_direct_shards(
+                        pool, generators, filename_templates, disable_shuffling, pbars
+                    )
+                else:
+                    written = self._write_to_shufflers(
+                        pool, generators, filename_templates, disable_shuffling, pbars
+                    )
+        finally:
+            if self.shared_memory:
+                _SharedBytes.unlink_all()
+        for pbar in pbars.values():
+            pbar.close()
+
+        return [
+            splits_lib.SplitInfo(
+                name=split_name,
+                shard_lengths=written[split_name][0],
+                num_bytes=written[split_name][1],
+                filename_template=filename_templates[split_name],
+            )
+            for split_name in generators
+            if split_name in written
+        ]
+
+    def _prescan_costs(
+        self,
+        split_name: splits_lib.Split,
+        generator: Iterable[ExampleInput],
+        sort: bool,
+    ) -> Tuple[List[ExampleInput], Dict[Key, float]]:
+        """Estimates the cost of every example of the split with `cost_fn`, using threads since this is
+        dominated by file system latency. Returns the examples, most expensive first if `sort` is set, and
+        their costs by key.
+        """
+        start = time.perf_counter()
+        example_inputs = list(generator)
+        with ThreadPoolExecutor(max_workers=4 * self.num_workers) as executor:
+            example_costs = list(executor.map(self._cost_fn, example_inputs))
+        self.stats.add("prescan", time.perf_counter() - start)
+        if sort:
+            order = sorted(range(len(example_inputs)), key=lambda i: -example_costs[i])
+            example_inputs = [example_inputs[i] for i in order]
+            example_costs = [example_costs[i] for i in order]
+        if example_costs:
+            logging.info(
+                "Estimated the cost of %d %s examples in %.1fs: total %.3g, median %.3g, max %.3g.",
+                len(example_costs),
+                split_name,
+                time.perf_counter() - start,
+                sum(example_costs),
+                sorted(example_costs)[len(example_costs) // 2],
+                max(example_costs),
+            )
+        return example_inputs, {
+            self._key_fn(x): cost for x, cost in zip(example_inputs, example_costs)
+        }
+
+    def _report_done(self, split_name: splits_lib.Split, keys: Iterable[Key]) -> None:
+        """Updates the cost-based ETA of the split, if its examples were pre-scanned."""
+        if split_name in self._cost_etas:
+            self._cost_etas[split_name].done(keys)
+
+    def submit_incremental_split_generation(
+        self,
+        split_name: splits_lib.Split,
+        example_inputs: List[ExampleInput],
+        fingerprints: Dict[Key, str],
+        filename_template: naming.ShardedFileTemplate,
+        old_filename_template: naming.ShardedFileTemplate,
+        shards: List[Dict[str, Any]],
+    ) -> Tuple[Optional[splits_lib.SplitInfo], List[Dict[str, Any]]]:
+        """Writes an update of a split previously written with worker shards that matches `example_inputs`.
+
+        `shards` describes the existing shards of the split at `old_filename_template` (their keys, source
+        fingerprints and sizes). Examples whose key is new or whose fingerprint changed are processed into
+        additional shards, and outdated copies of changed examples are dropped from the shards holding them.
+        All shards are then renumbered at `filename_template`, which must be in another directory, with the
+        unchanged ones hard-linked. The existing shards are left as they are. Returns the new split info, None
+        if the split has no examples, and shard descriptions.
+        """
+        known = {
+            key: fingerprint
+            for shard in shards
+            for key, fingerprint in zip(shard["keys"], shard["fingerprints"])
+        }
+        todo = [
+            x
+            for x in example_inputs
+            if known.get(self._key_fn(x)) != fingerprints[self._key_fn(x)]
+        ]
+        stale = {self._key_fn(x) for x in todo}.intersection(known)
+        logging.info(
+            "Adding %d new and %d changed examples to %s.",
+            len(todo) - len(stale),
+            len(stale),
+            split_name,
+        )
+        data_dir = os.fspath(filename_template.data_dir)
+        old_paths = [
+            os.fspath(old_filename_template.sharded_filepath(shard_index=i, num_shards=len(shards)))
+            for i in range(len(shards))
+        ]
+        staged = []  # (path, shard, whether the path is a temporary file of this update)
+        for i, (path, shard) in enumerate(zip(old_paths, shards)):
+            if stale.isdisjoint(shard["keys"]):
+                staged.append((path, shard, False))
+                continue
+            tmp_path = os.path.join(data_dir, f"{split_name}.incremental-old-{i:05d}")
+            shard = self._rewrite_shard(path, tmp_path, shard, stale)
+            if shard["keys"]:
+                staged.append((tmp_path, shard, True))
             else:
-                total_num_examples = None
+                _remove_shard(tmp_path)
+        if todo:
+            mean_length = len(known) / len(shards) if shards else self.chunksize
+            new_shards = self._assign_worker_shards(
+                split_name,
+                todo,
+                max(1, round(len(todo) / mean_length)),
+                disable_shuffling=False,
+            )
+            new_paths = [
+                os.path.join(data_dir, f"{split_name}.incremental-new-{i:05d}")
+                for i in range(len(new_shards))
+            ]
+            pbar = tqdm(
+                total=len(todo),
+                desc=f"Generating {split_name} examples...",
+                unit=" examples",
+                dynamic_ncols=True,
+                miniters=1,
+            )
+            with self._pool() as pool:
+                written = self._run_worker_shards(
+                    pool,
+                    new_shards,
+                    new_paths,
+                    [pbar] * len(new_shards),
+                    [split_name] * len(new_shards),
+                )
+            pbar.close()
+            for path, (keys, num_bytes) in zip(new_paths, written):
+                shard = {
+                    "keys": keys,
+                    "fingerprints": [fingerprints.get(key, "") for key in keys],
+                    "num_bytes": num_bytes,
+                }
+                staged.append((path, shard, True))
+        for i, (path, _, is_tmp) in enumerate(staged):
+            new_path = os.fspath(filename_template.sharded_filepath(shard_index=i, num_shards=len(staged)))
+            if is_tmp:
+                _move_shard(path, new_path)
+            else:
+                _link_shard(path, new_path)
+        shards = [shard for _, shard, _ in staged]
+        if not shards:
+            logging.info("No %s examples were generated, skipping the split.", split_name)
+            return None, shards
+        return (
+            splits_lib.SplitInfo(
+                name=split_name,
+                shard_lengths=[len(shard["keys"]) for shard in shards],
+                num_bytes=sum(shard["num_bytes"] for shard in shards),
+                filename_template=filename_template,
+            ),
+            shards,
+        )
 
-        serialized_info = self._features.get_serialized_info()
-        writer = writer_lib.Writer(
-            serializer=example_serializer.ExampleSerializer(serialized_info),
-            filename_template=filename_template,
-            hash_salt=split_name,
-            disable_shuffling=disable_shuffling,
-            file_format=self._file_format,
-            shard_config=self._shard_config,
-        )
-        pbar = tqdm(
-            total=total_num_examples,
-            desc=f"Generating {split_name} examples...",
-            unit=" examples",
-            dynamic_ncols=True,
-            miniters=1,
-        )
-        with mp.Pool(
+    def _rewrite_shard(
+        self, path: str, new_path: str, shard: Dict[str, Any], drop_keys: set
+    ) -> Dict[str, Any]:
+        """Copies the shard at `path` to `new_path` without the examples in `drop_keys` and returns the
+        description of the new shard.
+        """
+        adapter = file_adapters.ADAPTER_FOR_FORMAT[self._file_format]
+        new_shard = {"keys": [], "fingerprints": [], "num_bytes": 0}
+
+        def kept_examples():
+            records = _read_records(self._file_format, path)
+            for key, fingerprint, record in zip(
+                shard["keys"], shard["fingerprints"], records
+            ):
+                if key in drop_keys:
+                    continue
+                new_shard["keys"].append(key)
+                new_shard["fingerprints"].append(fingerprint)
+                new_shard["num_bytes"] += len(record)
+                yield key, record
+
+        record_keys = adapter.write_examples(new_path, kept_examples())
+        if record_keys:
+            writer_lib._write_index_file(
+                writer_lib._get_index_path(new_path), record_keys
+            )
+        return new_shard
+
+    @contextlib.contextmanager
+    def shared_pool(self) -> Iterator[Pool]:
+        """Keeps one worker pool open for all splits submitted within the context, so the workers only
+        start up once.
+        """
+        with self._pool() as pool:
+            self._shared_pool = pool
+            try:
+                yield pool
+            finally:
+                self._shared_pool = None
+
+    @contextlib.contextmanager
+    def _pool(self) -> Iterator[Pool]:
+        """Yields the pool of an enclosing `shared_pool`, or else a new pool that is terminated on exit.
+
+        Workers are started with `start_method`. With "forkserver", the fork server imports
+        `preload_modules` once and every worker is forked from it, sharing the imported modules
+        copy-on-write instead of importing TensorFlow again. Waits until all workers are initialized and
+        logs how long that took.
+
+        If `worker_max_examples` or `worker_max_rss` is set, workers exit between two tasks once they
+        processed that many examples or their RSS passed that many bytes, and the pool replaces them. A
+        replacement is forked like the original workers, so with "fork" or "forkserver" it does not import
+        TensorFlow again.
+
+        Workers limit the thread pools of TensorFlow, OpenCV and BLAS/OpenMP to `worker_threads` threads,
+        by default the available cores divided by the number of workers, so that the workers do not
+        oversubscribe the cores. 0 leaves them unlimited. Forked workers inherit the TensorFlow of the parent,
+        so with "fork" the limit only applies if it was also set in the parent before TensorFlow started, see
+        `MultiThreadedDatasetBuilder.download_and_prepare`.
+
+        If `readahead_threads` is set, every worker reads the files `files_fn` lists for its examples from
+        that many threads, see readahead.py. In streaming mode, workers also have the files `known_files_fn`
+        returns for the examples of other workers read into the page cache.
+
+        If `profile_dir` is set, the parent and the workers are profiled while the pool is open.
+        """
+        if self._shared_pool is not None:
+            yield self._shared_pool
+            return
+        context = mp.get_context(self.start_method)
+        if context.get_start_method() == "forkserver":
+            context.set_forkserver_preload(self.preload_modules)
+        recycling = bool(self.worker_max_examples or self.worker_max_rss)
+        worker_threads = _worker_threads(self.worker_threads, self.num_workers)
+        events = context.Queue()  # workers report when they started and why they exit early
+        start = time.perf_counter()
+        with (_RecyclingPool if recycling else Pool)(
             self.num_workers,
             initializer=MultiThreadedSplitBuilder._worker_init,
-            initargs=(self._process_fn, self._features),
+            initargs=(
+                self._process_fn,
+                self._features,
+                # not `os.getppid()` in the workers, which is the fork server's with "forkserver"
+                os.getpid() if self.shared_memory else None,
+                self._key_fn,
+                self.example_timeout,
+                self.max_retries,
+                self.quarantine_path is not None,
+                self.profile_dir,
+                self.profile_interval,
+                self.profile_every,
+                self.track_memory,
+                self.worker_max_examples,
+                self.worker_max_rss,
+                worker_threads,
+                self._files_fn,
+                self.readahead_threads,
+                self.readahead_per_mount,
+                events,
+            ),
+            context=context,
         ) as pool:
+            unlimited = set()
+            try:
+                for _ in range(self.num_workers):
+                    _, _, worker_unlimited = events.get(timeout=WORKER_STARTUP_TIMEOUT)
+                    unlimited.update(worker_unlimited)
+            except queue.Empty:
+                raise RuntimeError(
+                    f"Workers did not start within {WORKER_STARTUP_TIMEOUT}s, check that the builder "
+                    f"module can be imported with the {context.get_start_method()} start method."
+                ) from None
+            startup_seconds = time.perf_counter() - start
+            self.stats.add("pool_startup", startup_seconds)
             logging.info(
-                "Using %d workers with chunksize %d.", self.num_workers, self.chunksize
+                "Started %d workers with %s in %.2fs.",
+                self.num_workers,
+                context.get_start_method(),
+                startup_seconds,
             )
-            while True:
-                curr = pbar.n
-                iterator = itertools.islice(generator, self.chunksize)
-                results = pool.map(MultiThreadedSplitBuilder._worker_fn, iterator)
-                for key, example in results:
-                    writer._shuffler.add(key, example)
-                    writer._num_examples += 1
-                    pbar.update(1)
-                if pbar.n == curr:
-                    break
-        shard_lengths, total_size = writer.finalize()
+            if worker_threads:
+                logging.info("Limited TensorFlow, OpenCV and BLAS to %d threads per worker.", worker_threads)
+            if unlimited:
+                logging.warning(
+                    "Could not limit the threads of the workers: %s.", "; ".join(sorted(unlimited))
+                )
+            with contextlib.ExitStack() as stack:
+                if recycling:
+                    stack.enter_context(_WorkerRecyclingLog(events))
+                if not self.profile_dir:
+                    yield pool
+                    return
+                profiling.start(self.profile_dir, "parent", self.profile_interval)
+                try:
+                    with profiling.sampled("parent"):
+                        yield pool
+                    # gives idle workers the time to write their last samples before they are terminated
+                    time.sleep(profiling.IDLE_FLUSH_INTERVAL + 2 * self.profile_interval)
+                finally:
+                    profiling.stop()
+
+    def _write_to_shufflers(
+        self,
+        pool: Pool,
+        generators: Dict[splits_lib.Split, Iterable[ExampleInput]],
+        filename_templates: Dict[splits_lib.Split, naming.ShardedFileTemplate],
+        disable_shuffling: bool,
+        pbars: Dict[splits_lib.Split, tqdm],
+    ) -> Dict[splits_lib.Split, Tuple[List[int], int]]:
+        """Processes the examples of all splits in the pool, interleaved, and adds them to the shuffler of
+        the writer of their split in the parent. Returns the shard lengths and size of every split with
+        examples, the writer of a split is only started by its first example.
+
+        The results are handed to a `_WriteThread`, so collecting results overlaps with the shuffler and
+        checkpoint I/O. A split is finalized in another background thread as soon as all its examples are
+        written, while the pool keeps working on the other splits.
+
+        If `checkpoint_dir` is set, every example is journaled, and the examples a previous, interrupted run
+        journaled are skipped in the generators and added back to the shuffler instead, if their input is
+        still in the split with the same stamp.
+        """
+        serialized_info = self._features.get_serialized_info()
+        writers = {}
+
+        def writer(split_name):
+            # started on the first example, the writers fail on empty splits
+            if split_name not in writers:
+                writers[split_name] = writer_lib.Writer(
+                    serializer=example_serializer.ExampleSerializer(serialized_info),
+                    filename_template=filename_templates[split_name],
+                    hash_salt=split_name,
+                    disable_shuffling=disable_shuffling,
+                    file_format=self._file_format,
+                    shard_config=self._shard_config,
+                )
+            return writers[split_name]
+
+        checkpoints = {}
+        resumed_keys = {split_name: set() for split_name in generators}
+        stamps = {split_name: {} for split_name in generators}
+        replays = collections.deque()  # (split_name, key) of checkpointed examples to add to the shuffler
+
+        def resume(split_name, example_input):
+            # runs while the inputs are taken, so only the checkpointed examples of current inputs are reused
+            key = self._key_fn(example_input)
+            stamp = self._stamp_fn(example_input)
+            if key not in resumed_keys[split_name] and checkpoints[split_name].matches(key, stamp):
+                resumed_keys[split_name].add(key)
+                replays.append((split_name, key))
+                if split_name in self._cost_etas:
+                    self._cost_etas[split_name].skip([key])
+                return False
+            stamps[split_name][key] = stamp
+            return True
+
+        num_checkpointed = {}
+        if self.checkpoint_dir:
+            generators = dict(generators)
+            for split_name in generators:
+                checkpoint = _SplitCheckpoint(
+                    os.path.join(self.checkpoint_dir, split_name), self.checkpoint_interval
+                )
+                if len(checkpoint):
+                    logging.info(
+                        "Resuming %s from a checkpoint of %d examples, reusing those of unchanged inputs.",
+                        split_name,
+                        len(checkpoint),
+                    )
+                checkpoints[split_name] = checkpoint
+                num_checkpointed[split_name] = len(checkpoint)
+                generators[split_name] = _filter_inputs(
+                    generators[split_name], functools.partial(resume, split_name)
+                )
+
+        interleaved = _SplitInterleaver(generators)
+        if self.autotune:
+            logging.info(
+                "Using up to %d workers, tuning the number of examples in flight.",
+                self.num_workers,
+            )
+            results = self._imap_streaming(pool, interleaved)
+        elif self.streaming or self.max_inflight_bytes or self.memory_ceiling:
+            logging.info(
+                "Using %d workers with at most %d examples and %s bytes in flight.",
+                self.num_workers,
+                self.max_inflight,
+                self.max_inflight_bytes or "unlimited",
+            )
+            results = self._imap_streaming(pool, interleaved)
+        else:
+            logging.info(
+                "Using %d workers with chunksize %d.",
+                self.num_workers,
+                self.chunksize,
+            )
+            results = self._imap_chunked(pool, interleaved)
+
+        def write(split_name, key, example):
+            if isinstance(example, _SharedBytes):
+                example = example.take()
+            if split_name in checkpoints:
+                with self.stats.time("checkpoint"):
+                    checkpoints[split_name].add(key, stamps[split_name].pop(key, ""), example)
+            with self.stats.time("shuffle"):
+                writer(split_name)._shuffler.add(key, example)
+            writers[split_name]._num_examples += 1
+            pbars[split_name].update(1)
+
+        def replay(split_name, key):
+            with self.stats.time("checkpoint"):
+                example = checkpoints[split_name].read(key)
+            with self.stats.time("shuffle"):
+                writer(split_name)._shuffler.add(key, example)
+            writers[split_name]._num_examples += 1
+            pbars[split_name].update(1)
+
+        finalized = {}
+        with ThreadPoolExecutor(max_workers=len(generators)) as finalizer:
+
+            def finalize(split_name):
+                peak_rss.log(split_name)
+                if split_name in checkpoints:
+                    checkpoints[split_name].commit()
+                if split_name not in writers:
+                    logging.info("No %s examples were generated, skipping the split.", split_name)
+                    finalized[split_name] = None
+                    return
+                finalized[split_name] = finalizer.submit(
+                    _timed_call, writers[split_name].finalize
+                )
+
+            peak_rss = _PeakRss(generators)
+            with _WriteThread(self.write_queue_size, self.stats) as write_thread:
+                wait_start = time.perf_counter()
+                for split_name, (key, example, sample) in results:
+                    self.stats.add("parent_wait", time.perf_counter() - wait_start)
+                    while replays:
+                        write_thread.submit(replay, *replays.popleft())
+                    self.stats.add_sample(sample)
+                    self._report_done(split_name, [key])
+                    if isinstance(example, _ExampleFailure):
+                        stamps[split_name].pop(key, None)
+                        self._quarantine(split_name, example)
+                    elif key in resumed_keys[split_name]:
+                        if isinstance(example, _SharedBytes):
+                            example.take()
+                        logging.log_first_n(
+                            logging.WARNING,
+                            "Example %s was already checkpointed, `_example_key` does not match the key "
+                            "returned by `_process_example`.",
+                            1,
+                            key,
+                        )
+                    else:
+                        write_thread.submit(write, split_name, key, example)
+                    peak_rss.sample()
+                    if interleaved.task_done(split_name):
+                        # the last inputs of the split may have been resumed since the replays were submitted
+                        while replays:
+                            write_thread.submit(replay, *replays.popleft())
+                        write_thread.submit(finalize, split_name)
+                    wait_start = time.perf_counter()
+                while replays:
+                    write_thread.submit(replay, *replays.popleft())
+            for split_name, num_examples in num_checkpointed.items():
+                if num_examples:
+                    logging.info(
+                        "Reused %d of %d checkpointed %s examples.",
+                        len(resumed_keys[split_name]),
+                        num_examples,
+                        split_name,
+                    )
+            for split_name in generators:
+                if split_name not in finalized:
+                    finalize(split_name)
+            written = {}
+            for split_name in writers:
+                written[split_name], seconds = finalized[split_name].result()
+                self.stats.add("finalize", seconds)
+            return written
+
+    def _write_direct_shards(
+        self,
+        pool: Pool,
+        generators: Dict[splits_lib.Split, Iterable[ExampleInput]],
+        filename_templates: Dict[splits_lib.Split, naming.ShardedFileTemplate],
+        disable_shuffling: bool,
+        pbars: Dict[splits_lib.Split, tqdm],
+    ) -> Dict[splits_lib.Split, Tuple[List[int], int]]:
+        """Writes the examples of all splits from the parent straight into `direct_shards` shard files per
+        split, without going through the shuffler and its temporary files. Returns the shard lengths and
+        size of every split with examples.
+
+        Every example goes to the shard given by its hashed key, and the examples are processed in hashed
+        key order and written in that order, so the shards do not depend on the order of the generators. If
+        `disable_shuffling` is set, the shards are contiguous slices of the generator order instead.
+        """
+        writers = {}
+        ordered_inputs = {}
+        for split_name, generator in generators.items():
+            example_inputs = list(generator)
+            if not example_inputs:
+                logging.info("No %s examples were generated, skipping the split.", split_name)
+                continue
+            order, shard_ids = shard_assignment(
+                [self._key_fn(x) for x in example_inputs],
+                min(self.direct_shards, len(example_inputs)),
+                split_name,
+                disable_shuffling,
+            )
+            ordered_inputs[split_name] = [example_inputs[i] for i in order]
+            writers[split_name] = _DirectShardWriter(
+                filename_templates[split_name], self._file_format, shard_ids
+            )
+
+        interleaved = _SplitInterleaver(ordered_inputs)
+        if self.streaming or self.max_inflight_bytes or self.autotune or self.memory_ceiling:
+            logging.info(
+                "Using %d workers writing %d shards per split directly.",
+                self.num_workers,
+                self.direct_shards,
+            )
+            results = self._imap_streaming(pool, interleaved, ordered=True)
+        else:
+            logging.info(
+                "Using %d workers with chunksize %d writing %d shards per split directly.",
+                self.num_workers,
+                self.chunksize,
+                self.direct_shards,
+            )
+            results = self._imap_chunked(pool, interleaved)
+
+        def write(split_name, example):
+            if isinstance(example, _SharedBytes):
+                example = example.take()
+            with self.stats.time("write"):
+                writers[split_name].add(example)
+            pbars[split_name].update(1)
+
+        peak_rss = _PeakRss(writers)
+        with _WriteThread(self.write_queue_size, self.stats) as write_thread:
+            wait_start = time.perf_counter()
+            for split_name, (key, example, sample) in results:
+                self.stats.add("parent_wait", time.perf_counter() - wait_start)
+                self.stats.add_sample(sample)
+                if isinstance(example, _ExampleFailure):
+                    self._quarantine(split_name, example)
+                    write_thread.submit(writers[split_name].skip)
+                else:
+                    write_thread.submit(write, split_name, example)
+                peak_rss.sample()
+                if interleaved.task_done(split_name):
+                    write_thread.submit(peak_rss.log, split_name)
+                wait_start = time.perf_counter()
+        return {split_name: writer.finalize() for split_name, writer in writers.items()}
+
+    def _write_worker_shards(
+        self,
+        pool: Pool,
+        generators: Dict[splits_lib.Split, Iterable[ExampleInput]],
+        filename_templates: Dict[splits_lib.Split, naming.ShardedFileTemplate],
+        disable_shuffling: bool,
+        pbars: Dict[splits_lib.Split, tqdm],
+    ) -> Dict[splits_lib.Split, Tuple[List[int], int]]:
+        """Assigns every example to one of `worker_shards` shards of its split up front and lets each worker
+        process and write a whole shard, so serialized examples never pass through the parent process. The
+        shards of all splits are submitted to the pool together. Returns the shard lengths and size of every
+        split with examples.
+
+        The keys and sizes of the written shards are recorded in `self.written_shards[split_name]`.
+        """
+        shards, paths, shard_pbars, shard_split_names, split_slices = [], [], [], [], {}
+        for split_name, generator in generators.items():
+            split_shards = self._assign_worker_shards(
+                split_name, list(generator), self.worker_shards, disable_shuffling
+            )
+            if not split_shards:
+                logging.info("No %s examples were generated, skipping the split.", split_name)
+                continue
+            split_slices[split_name] = slice(len(shards), len(shards) + len(split_shards))
+            shards += split_shards
+            paths += [
+                os.fspath(
+                    filename_templates[split_name].sharded_filepath(
+                        shard_index=i, num_shards=len(split_shards)
+                    )
+                )
+                for i in range(len(split_shards))
+            ]
+            shard_pbars += [pbars[split_name]] * len(split_shards)
+            shard_split_names += [split_name] * len(split_shards)
+        written = self._run_worker_shards(
+            pool, shards, paths, shard_pbars, shard_split_names, longest_first=self.longest_first
+        )
+
+        results = {}
+        for split_name, split_slice in split_slices.items():
+            self.written_shards[split_name] = written[split_slice]
+            shard_lengths = [len(keys) for keys, _ in written[split_slice]]
+            logging.info(
+                "Done writing %s. Number of examples: %s (shards: %s)",
+                filename_templates[split_name].sharded_filepaths_pattern(),
+                sum(shard_lengths),
+                shard_lengths,
+            )
+            results[split_name] = (
+                shard_lengths,
+                sum(num_bytes for _, num_bytes in written[split_slice]),
+            )
+        return results
+
+    def _assign_worker_shards(
+        self,
+        split_name: splits_lib.Split,
+        example_inputs: List[ExampleInput],
+        num_shards: int,
+        disable_shuffling: bool,
+    ) -> List[List[ExampleInput]]:
+        """Splits `example_inputs` into at most `num_shards` non-empty shards.
+
+        Examples are assigned to shards by their hashed key and ordered by it within a shard. If
+        `disable_shuffling` is set, the shards are contiguous slices of `example_inputs` instead, which
+        keeps their order.
+        """
+        if not example_inputs:
+            return []
+        order, shard_ids = shard_assignment(
+            [self._key_fn(x) for x in example_inputs], num_shards, split_name, disable_shuffling
+        )
+        shards = [[] for _ in range(num_shards)]
+        for i, shard_id in zip(order, shard_ids):
+            shards[shard_id].append(example_inputs[i])
+        return [shard for shard in shards if shard]
 
-        return splits_lib.SplitInfo(
-            name=split_name,
-            shard_lengths=shard_lengths,
-            num_bytes=total_size,
-            filename_template=filename_template,
+    def _run_worker_shards(
+        self,
+        pool: Pool,
+        shards: List[List[ExampleInput]],
+        paths: List[str],
+        pbars: List[tqdm],
+        split_names: List[splits_lib.Split],
+        longest_first: bool = False,
+    ) -> List[Tuple[List[Key], int]]:
+        """Has the workers process and write each shard to the matching path, updating the matching progress
+        bar. Returns the keys and the number of bytes of every shard.
+
+        If `longest_first` is set, the shards with the highest pre-scanned cost are submitted first.
+        """
+        estimates = dict(
+            self._with_estimates(
+                ((i, j) for i, shard in enumerate(shards) for j in range(len(shard))),
+                lambda position: shards[position[0]][position[1]],
+            )
         )
+        tasks = [
+            (i, path, self._file_format, shard, [estimates[i, j] for j in range(len(shard))])
+            for i, (path, shard) in enumerate(zip(paths, shards))
+        ]
+        if longest_first:
+            tasks.sort(key=lambda task: -self._shard_cost(split_names[task[0]], task[3]))
+        written = [None] * len(shards)
+        peak_rss = _PeakRss(split_names)
+        num_unwritten = collections.Counter(split_names)
+        for shard_index, keys, num_bytes, stats, failures in pool.imap_unordered(
+            MultiThreadedSplitBuilder._shard_worker_fn, tasks
+        ):
+            written[shard_index] = (keys, num_bytes)
+            peak_rss.sample()
+            num_unwritten[split_names[shard_index]] -= 1
+            if not num_unwritten[split_names[shard_index]]:
+                peak_rss.log(split_names[shard_index])
+            self.stats.merge(stats)
+            for failure in failures:
+                self._quarantine(split_names[shard_index], failure)
+            pbars[shard_index].update(len(keys))
+            self._report_done(
+                split_names[shard_index], keys + [failure.key for failure in failures]
+            )
+        return written
+
+    def _shard_cost(self, split_name: splits_lib.Split, shard: List[ExampleInput]) -> float:
+        eta = self._cost_etas.get(split_name)
+        return sum(eta.costs.get(self._key_fn(x), 0.0) for x in shard) if eta else 0.0
+
+    def _quarantine(self, split_name: splits_lib.Split, failure: "_ExampleFailure") -> None:
+        """Records an example that could not be processed in the quarantine file."""
+        self.num_quarantined += 1
+        logging.warning(
+            "Quarantined %s example %s after %d attempts: %s",
+            split_name,
+            failure.key,
+            failure.attempts,
+            failure.error,
+        )
+        with open(self.quarantine_path, "a") as f:
+            f.write(json.dumps({"split": split_name, **failure._asdict()}) + "\n")
+
+    def _imap_chunked(
+        self, pool: Pool, tagged_inputs: Iterable[Tuple[Any, ExampleInput]]
+    ) -> Iterator[Tuple[Any, Tuple[Key, bytes]]]:
+        """Processes `chunksize` examples at a time, waiting for the whole chunk before yielding it. Inputs
+        are `(tag, example_input)` pairs and every result is yielded together with the tag of its input.
+        """
+        estimated_inputs = self._with_estimates(tagged_inputs, lambda tagged_input: tagged_input[1])
+        while True:
+            chunk = list(itertools.islice(estimated_inputs, self.chunksize))
+            if not chunk:
+                break
+            inputs = [x for (_, x), _ in chunk]
+            # consecutive inputs of a chunk mostly go to the same worker
+            upcoming = inputs[1:] + [None] if self._files_fn is not None else [None] * len(inputs)
+            results = pool.starmap(
+                MultiThreadedSplitBuilder._worker_fn,
+                [
+                    (example_input, upcoming_input, (), estimate)
+                    for example_input, upcoming_input, (_, estimate) in zip(inputs, upcoming, chunk)
+                ],
+            )
+            yield from zip([tag for (tag, _), _ in chunk], results)
+
+    def _imap_streaming(
+        self,
+        pool: Pool,
+        tagged_inputs: Iterable[Tuple[Any, ExampleInput]],
+        ordered: bool = False,
+    ) -> Iterator[Tuple[Any, Tuple[Key, bytes]]]:
+        """Keeps up to `max_inflight` examples submitted to the pool and yields each result as soon as it
+        arrives, in completion order. Inputs are `(tag, example_input)` pairs and every result is yielded
+        together with the tag of its input.
+
+        If `ordered` is set, results are yielded in input order instead. Results that arrive early wait for
+        the ones before them and still count as in flight, so the memory used stays bounded.
+
+        If `max_inflight_bytes` is set, submission is additionally throttled so that the estimated size of
+        all in-flight serialized examples (based on the mean size of the ones seen so far) stays within the
+        budget. Until the first result arrives, at most `num_workers` examples are submitted.
+
+        If `autotune` is set, an `InflightAutotuner` adjusts the number of examples in flight instead.
+
+        If `memory_ceiling` is set, examples whose estimated memory exceeds it are large examples, of which at
+        most `large_example_concurrency` are processed at once. Further large examples wait while the pool
+        keeps working on the others, so several of them cannot exhaust the memory together. With `ordered`, a
+        waiting large example is submitted regardless of the other limits as soon as it is the next to yield.
+
+        If the workers read ahead, every example is submitted together with the files `known_files_fn`
+        returns for the input `num_workers` places after it, which is about the example a worker takes once
+        it is done with this one. The worker has them read into the page cache in the meantime.
+        """
+        if self._files_fn is not None:
+            tagged_inputs = _with_upcoming(tagged_inputs, self.num_workers)
+        else:
+            tagged_inputs = ((tag, example_input, None) for tag, example_input in tagged_inputs)
+        estimated_inputs = self._with_estimates(tagged_inputs, lambda tagged_input: tagged_input[1])
+        autotuner = InflightAutotuner(self.num_workers) if self.autotune else None
+        max_inflight = self.max_inflight
+        done = queue.Queue()
+        ready = {}
+        deferred = collections.deque()  # large examples waiting for the large-example lane
+        large = set()  # indices of the large examples in flight
+        inflight, num_taken, next_index = 0, 0, 0
+        num_done, bytes_done, peak_inflight_bytes = 0, 0, 0
+        num_large = 0
+        exhausted = False
+        while True:
+            if autotuner is not None:
+                max_inflight = autotuner.limit
+            while deferred or not exhausted:
+                lane_free = len(large) < self.large_example_concurrency
+                # results waiting for a held back example count as in flight, so it is submitted whatever
+                # the limits once it is the next to yield, or nothing might be left to wait for
+                overdue = ordered and lane_free and deferred and deferred[0][0] == next_index
+                if not overdue:
+                    if inflight >= max_inflight:
+                        break
+                    if self.max_inflight_bytes and inflight > 0:
+                        if num_done == 0:
+                            if inflight >= self.num_workers:
+                                break
+                        elif (inflight + 1) * bytes_done / num_done > self.max_inflight_bytes:
+                            break
+                if deferred and lane_free:
+                    index, tag, example_input, upcoming, estimate = deferred.popleft()
+                    is_large = True
+                elif exhausted:
+                    break
+                else:
+                    try:
+                        (tag, example_input, upcoming), estimate = next(estimated_inputs)
+                    except StopIteration:
+                        exhausted = True
+                        continue
+                    index = num_taken
+                    num_taken += 1
+                    is_large = self._is_large_example(estimate)
+                    num_large += is_large
+                    if is_large and not lane_free:
+                        deferred.append((index, tag, example_input, upcoming, estimate))
+                        continue
+                advised = ()
+                if upcoming is not None and self._known_files_fn is not None:
+                    advised = self._known_files_fn(upcoming) or ()
+                pool.apply_async(
+                    MultiThreadedSplitBuilder._worker_fn,
+                    (example_input, None, advised, estimate),
+                    callback=lambda result, index=index, tag=tag: done.put((index, (tag, result))),
+                    error_callback=done.put,
+                )
+                inflight += 1
+                if is_large:
+                    large.add(index)
+            if inflight == 0:
+                break
+            if num_done:
+                peak_inflight_bytes = max(
+                    peak_inflight_bytes, inflight * bytes_done // num_done
+                )
+            result = done.get()
+            if isinstance(result, BaseException):
+                raise result
+            index, (tag, result) = result
+            ready[index] = (tag, result)
+            large.discard(index)
+            if not isinstance(result[1], _ExampleFailure):
+                num_done += 1
+                bytes_done += len(result[1])
+            if autotuner is not None:
+                autotuner.observe([p.pid for p in pool._pool], done.qsize())
+            if not ordered:
+                inflight -= 1
+                yield ready.pop(index)
+                continue
+            while next_index in ready:
+                inflight -= 1
+                yield ready.pop(next_index)
+                next_index += 1
+        if autotuner is not None:
+            autotuner.log_summary()
+        if self.max_inflight_bytes:
+            logging.info(
+                "Peak estimated in-flight serialized bytes: %.1f MiB (budget %.1f MiB).",
+                peak_inflight_bytes / 2**20,
+                self.max_inflight_bytes / 2**20,
+            )
+        if self.memory_ceiling:
+            logging.info(
+                "Processed %d examples above the memory ceiling of %.1f MiB at most %d at a time.",
+                num_large,
+                self.memory_ceiling / 2**20,
+                self.large_example_concurrency,
+            )
+
+    def _is_large_example(self, estimate: Optional[int]) -> bool:
+        return bool(self.memory_ceiling) and estimate is not None and estimate > self.memory_ceiling
+
+    def _with_estimates(
+        self, items: Iterable[Any], input_fn: Callable[[Any], ExampleInput]
+    ) -> Iterator[Tuple[Any, Optional[int]]]:
+        """Pairs every item with the memory estimate of its example input `input_fn(item)`, or None if
+        neither `track_memory` nor `memory_ceiling` is set.
+
+        The estimates are made by a few threads ahead of the caller, since the default estimate lists the
+        files of the example. The worker records the estimate next to the measured peak, so the memory report
+        shows the very numbers `memory_ceiling` is compared to.
+        """
+        if self._memory_fn is None:
+            return ((item, None) for item in items)
+        memory_fn = self._memory_fn
+        return _with_estimates(items, lambda item: memory_fn(input_fn(item)), 4 * self.num_workers)
 
     @staticmethod
     def _worker_init(
         process_fn: Callable[[ExampleInput], Example],
         features: tfds.features.FeaturesDict,
+        shared_memory_owner: Optional[int] = None,
+        key_fn: Optional[Callable[[ExampleInput], Key]] = None,
+        timeout: Optional[float] = None,
+        max_retries: int = 0,
+        quarantine: bool = False,
+        profile_dir: Optional[str] = None,
+        profile_interval: float = 0.01,
+        profile_every: int = 0,
+        track_memory: bool = False,
+        max_examples: Optional[int] = None,
+        max_rss: Optional[int] = None,
+        num_threads: int = 0,
+        files_fn: Optional[Callable[[ExampleInput], Optional[List[str]]]] = None,
+        readahead_threads: int = 0,
+        readahead_per_mount: Optional[int] = None,
+        events=None,
     ):
         global __process_fn
         global __features
         global __serializer
+        global __shared_memory_owner
+        global __key_fn
+        global __timeout
+        global __max_retries
+        global __quarantine
+        global __track_memory
+        global __max_examples
+        global __max_rss
+        global __events
+        global __num_examples
+        global __readahead
         __process_fn = process_fn
         __features = features
+        __shared_memory_owner = shared_memory_owner
+        __key_fn = key_fn
+        __timeout = timeout
+        __max_retries = max_retries
+        __quarantine = quarantine
+        __track_memory = track_memory
+        __max_examples = max_examples
+        __max_rss = max_rss
+        __events = events
+        __num_examples = 0
+        __readahead = files_fn is not None
         __serializer = example_serializer.ExampleSerializer(
             features.get_serialized_info()
         )
+        if profile_dir:
+            profiling.start(profile_dir, f"worker-{os.getpid()}", profile_interval, profile_every)
+        else:
+            profiling.reset()
+        if __readahead:
+            # a thread waiting for a slot held by a hung read leaves the file to the worker, which times out
+            readahead.configure(files_fn, readahead_threads, readahead_per_mount, timeout)
+        else:
+            readahead.reset()
+        unlimited = _limit_threads(num_threads) if num_threads else []
+        if events is not None:
+            events.put(("started", os.getpid(), unlimited))
+
+    @staticmethod
+    def _worker_fn(example_input, upcoming=None, advised=(), estimated_bytes=None):
+        global __shared_memory_owner
+        key, serialized, sample = MultiThreadedSplitBuilder._guarded_serialize_example(
+            example_input, upcoming, advised, estimated_bytes
+        )
+        if __shared_memory_owner and not isinstance(serialized, _ExampleFailure):
+            serialized = _SharedBytes.put(serialized, __shared_memory_owner)
+        return key, serialized, sample
 
     @staticmethod
-    def _worker_fn(example_input):
+    def _guarded_serialize_example(example_input, upcoming=None, advised=(), estimated_bytes=None):
+        """Same as `_serialize_example`, but aborts attempts that exceed the timeout and retries failed ones.
+        If the example still fails and quarantining is enabled, an `_ExampleFailure` takes the place of the
+        serialized example, otherwise the last error is raised.
+        """
+        global __key_fn
+        global __timeout
+        global __max_retries
+        global __quarantine
+        global __num_examples
+        __num_examples += 1
+        for attempt in range(1, __max_retries + 2):
+            try:
+                with _deadline(__timeout), profiling.example("worker"):
+                    return MultiThreadedSplitBuilder._serialize_example(
+                        example_input, upcoming, advised, estimated_bytes
+                    )
+            except Exception as e:
+                error = e
+                formatted_traceback = traceback.format_exc()
+                if isinstance(e, ExampleTimeoutError):
+                    # reads of a hung mount queued for the example would hold the readahead threads
+                    readahead.abandon()
+        if not __quarantine:
+            raise error
+        try:
+            key = __key_fn(example_input)
+        except Exception:
+            key = repr(example_input)
+        failure = _ExampleFailure(key, attempt, repr(error), formatted_traceback)
+        return key, failure, pipeline_stats.take_sample()
+
+    @staticmethod
+    def _recycle_reason() -> Optional[Tuple[str, str]]:
+        """Called by `_recycling_worker` between two tasks. Returns the limit this worker reached and details,
+        if it should exit.
+        """
+        global __max_examples
+        global __max_rss
+        global __num_examples
+        if __max_examples and __num_examples >= __max_examples:
+            return "example limit", f"processed {__num_examples} examples"
+        if __max_rss:
+            rss = psutil.Process().memory_info().rss
+            if rss > __max_rss:
+                return "RSS limit", f"RSS is {rss / 2**20:.0f} MiB"
+        return None
+
+    @staticmethod
+    def _report_recycling(limit: str, details: str) -> None:
+        global __events
+        if __events is not None:
+            __events.put(("recycled", os.getpid(), limit, details))
+
+    @staticmethod
+    def _serialize_example(example_input, upcoming=None, advised=(), estimated_bytes=None):
+        """Processes, encodes and serializes an example. If the worker reads ahead, the files of the example
+        and then those of `upcoming` are read from the readahead threads, and the `advised` files of another
+        worker's example are read into the page cache, see readahead.py. If the worker tracks memory, the
+        peak is recorded together with `estimated_bytes`, the estimate of the parent.
+        """
         global __process_fn
         global __features
         global __serializer
-        key, example = __process_fn(example_input)
-        return key, __serializer.serialize_example(__features.encode_example(example))
+        global __track_memory
+        global __key_fn
+        global __readahead
+        pipeline_stats.take_sample()  # drops leftovers of a previous example that failed
+        with contextlib.ExitStack() as stack:
+            if __track_memory:
+                memory = stack.enter_context(pipeline_stats.PeakMemory())
+            if __readahead:
+                key_fn = __key_fn or repr
+                with pipeline_stats.stage("readahead"):
+                    readahead.start(
+                        (key_fn(example_input), example_input),
+                        None if upcoming is None else (key_fn(upcoming), upcoming),
+                        advised,
+                    )
+            with pipeline_stats.stage("process_example"):
+                key, example = __process_fn(example_input)
+            with pipeline_stats.stage("encode_example"):
+                encoded = __features.encode_example(example)
+            num_steps = _num_steps(example)
+            with pipeline_stats.stage("serialize_example"):
+                serialized = __serializer.serialize_example(encoded)
+        pipeline_stats.count_bytes("serialize_example", len(serialized))
+        if __track_memory:
+            pipeline_stats.record_memory(
+                pipeline_stats.ExampleMemory(
+                    str(key), memory.peak_bytes, len(serialized), num_steps, estimated_bytes
+                )
+            )
+        return key, serialized, pipeline_stats.take_sample()
+
+    @staticmethod
+    def _shard_worker_fn(task):
+        shard_index, path, file_format, example_inputs, estimates = task
+        keys = []
+        num_bytes = 0
+        stats = pipeline_stats.PipelineStats()
+        failures = []
+        processing_seconds = 0.0
+
+        def serialized_examples():
+            nonlocal num_bytes, processing_seconds
+            for i, example_input in enumerate(example_inputs):
+                start = time.perf_counter()
+                upcoming = example_inputs[i + 1] if i + 1 < len(example_inputs) else None
+                key, serialized, sample = MultiThreadedSplitBuilder._guarded_serialize_example(
+                    example_input, upcoming, estimated_bytes=estimates[i]
+                )
+                processing_seconds += time.perf_counter() - start
+                stats.add_sample(sample)
+                if isinstance(serialized, _ExampleFailure):
+                    failures.append(serialized)
+                    continue
+                keys.append(key)
+                num_bytes += len(serialized)
+                yield key, serialized
+
+        start = time.perf_counter()
+        adapter = file_adapters.ADAPTER_FOR_FORMAT[file_format]
+        record_keys = adapter.write_examples(path, serialized_examples())
+        if record_keys:
+            writer_lib._write_index_file(writer_lib._get_index_path(path), record_keys)
+        stats.add("write_shard", time.perf_counter() - start - processing_seconds, num_bytes)
+        return shard_index, keys, num_bytes, stats, failures
+
+
+class ExampleTimeoutError(TimeoutError):
+    """Raised in a worker when processing an example takes longer than `EXAMPLE_TIMEOUT`."""
+
+
+class _ExampleFailure(NamedTuple):
+    """Sent by a worker in place of the serialized example if the example could not be processed."""
+
+    key: Key
+    attempts: int
+    error: str
+    traceback: str
+
+
+@contextlib.contextmanager
+def _deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Raises `ExampleTimeoutError` in the block once `seconds` have passed. Uses SIGALRM, so it only works
+    in the main thread and cannot interrupt a single C call, e.g. an uninterruptible read of a hung mount,
+    before it returns.
+    """
+    if not seconds:
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise ExampleTimeoutError(f"Processing took longer than {seconds}s.")
+
+    previous_handler = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+class _SharedBytes:
+    """Handle to serialized bytes that a worker placed in a shared memory segment, sent to the parent instead
+    of the bytes themselves so they bypass pickling and the result pipe.
+
+    Segments are named after the PID of the builder process that takes them, which unlinks each one when
+    taking its bytes and removes the leftovers of failed builds with `unlink_all`.
+    """
+
+    __slots__ = ("name", "size")
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    @classmethod
+    def put(cls, data: bytes, owner_pid: int) -> "_SharedBytes":
+        segment = shared_memory.SharedMemory(
+            name=f"{cls._prefix(owner_pid)}{uuid.uuid4().hex}",
+            create=True,
+            size=max(len(data), 1),
+        )
+        segment.buf[: len(data)] = data
+        segment.close()
+        # the parent owns the segment from now on, so the tracker of this worker must not unlink it
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return cls(segment.name, len(data))
+
+    def take(self) -> bytes:
+        """Copies the bytes out of the segment and unlinks it."""
+        segment = shared_memory.SharedMemory(name=self.name)
+        try:
+            return bytes(segment.buf[: self.size])
+        finally:
+            segment.close()
+            segment.unlink()
+
+    @classmethod
+    def unlink_all(cls) -> None:
+        """Removes all segments still left for this process, e.g. of results that were never taken."""
+        for path in glob.glob(os.path.join("/dev/shm", f"{cls._prefix(os.getpid())}*")):
+            os.remove(path)
+
+    @staticmethod
+    def _prefix(owner_pid: int) -> str:
+        return f"rlds_{owner_pid}_"
+
+
+def _num_available_cores() -> int:
+    """Number of cores this process may run on, which is less than the machine's under a CPU affinity mask."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _worker_threads(worker_threads: Optional[int], num_workers: int) -> int:
+    """`worker_threads`, or by default the available cores divided by `num_workers`."""
+    if worker_threads is None:
+        return max(1, _num_available_cores() // num_workers)
+    return worker_threads
+
+
+def _limit_tensorflow_threads(num_threads: int) -> bool:
+    """Limits the thread pools of TensorFlow in this process to `num_threads`. Returns False if TensorFlow
+    already started with other limits, which cannot be changed anymore.
+    """
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(num_threads)
+    except RuntimeError:
+        return False
+    return True
+
+
+def _limit_threads(num_threads: int) -> List[str]:
+    """Limits the thread pools of TensorFlow, OpenCV and BLAS/OpenMP in this process to `num_threads`.
+    Returns the libraries that could not be limited and why.
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(num_threads)
+    unlimited = []
+    if not _limit_tensorflow_threads(num_threads):
+        unlimited.append(
+            "the parent used TensorFlow before forking them, use the forkserver or spawn start method"
+        )
+    cv2 = sys.modules.get("cv2")  # only if the builder uses it
+    if cv2 is not None:
+        cv2.setNumThreads(num_threads)
+    try:
+        import threadpoolctl
+    except ImportError:
+        # the environment variables only reach BLAS libraries that are not loaded yet
+        if "numpy" in sys.modules:
+            unlimited.append("BLAS needs threadpoolctl")
+    else:
+        threadpoolctl.threadpool_limits(num_threads)
+    return unlimited
+
+
+def _source_size(path: str) -> Tuple[int, int]:
+    """Total size and number of the files at or under `path`."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path), 1
+    num_bytes, num_files = 0, 0
+    for dirpath, _, filenames in os.walk(path):
+        num_bytes += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+        num_files += len(filenames)
+    return num_bytes, num_files
+
+
+def _num_steps(example: Example) -> int:
+    """Number of steps of an RLDS episode, given as a list of steps or as a dict of per-step lists."""
+    steps = example.get("steps", ()) if isinstance(example, dict) else ()
+    while isinstance(steps, dict):
+        steps = next(iter(steps.values()), ())
+    return len(steps) if hasattr(steps, "__len__") else 0
+
+
+def _timed_call(fn: Callable[[], Any]) -> Tuple[Any, float]:
+    """Returns the result of `fn()` and the seconds it took."""
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def _move_shard(path: str, new_path: str) -> None:
+    """Moves a shard together with its record index, if it has one."""
+    if path == new_path:
+        return
+    shutil.move(path, new_path)
+    index_path = writer_lib._get_index_path(path)
+    if os.path.exists(index_path):
+        shutil.move(index_path, writer_lib._get_index_path(new_path))
+
+
+def _link_shard(path: str, new_path: str) -> None:
+    """Hard-links a shard together with its record index, if it has one."""
+    _link_file(path, new_path)
+    index_path = writer_lib._get_index_path(path)
+    if os.path.exists(index_path):
+        _link_file(index_path, writer_lib._get_index_path(new_path))
+
+
+def _link_file(path: str, new_path: str) -> None:
+    """Hard-links a file, copying it on file systems without hard links."""
+    try:
+        os.link(path, new_path)
+    except OSError:
+        shutil.copy2(path, new_path)
+
+
+def _replace_dir(new_path: str, path: str) -> None:
+    """Replaces the directory at `path` with the one at `new_path`. If this is interrupted between the two
+    renames, `_finish_replace_dir` completes it.
+    """
+    replaced_path = f"{path}{REPLACED_DIR_SUFFIX}"
+    os.rename(path, replaced_path)
+    os.rename(new_path, path)
+    shutil.rmtree(replaced_path)
+
+
+def _finish_replace_dir(new_path: str, path: str) -> None:
+    """Completes a `_replace_dir(new_path, path)` that was interrupted."""
+    replaced_path = f"{path}{REPLACED_DIR_SUFFIX}"
+    if not os.path.exists(replaced_path):
+        return
+    if not os.path.exists(path):
+        os.rename(new_path, path)
+    shutil.rmtree(replaced_path)
+
+
+def _remove_shard(path: str) -> None:
+    """Deletes a shard together with its record index, if it has one."""
+    os.remove(path)
+    index_path = writer_lib._get_index_path(path)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+
+class _DirectShardWriter:
+    """Writes the examples of one split straight into their shard files.
+
+    `shard_ids[i]` is the shard of the i-th example, and examples must be added (or skipped) in that order.
+    The file of a shard is opened with its first example and closed after its last one. Shards are written
+    to temporary names and renamed in `finalize`, once it is known which of them are non-empty.
+    """
+
+    def __init__(
+        self,
+        filename_template: naming.ShardedFileTemplate,
+        file_format: file_adapters.FileFormat,
+        shard_ids: List[int],
+    ):
+        self._filename_template = filename_template
+        self._file_format = file_format
+        self._shard_ids = shard_ids
+        self._num_shards = max(shard_ids) + 1
+        self._remaining = collections.Counter(shard_ids)
+        self._writers = {}
+        self._position = 0
+        self.shard_lengths = [0] * self._num_shards
+        self.num_bytes = 0
+
+    def add(self, serialized_example: bytes) -> None:
+        shard_id = self._shard_ids[self._position]
+        if shard_id not in self._writers:
+            self._writers[shard_id] = _open_record_writer(
+                self._file_format, self._tmp_path(shard_id)
+            )
+        self._writers[shard_id].write(serialized_example)
+        self.shard_lengths[shard_id] += 1
+        self.num_bytes += len(serialized_example)
+        self._advance()
+
+    def skip(self) -> None:
+        """Moves past an example that could not be processed."""
+        self._advance()
+
+    def finalize(self) -> Tuple[List[int], int]:
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        shard_ids = [i for i, length in enumerate(self.shard_lengths) if length]
+        for new_id, shard_id in enumerate(shard_ids):
+            _move_shard(
+                self._tmp_path(shard_id),
+                os.fspath(
+                    self._filename_template.sharded_filepath(
+                        shard_index=new_id, num_shards=len(shard_ids)
+                    )
+                ),
+            )
+        shard_lengths = [self.shard_lengths[i] for i in shard_ids]
+        logging.info(
+            "Done writing %s. Number of examples: %s (shards: %s)",
+            self._filename_template.sharded_filepaths_pattern(),
+            sum(shard_lengths),
+            shard_lengths,
+        )
+        return shard_lengths, self.num_bytes
+
+    def _advance(self) -> None:
+        shard_id = self._shard_ids[self._position]
+        self._position += 1
+        self._remaining[shard_id] -= 1
+        if not self._remaining[shard_id] and shard_id in self._writers:
+            self._writers.pop(shard_id).close()
+
+    def _tmp_path(self, shard_id: int) -> str:
+        return os.path.join(
+            os.fspath(self._filename_template.data_dir),
+            f"{self._filename_template.split}.direct-{shard_id:05d}",
+        )
+
+
+def _read_records(file_format: file_adapters.FileFormat, path: str) -> Iterator[bytes]:
+    """Yields the serialized examples of a shard in order."""
+    if file_format == file_adapters.FileFormat.ARRAY_RECORD:
+        # TFDS only reads ArrayRecord through `as_data_source`, not `make_tf_data`
+        from array_record.python import array_record_module
+
+        reader = array_record_module.ArrayRecordReader(path)
+        try:
+            for _ in range(reader.num_records()):
+                yield reader.read()
+        finally:
+            reader.close()
+    else:
+        adapter = file_adapters.ADAPTER_FOR_FORMAT[file_format]
+        yield from adapter.make_tf_data(path).as_numpy_iterator()
+
+
+def _open_record_writer(file_format: file_adapters.FileFormat, path: str):
+    """Opens a writer that takes one serialized example at a time, unlike `FileAdapter.write_examples`."""
+    if file_format == file_adapters.FileFormat.TFRECORD:
+        return tf.io.TFRecordWriter(path)
+    if file_format == file_adapters.FileFormat.ARRAY_RECORD:
+        from array_record.python import array_record_module
+
+        return array_record_module.ArrayRecordWriter(path, "group_size:1")
+    raise ValueError(f"Writing shards directly is not supported for {file_format}.")
+
+
+class _SplitInterleaver:
+    """Round-robin over the example inputs of several splits, yielding `(split_name, example_input)` pairs.
+
+    Keeps count of the yielded examples that are not done yet, so callers know when a split is complete. The
+    count may be taken from another thread than the one iterating, see `_with_estimates`.
+    """
+
+    def __init__(self, generators: Dict[splits_lib.Split, Iterable[ExampleInput]]):
+        streams = {getattr(generator, "stream", None) for generator in generators.values()}
+        # splits of one `stream_splits` are taken in stream order rather than round-robin
+        self._stream = streams.pop() if len(streams) == 1 else None
+        self._generators = generators
+        self._iterators = {name: iter(generator) for name, generator in generators.items()}
+        self._pending = dict.fromkeys(generators, 0)
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> Iterator[Tuple[splits_lib.Split, ExampleInput]]:
+        if self._stream is not None:
+            for split_name, example_input in self._stream.interleave(self._generators):
+                with self._lock:
+                    self._pending[split_name] += 1
+                yield split_name, example_input
+            with self._lock:
+                self._iterators.clear()
+            return
+        while self._iterators:
+            for split_name, iterator in list(self._iterators.items()):
+                try:
+                    example_input = next(iterator)
+                except StopIteration:
+                    with self._lock:
+                        del self._iterators[split_name]
+                    continue
+                with self._lock:
+                    self._pending[split_name] += 1
+                yield split_name, example_input
+
+    def task_done(self, split_name: splits_lib.Split) -> bool:
+        """Marks one example of the split as done and returns whether it was the last one of the split."""
+        with self._lock:
+            self._pending[split_name] -= 1
+            return self._pending[split_name] == 0 and split_name not in self._iterators
+
+
+class _SplitStream:
+    """Shared stream of `(split_name, example_input)` pairs behind the `_StreamedSplit`s of `stream_splits`."""
+
+    def __init__(self, pairs: Iterable[Tuple[splits_lib.Split, ExampleInput]]):
+        self._pairs = iter(pairs)
+        self._buffers: Dict[splits_lib.Split, Deque[ExampleInput]] = collections.defaultdict(
+            collections.deque
+        )
+
+    def take(self, split_name: splits_lib.Split) -> Iterator[ExampleInput]:
+        """Yields the inputs of one split, buffering the inputs of other splits read on the way."""
+        buffer = self._buffers[split_name]
+        while True:
+            while buffer:
+                yield buffer.popleft()
+            for name, example_input in self._pairs:
+                if name == split_name:
+                    yield example_input
+                    break
+                self._buffers[name].append(example_input)
+            else:
+                return
+
+    def interleave(
+        self, splits: Dict[splits_lib.Split, "_StreamedSplit"]
+    ) -> Iterator[Tuple[splits_lib.Split, ExampleInput]]:
+        """Yields the accepted inputs of `splits` in stream order, after those buffered before."""
+        for split_name, split in splits.items():
+            buffer = self._buffers[split_name]
+            while buffer:
+                example_input = buffer.popleft()
+                if split.accepts(example_input):
+                    yield split_name, example_input
+        for split_name, example_input in self._pairs:
+            if split_name not in splits:
+                self._buffers[split_name].append(example_input)
+            elif splits[split_name].accepts(example_input):
+                yield split_name, example_input
+
+
+class _StreamedSplit:
+    """Example inputs of one split of a `_SplitStream`, optionally filtered."""
+
+    def __init__(
+        self,
+        stream: _SplitStream,
+        split_name: splits_lib.Split,
+        predicates: Tuple[Callable[[ExampleInput], bool], ...] = (),
+    ):
+        self.stream = stream
+        self.split_name = split_name
+        self._predicates = predicates
+
+    def __iter__(self) -> Iterator[ExampleInput]:
+        return (x for x in self.stream.take(self.split_name) if self.accepts(x))
+
+    def accepts(self, example_input: ExampleInput) -> bool:
+        return all(predicate(example_input) for predicate in self._predicates)
+
+    def filter(self, predicate: Callable[[ExampleInput], bool]) -> "_StreamedSplit":
+        return _StreamedSplit(self.stream, self.split_name, self._predicates + (predicate,))
+
+
+def _filter_inputs(
+    generator: Iterable[ExampleInput], predicate: Callable[[ExampleInput], bool]
+) -> Iterable[ExampleInput]:
+    """Lazily filters the inputs of a split, keeping a streamed split streamed."""
+    if isinstance(generator, _StreamedSplit):
+        return generator.filter(predicate)
+    return (example_input for example_input in generator if predicate(example_input))
+
+
+def _with_upcoming(
+    tagged_inputs: Iterable[Tuple[Any, ExampleInput]], distance: int
+) -> Iterator[Tuple[Any, ExampleInput, Optional[ExampleInput]]]:
+    """Adds to every `(tag, example_input)` pair the input `distance` places after it, or None near the end."""
+    window = collections.deque()
+    for tag, example_input in tagged_inputs:
+        window.append((tag, example_input))
+        if len(window) > distance:
+            yield window.popleft() + (example_input,)
+    for tag, example_input in window:
+        yield tag, example_input, None
+
+
+def _with_estimates(
+    items: Iterable[Any], estimate_fn: Callable[[Any], Optional[int]], num_threads: int
+) -> Iterator[Tuple[Any, Optional[int]]]:
+    """Yields every item with `estimate_fn(item)`, in order. A background thread takes the items and has
+    `num_threads` threads estimate them, up to `num_threads` items ahead of the caller, so neither taking an
+    item nor estimating it holds up the caller once the items are ahead.
+    """
+    estimated = queue.Queue(maxsize=num_threads)
+    stopped = threading.Event()
+    executor = ThreadPoolExecutor(num_threads, thread_name_prefix="rlds-estimate")
+
+    def put(entry) -> bool:
+        while not stopped.is_set():
+            try:
+                estimated.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def take():
+        try:
+            for item in items:
+                if not put((item, executor.submit(estimate_fn, item))):
+                    return
+            put(None)
+        except BaseException as e:
+            put(e)
+
+    thread = threading.Thread(target=take, name="rlds-estimate-inputs", daemon=True)
+    thread.start()
+    try:
+        while True:
+            entry = estimated.get()
+            if entry is None:
+                return
+            if isinstance(entry, BaseException):
+                raise entry
+            item, future = entry
+            yield item, future.result()
+    finally:
+        stopped.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _TaskQueue:
+    """Wraps the task queue of a pool worker and notes when it was closed or sent the exit sentinel."""
+
+    def __init__(self, task_queue):
+        self._queue = task_queue
+        self.closed = False
+
+    def get(self):
+        try:
+            task = self._queue.get()
+        except (EOFError, OSError):
+            self.closed = True
+            raise
+        self.closed = task is None
+        return task
+
+    def __getattr__(self, name):
+        return getattr(self._queue, name)
+
+
+def _recycling_worker(inqueue, outqueue, initializer=None, initargs=(), maxtasks=None, wrap_exception=False):
+    """Process target of `_RecyclingPool`. Runs the standard pool worker loop one task at a time and exits
+    between two tasks once `MultiThreadedSplitBuilder._recycle_reason` gives a reason, so no task is lost.
+    """
+    inqueue = _TaskQueue(inqueue)
+    while True:
+        mp_pool.worker(inqueue, outqueue, initializer, initargs, 1, wrap_exception)
+        initializer = None
+        if inqueue.closed:
+            return
+        reason = MultiThreadedSplitBuilder._recycle_reason()
+        if reason is not None:
+            MultiThreadedSplitBuilder._report_recycling(*reason)
+            profiling.stop()
+            return
+
+
+class _RecyclingPool(Pool):
+    """Pool whose workers run `_recycling_worker`. The pool starts a replacement for every worker that exits."""
+
+    @staticmethod
+    def Process(ctx, *args, **kwargs):
+        kwargs["target"] = _recycling_worker
+        return ctx.Process(*args, **kwargs)
+
+
+class _WorkerRecyclingLog:
+    """Context manager reading the events of a `_RecyclingPool` in a background thread, logging every
+    recycled worker and a summary on exit.
+    """
+
+    def __init__(self, events):
+        self._events = events
+        self._reasons = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rlds-recycling", daemon=True)
+
+    def __enter__(self) -> "_WorkerRecyclingLog":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        if self._reasons:
+            logging.info(
+                "Restarted %d workers: %s.",
+                sum(self._reasons.values()),
+                ", ".join(f"{count} at the {limit}" for limit, count in self._reasons.items()),
+            )
+
+    def _run(self) -> None:
+        while True:
+            try:
+                event = self._events.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            if event[0] == "recycled":
+                _, pid, limit, details = event
+                logging.info("Restarting worker %d after reaching its %s, %s.", pid, limit, details)
+                self._reasons[limit] += 1
+
+
+class _WriteThread:
+    """Runs the writes of the parent in a background thread, in submission order, fed through a bounded queue.
+
+    Collecting results from the pool then overlaps with shuffler and shard I/O, and a slow disk only stalls
+    the collection loop once `queue_size` writes are pending, which is recorded as "write_queue_wait". An
+    error in a write is raised from the next `submit` or when the block exits. With `queue_size` 0 writes
+    run right away in the calling thread.
+    """
+
+    def __init__(self, queue_size: int, stats: pipeline_stats.PipelineStats):
+        self._stats = stats
+        self._error = None
+        self._aborted = False
+        self._queue = queue.Queue(maxsize=queue_size) if queue_size > 0 else None
+        if self._queue is not None:
+            self._thread = threading.Thread(target=self._run, name="rlds-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, fn: Callable, *args) -> None:
+        if self._queue is None:
+            fn(*args)
+            return
+        self._raise_error()
+        start = time.perf_counter()
+        self._queue.put((fn, args))
+        self._stats.add("write_queue_wait", time.perf_counter() - start)
+
+    def _run(self) -> None:
+        with profiling.sampled("writer"):
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                if self._error is None and not self._aborted:
+                    fn, args = item
+                    try:
+                        fn(*args)
+                    except BaseException as e:
+                        self._error = e
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self) -> "_WriteThread":
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        if self._queue is None:
+            return
+        # on an error in the collection loop, the pending writes are dropped instead of waited for
+        self._aborted = exc_type is not None
+        self._queue.put(None)
+        self._thread.join()
+        if exc_type is None:
+            self._raise_error()
+
+
+class _PeakRss:
+    """Peak RSS of the parent process while generating each split, sampled by `sample` and logged once the
+    split is complete by `log`, which may be called from another thread.
+    """
+
+    def __init__(self, split_names: Iterable[splits_lib.Split]):
+        self._process = psutil.Process()
+        rss = self._process.memory_info().rss
+        self._peaks = dict.fromkeys(split_names, rss)
+        self._lock = threading.Lock()
+
+    def sample(self) -> None:
+        rss = self._process.memory_info().rss
+        with self._lock:
+            for split_name, peak in self._peaks.items():
+                self._peaks[split_name] = max(peak, rss)
+
+    def log(self, split_name: splits_lib.Split) -> None:
+        self.sample()
+        with self._lock:
+            peak = self._peaks.pop(split_name, None)
+        if peak is not None:
+            logging.info("Peak parent memory while generating %s: %.1f MiB.", split_name, peak / 2**20)
+
+
+class _CostEta:
+    """Estimates the remaining time of a split from the pre-scanned costs of its examples rather than from
+    their number, which is badly off when the most expensive examples are processed first, and shows it on
+    the progress bar of the split.
+    """
+
+    def __init__(self, costs: Dict[Key, float], pbar: tqdm):
+        self.costs = costs
+        self._pbar = pbar
+        self._total = sum(costs.values())
+        self._done = 0.0
+        self._start = time.monotonic()
+
+    def skip(self, keys: Iterable[Key]) -> None:
+        """Excludes examples that are already done, e.g. resumed from a checkpoint."""
+        self._total -= sum(self.costs.get(key, 0.0) for key in keys)
+
+    def done(self, keys: Iterable[Key]) -> None:
+        self._done += sum(self.costs.get(key, 0.0) for key in keys)
+        if self._done <= 0 or self._total <= 0:
+            return
+        elapsed = time.monotonic() - self._start
+        remaining = max(0.0, elapsed * (self._total - self._done) / self._done)
+        self._pbar.set_postfix_str(
+            f"{min(1.0, self._done / self._total):.0%} of cost, ETA {tqdm.format_interval(remaining)}",
+            refresh=False,
+        )
+
+
+class _SplitCheckpoint:
+    """Durable journal of the already processed examples of one split, used to resume interrupted builds.
+
+    Serialized examples are appended to segment files as length-prefixed records. Every `interval` examples
+    the current segment is fsynced and a line with its name, keys and stamps is appended to `journal.jsonl`.
+    Only segments listed in the journal are trusted when resuming, and a journaled example is only reused for
+    an input of the split with the same key and stamp, see `MultiThreadedDatasetBuilder._checkpoint_stamp`.
+    """
+
+    def __init__(self, directory: str, interval: int):
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._interval = interval
+        self._journal_path = os.path.join(directory, "journal.jsonl")
+        self._num_entries = 0
+        # the last journaled record of every key: (segment, offset, size, stamp)
+        self._records: Dict[Key, Tuple[str, int, int, str]] = {}
+        if os.path.exists(self._journal_path):
+            with open(self._journal_path, "rb+") as f:
+                offset = 0
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # torn write of the last entry, drop it
+                        f.truncate(offset)
+                        break
+                    offset += len(line)
+                    self._index(entry)
+        self._segment = None
+        self._keys = []
+        self._stamps = []
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def matches(self, key: Key, stamp: str) -> bool:
+        """Returns whether an example of `key` with the same stamp was journaled."""
+        record = self._records.get(key)
+        return record is not None and record[3] == stamp
+
+    def read(self, key: Key) -> bytes:
+        """Returns the journaled serialized example of `key`."""
+        segment, offset, size, _ = self._records[key]
+        with open(os.path.join(self._directory, segment), "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def add(self, key: Key, stamp: str, serialized_example: bytes) -> None:
+        if self._segment is None:
+            segment_name = f"segment-{self._num_entries:05d}"
+            self._segment = open(os.path.join(self._directory, segment_name), "wb")
+        self._segment.write(struct.pack("<Q", len(serialized_example)))
+        self._segment.write(serialized_example)
+        self._keys.append(key)
+        self._stamps.append(stamp)
+        if len(self._keys) >= self._interval:
+            self.commit()
+
+    def commit(self) -> None:
+        """Makes the current segment durable and records its keys in the journal."""
+        if self._segment is None:
+            return
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+        self._segment.close()
+        entry = {"segment": os.path.basename(self._segment.name), "keys": self._keys, "stamps": self._stamps}
+        with open(self._journal_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._index(entry)
+        self._segment = None
+        self._keys = []
+        self._stamps = []
+
+    def _index(self, entry: Dict[str, Any]) -> None:
+        with open(os.path.join(self._directory, entry["segment"]), "rb") as f:
+            for key, stamp in zip(entry["keys"], entry["stamps"]):
+                (size,) = struct.unpack("<Q", f.read(8))
+                self._records[key] = (entry["segment"], f.tell(), size, stamp)
+                f.seek(size, os.SEEK_CUR)
+        self._num_entries += 1
+
+
+def _open_checkpoint_dir(directory: str, origin: Dict[str, Any], reuse: bool) -> None:
+    """Creates the checkpoint directory of a build, first removing a checkpoint left by an earlier build
+    unless `reuse` is set and it was made with the same `origin`.
+    """
+    origin = json.loads(json.dumps(origin))  # as it reads back, e.g. tuples as lists
+    origin_path = os.path.join(directory, "origin.json")
+    if os.path.exists(directory):
+        try:
+            with open(origin_path) as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = None
+        if not reuse or previous != origin:
+            logging.info(
+                "Discarding the checkpoint %s, %s.",
+                directory,
+                "it was made with other inputs" if reuse else "the dataset is generated from scratch",
+            )
+            shutil.rmtree(directory)
+    os.makedirs(directory, exist_ok=True)
+    with open(f"{origin_path}.tmp", "w") as f:
+        json.dump(origin, f)
+    os.replace(f"{origin_path}.tmp", origin_path)
 
 
 class MultiThreadedDatasetBuilder(tfds.core.GeneratorBasedBuilder):
@@ -134,6 +2197,38 @@ class MultiThreadedDatasetBuilder(tfds.core.GeneratorBasedBuilder):
     # Defaults can be overridden by subclasses.
     NUM_WORKERS = 16  # number of parallel workers
     CHUNKSIZE = 500  # number of examples to process in memory before writing to disk
+    STREAMING = False  # write each example as soon as it is done instead of waiting for whole chunks
+    MAX_INFLIGHT = None  # max examples submitted at once in streaming mode, defaults to 2 * NUM_WORKERS
+    MAX_INFLIGHT_BYTES = None  # memory budget for in-flight serialized examples, implies streaming
+    WORKER_SHARDS = None  # if set, workers write this many shards directly, bypassing the parent shuffler
+    CHECKPOINT = False  # journal finished examples next to the dataset so an interrupted build can resume
+    CHECKPOINT_INTERVAL = 100  # number of examples between two durable journal commits
+    SHARED_MEMORY = False  # pass serialized examples to the parent through shared memory, not the result pipe
+    EXAMPLE_TIMEOUT = None  # seconds after which processing an example is aborted as failed
+    MAX_RETRIES = 0  # number of times a failed example is processed again
+    QUARANTINE = False  # skip examples that keep failing and list them in quarantine.jsonl instead of raising
+    AUTOTUNE = False  # tune the examples in flight at runtime, NUM_WORKERS is the upper bound; implies streaming
+    DIRECT_SHARDS = None  # if set, the parent writes this many shards per split by key hash, bypassing the shuffler
+    INCREMENTAL = False  # only add new or changed examples to an existing dataset, requires WORKER_SHARDS
+    PARTITION = None  # "i/N" to only build the examples of partition i out of N, see partitioned_build.py
+    FILE_FORMAT = None  # e.g. "array_record" for random access through `as_data_source`, defaults to tfrecord
+    START_METHOD = None  # worker start method, "forkserver" preloads TF and the builder once; platform default if None
+    WRITE_QUEUE_SIZE = 16  # results buffered for the parent's writer thread, 0 writes in the collection loop
+    PROFILE = False  # sample the stacks of the parent and the workers, writes profile.collapsed and profile.prof
+    PROFILE_INTERVAL = 0.01  # seconds between two stack samples when profiling
+    PROFILE_EVERY = 20  # run cProfile on every n-th example of each worker when profiling, 0 to only sample
+    TRACK_MEMORY = False  # measure the peak memory of every example, writes the largest to memory_report.json
+    MEMORY_CEILING = None  # bytes; examples estimated above it run in a low-concurrency lane, implies streaming
+    LARGE_EXAMPLE_CONCURRENCY = 1  # max examples above MEMORY_CEILING processed at once
+    WORKER_MAX_EXAMPLES = None  # restart a worker after it processed this many examples, to contain leaks
+    WORKER_MAX_RSS = None  # bytes; restart a worker between two tasks once its RSS is above this
+    LONGEST_FIRST = False  # pre-scan `_estimate_example_cost` of all examples and process the costliest first
+    WORKER_THREADS = None  # TensorFlow/OpenCV/BLAS threads per worker, None: cores / NUM_WORKERS, 0: unlimited
+    READAHEAD_THREADS = 0  # threads per worker reading the `_example_files` of examples ahead, see readahead.py
+    READAHEAD_PER_MOUNT = None  # max reads per worker from one file system at once, all threads if None
+
+    def __init__(self, *, file_format=None, **kwargs):
+        super().__init__(file_format=file_format or self.FILE_FORMAT, **kwargs)
 
     @classmethod
     @abc.abstractmethod
@@ -146,6 +2241,104 @@ class MultiThreadedDatasetBuilder(tfds.core.GeneratorBasedBuilder):
         """
         raise NotImplementedError()
 
+    @classmethod
+    def _example_key(cls, example_input: ExampleInput) -> Key:
+        """Returns the key of `example_input` before it is processed, used e.g. to assign it to a shard.
+
+        Must match the key returned by `_process_example`. Defaults to the first element of tuple inputs
+        (e.g. the trajectory path) and to the input itself otherwise.
+        """
+        if isinstance(example_input, (tuple, list)):
+            return example_input[0]
+        return example_input
+
+    @classmethod
+    def _example_fingerprint(cls, example_input: ExampleInput) -> str:
+        """Returns a cheap fingerprint of the source data of `example_input`, used by incremental builds to
+        detect changed examples.
+
+        Defaults to the names, sizes and mtimes of the key path and of its direct children, which change
+        whenever files are added to, removed from or replaced in a trajectory directory.
+        """
+        path = os.fspath(cls._example_key(example_input))
+        stat = os.stat(path)
+        entries = [f".:{stat.st_size}:{stat.st_mtime_ns}"]
+        if os.path.isdir(path):
+            with os.scandir(path) as it:
+                for entry in it:
+                    stat = entry.stat()
+                    entries.append(f"{entry.name}:{stat.st_size}:{stat.st_mtime_ns}")
+        return hashlib.md5("\n".join(sorted(entries)).encode()).hexdigest()
+
+    def _checkpoint_origin(self, dl_manager: download.DownloadManager) -> Dict[str, Any]:
+        """Returns what a checkpoint is made from, a checkpoint of an earlier build is only resumed if this
+        is the same, e.g. the builder config and how inputs are assigned to splits.
+        """
+        return {
+            "builder": self.name,
+            "version": str(self.version),
+            "config": self.builder_config.name if self.builder_config else None,
+            "partition": self._partition(),
+        }
+
+    def _checkpoint_stamp(self, example_input: ExampleInput) -> str:
+        """Returns a stamp of `example_input` that is journaled with its checkpointed example, which is only
+        reused for an input with the same key and stamp. Called in the parent for every input, so it should
+        be cheap.
+
+        Defaults to a digest of the input itself. Builders whose inputs do not change along with their source
+        data should add e.g. the modification times they already know.
+        """
+        return hashlib.md5(repr(example_input).encode()).hexdigest()
+
+    def _estimate_example_memory(self, example_input: ExampleInput) -> Optional[int]:
+        """Returns an estimate of the memory in bytes a worker needs to process `example_input`, compared
+        against `MEMORY_CEILING` before the example is submitted, or None if unknown. Called in the parent
+        for every input if `TRACK_MEMORY` or `MEMORY_CEILING` is set, from a few threads ahead of submission.
+
+        Defaults to the total size of the files under the key path, since processing keeps the raw data of
+        a trajectory in memory, which takes a `stat` of every file. Builders that already know the size of
+        their examples, e.g. from their discovery, should use that instead. `memory_report.json` lists the
+        estimates next to the measured peaks for calibration.
+        """
+        path = os.fspath(self._example_key(example_input))
+        if not os.path.exists(path):
+            return None
+        return _source_size(path)[0]
+
+    @classmethod
+    def _estimate_example_cost(cls, example_input: ExampleInput) -> float:
+        """Returns a cheap estimate of the time needed to process `example_input`, in any unit, used to
+        schedule the most expensive examples first if `LONGEST_FIRST` is set and for the ETA.
+
+        Must not read or decode the data. Defaults to the total size of the files under the key path plus
+        `COST_PER_FILE` bytes for every file, or 1 if the key is not a path.
+        """
+        path = os.fspath(cls._example_key(example_input))
+        if not os.path.exists(path):
+            return 1.0
+        num_bytes, num_files = _source_size(path)
+        return float(num_bytes + COST_PER_FILE * num_files)
+
+    @classmethod
+    def _example_files(cls, example_input: ExampleInput) -> Optional[List[str]]:
+        """Returns the files `_process_example` reads for `example_input`, in the order it reads them. With
+        `READAHEAD_THREADS`, workers read them ahead and `_process_example` takes them with
+        `readahead.read_file`, see readahead.py. Defaults to None, nothing is read ahead.
+        """
+        return None
+
+    def _known_example_files(self, example_input: ExampleInput) -> Optional[List[str]]:
+        """Returns the files of `example_input` as far as the parent knows them without touching the file
+        system, e.g. from its discovery. With `READAHEAD_THREADS` in streaming mode, a worker has them read
+        into the page cache for the worker that gets the example. Called in the parent before an example is
+        submitted, so it must be cheap.
+
+        Defaults to None, nothing is read into the page cache: listing the files in a worker would double the
+        listing on a network file system, since the worker processing the example lists them again.
+        """
+        return None
+
     @abc.abstractmethod
     def _split_generators(
         self,
@@ -163,6 +2356,50 @@ class MultiThreadedDatasetBuilder(tfds.core.GeneratorBasedBuilder):
         """
         raise RuntimeError()
 
+    def download_and_prepare(
+        self,
+        *,
+        download_dir: Optional[str] = None,
+        download_config: Optional[download.DownloadConfig] = None,
+        **kwargs,
+    ) -> None:
+        """Same as superclass `download_and_prepare`, but if `INCREMENTAL` is set and the dataset already
+        exists, only new or changed examples are added to it instead of reusing it as is.
+
+        With the fork start method, the TensorFlow thread limit of the workers is set here, before the parent
+        starts TensorFlow (e.g. to read the existing dataset), since forked workers inherit its thread pools.
+        The parent's own TensorFlow is then limited as well.
+        """
+        if mp.get_context(self.START_METHOD).get_start_method() == "fork":
+            num_threads = _worker_threads(self.WORKER_THREADS, self.NUM_WORKERS)
+            if num_threads:
+                # if TensorFlow already started, the workers report that they could not be limited
+                _limit_tensorflow_threads(num_threads)
+        download_config = download_config or download.DownloadConfig()
+        if self.INCREMENTAL:
+            _finish_replace_dir(f"{self.data_path}{INCREMENTAL_STAGING_SUFFIX}", os.fspath(self.data_path))
+        if (
+            self.INCREMENTAL
+            and download_config.download_mode == download.GenerateMode.REUSE_DATASET_IF_EXISTS
+            and os.path.exists(os.path.join(self.data_path, INCREMENTAL_MANIFEST_FILENAME))
+        ):
+            dl_manager = self._make_download_manager(
+                download_dir=download_dir, download_config=download_config
+            )
+            self._update_incrementally(dl_manager, download_config)
+            return
+        self._num_quarantined = 0
+        super().download_and_prepare(
+            download_dir=download_dir, download_config=download_config, **kwargs
+        )
+        if self._num_quarantined:
+            # logged once the temporary data dir the list was written to is moved into place with the shards
+            logging.warning(
+                "Skipped %d examples that failed, see %s.",
+                self._num_quarantined,
+                os.path.join(self.data_path, QUARANTINE_FILENAME),
+            )
+
     def _download_and_prepare(
         self,
         dl_manager: download.DownloadManager,
@@ -171,19 +2408,26 @@ class MultiThreadedDatasetBuilder(tfds.core.GeneratorBasedBuilder):
         """Same as superclass `_download_and_prepare`, but removes Apache Beam stuff and uses
         MultiThreadedSplitBuilder instead of SplitBuilder.
         """
-        split_builder = MultiThreadedSplitBuilder(
-            process_fn=type(self)._process_example,
-            num_workers=self.NUM_WORKERS,
-            chunksize=self.CHUNKSIZE,
-            split_dict=self.info.splits,
-            features=self.info.features,
-            dataset_size=self.info.dataset_size,
-            max_examples_per_split=download_config.max_examples_per_split,
-            beam_options=download_config.beam_options,
-            beam_runner=download_config.beam_runner,
-            file_format=self.info.file_format,
-            shard_config=download_config.get_shard_config(),
-        )
+        if self.INCREMENTAL and not self.WORKER_SHARDS:
+            raise ValueError("INCREMENTAL builds require WORKER_SHARDS to be set.")
+        if self.DIRECT_SHARDS and (self.WORKER_SHARDS or self.CHECKPOINT):
+            raise ValueError("DIRECT_SHARDS cannot be combined with WORKER_SHARDS or CHECKPOINT.")
+        if self.MEMORY_CEILING and self.WORKER_SHARDS:
+            raise ValueError("MEMORY_CEILING cannot be combined with WORKER_SHARDS.")
+        if self.CHECKPOINT:
+            # `self.data_path` is a temporary directory that is deleted if the build fails, so the checkpoint
+            # lives next to it, e.g. `<data_dir>/bridge_dataset/1.0.0.checkpoint`.
+            checkpoint_dir = os.path.join(
+                os.path.dirname(self.data_path), f"{self.version}.checkpoint"
+            )
+            _open_checkpoint_dir(
+                checkpoint_dir,
+                self._checkpoint_origin(dl_manager),
+                reuse=download_config.download_mode == download.GenerateMode.REUSE_DATASET_IF_EXISTS,
+            )
+        else:
+            checkpoint_dir = None
+        split_builder = self._make_split_builder(download_config, checkpoint_dir)
 
         split_generators = self._split_generators(dl_manager)
         dataset_builder._check_split_names(split_generators.keys())
@@ -192,27 +2436,336 @@ class MultiThreadedDatasetBuilder(tfds.core.GeneratorBasedBuilder):
         if download_config.max_examples_per_split == 0:
             return
 
-        # Start generating data for all splits
-        path_suffix = file_adapters.ADAPTER_FOR_FORMAT[
-            self.info.file_format
-        ].FILE_SUFFIX
+        partition = self._partition()
+        if partition is not None:
+            logging.info("Building partition %d/%d.", *partition)
 
-        split_infos = []
+        # Collect the examples of all splits, which are then generated together in one pool
+        generators = {}
+        fingerprints = {}
         for split_name, generator in split_generators.items():
-            filename_template = naming.ShardedFileTemplate(
-                split=split_name,
-                dataset_name=self.name,
-                data_dir=self.data_path,
-                filetype_suffix=path_suffix,
-            )
-            split_info = split_builder.submit_split_generation(
-                split_name=split_name,
-                generator=generator,
-                filename_template=filename_template,
-                disable_shuffling=self.info.disable_shuffling,
-            )
-            split_infos.append(split_info)
+            if partition is not None:
+                index, num_partitions = partition
+                generator = _filter_inputs(
+                    generator,
+                    lambda x, index=index, num_partitions=num_partitions: partition_of(
+                        type(self)._example_key(x), num_partitions
+                    )
+                    == index,
+                )
+            if self.INCREMENTAL:
+                generator = list(generator)
+                fingerprints[split_name] = self._fingerprint_inputs(generator)
+            generators[split_name] = generator
+        start = time.perf_counter()
+        split_infos = split_builder.submit_split_generations(
+            generators,
+            {split_name: self._filename_template(split_name) for split_name in generators},
+            disable_shuffling=self.info.disable_shuffling,
+        )
+        self._write_pipeline_stats(split_builder.stats, time.perf_counter() - start)
+        if split_builder.profile_dir:
+            self._write_profile(split_builder.profile_dir)
+        self._num_quarantined = split_builder.num_quarantined
+        manifest = {}
+        if self.INCREMENTAL:
+            for split_name in split_builder.written_shards:
+                manifest[split_name] = [
+                    {
+                        "keys": keys,
+                        "fingerprints": [fingerprints[split_name].get(key, "") for key in keys],
+                        "num_bytes": num_bytes,
+                    }
+                    for keys, num_bytes in split_builder.written_shards[split_name]
+                ]
 
         # Update the info object with the splits.
         split_dict = splits_lib.SplitDict(split_infos)
-        self.info.set_splits(split_dict)
\ No newline at end of file
+        self.info.set_splits(split_dict)
+
+        if self.INCREMENTAL:
+            self._write_incremental_manifest(manifest)
+        if checkpoint_dir is not None:
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+    def merge_partitions(self, partition_data_dirs: List[str]) -> None:
+        """Moves the shards of the datasets built with `PARTITION` into this builder's data dir and writes a
+        single `dataset_info.json` for them.
+
+        Partitions are merged in the given order and their shards renumbered per split, so merging the same
+        partitions always gives the same dataset.
+        """
+        if self.data_path.exists():
+            raise FileExistsError(f"{self.data_path} already exists.")
+        partitions = [
+            tfds.builder_from_directory(os.path.join(data_dir, self.info.full_name))
+            for data_dir in partition_data_dirs
+        ]
+        split_names = []
+        for partition in partitions:
+            split_names += [
+                name for name in partition.info.splits.keys() if name not in split_names
+            ]
+        with utils.incomplete_dir(self.data_path) as tmp_data_dir:
+            split_infos = []
+            for split_name in split_names:
+                paths, shard_lengths, num_bytes = [], [], 0
+                for partition in partitions:
+                    if split_name not in partition.info.splits:
+                        continue
+                    split_info = partition.info.splits[split_name]
+                    paths += [os.fspath(path) for path in split_info.filepaths]
+                    shard_lengths += split_info.shard_lengths
+                    num_bytes += split_info.num_bytes
+                filename_template = self._filename_template(split_name).replace(
+                    data_dir=tmp_data_dir
+                )
+                for i, path in enumerate(paths):
+                    _move_shard(
+                        path,
+                        os.fspath(
+                            filename_template.sharded_filepath(
+                                shard_index=i, num_shards=len(paths)
+                            )
+                        ),
+                    )
+                split_infos.append(
+                    splits_lib.SplitInfo(
+                        name=split_name,
+                        shard_lengths=shard_lengths,
+                        num_bytes=num_bytes,
+                        filename_template=filename_template,
+                    )
+                )
+                logging.info(
+                    "Merged %d shards of %s from %d partitions.",
+                    len(paths),
+                    split_name,
+                    len(partitions),
+                )
+            self.info.set_splits(splits_lib.SplitDict(split_infos))
+            self.info.write_to_directory(tmp_data_dir)
+
+    def _partition(self) -> Optional[Tuple[int, int]]:
+        """Returns `(index, num_partitions)` if only one partition of the dataset should be built."""
+        partition = os.environ.get(PARTITION_ENV_VAR) or self.PARTITION
+        if not partition:
+            return None
+        index, num_partitions = (int(x) for x in partition.split("/"))
+        if not 0 <= index < num_partitions:
+            raise ValueError(f"Invalid partition {partition}.")
+        return index, num_partitions
+
+    def _profile(self) -> bool:
+        """Returns whether this build is profiled, see `PROFILE`."""
+        return os.environ.get(PROFILE_ENV_VAR, "").lower() in ("1", "true") or self.PROFILE
+
+    def _update_incrementally(
+        self,
+        dl_manager: download.DownloadManager,
+        download_config: download.DownloadConfig,
+    ) -> None:
+        """Processes only the examples that are new or whose source data changed since the existing dataset
+        was built and adds them as additional shards.
+
+        The updated dataset is written to a staging directory next to the dataset, with the unchanged shards
+        hard-linked, and then replaces the dataset directory, so an interrupted update leaves the dataset as it
+        was.
+        """
+        logging.info("Updating dataset %s (%s)", self.name, self.data_path)
+        data_path = os.fspath(self.data_path)
+        with open(os.path.join(data_path, INCREMENTAL_MANIFEST_FILENAME)) as f:
+            manifest = json.load(f)
+        staging_path = f"{data_path}{INCREMENTAL_STAGING_SUFFIX}"
+        shutil.rmtree(staging_path, ignore_errors=True)  # left by an interrupted update
+        os.makedirs(staging_path)
+        # examples quarantined before are not in the manifest and are retried, so the staged list starts empty
+        replaced = {QUARANTINE_FILENAME}
+        with utils.temporary_assignment(self, "_data_dir", staging_path):
+            split_builder = self._make_split_builder(download_config)
+            split_infos = []
+            new_manifest = {}
+            start = time.perf_counter()
+            with split_builder.shared_pool():
+                for split_name, generator in self._split_generators(dl_manager).items():
+                    example_inputs = list(generator)
+                    old_filename_template = self._filename_template(split_name).replace(data_dir=data_path)
+                    shards = manifest.get(split_name, [])
+                    for i in range(len(shards)):
+                        path = os.fspath(
+                            old_filename_template.sharded_filepath(shard_index=i, num_shards=len(shards))
+                        )
+                        replaced.update(map(os.path.basename, [path, writer_lib._get_index_path(path)]))
+                    split_info, new_manifest[split_name] = split_builder.submit_incremental_split_generation(
+                        split_name=split_name,
+                        example_inputs=example_inputs,
+                        fingerprints=self._fingerprint_inputs(example_inputs),
+                        filename_template=self._filename_template(split_name),
+                        old_filename_template=old_filename_template,
+                        shards=shards,
+                    )
+                    if split_info is not None:
+                        split_infos.append(split_info)
+            self._write_pipeline_stats(split_builder.stats, time.perf_counter() - start)
+            if split_builder.profile_dir:
+                self._write_profile(split_builder.profile_dir)
+            self.info.set_splits(splits_lib.SplitDict(split_infos))
+            self.info.write_to_directory(self.data_path)
+            self._write_incremental_manifest(new_manifest)
+        # e.g. reports of earlier builds are kept, like any other file that is not replaced
+        with os.scandir(data_path) as entries:
+            for entry in entries:
+                staged_path = os.path.join(staging_path, entry.name)
+                if entry.is_file() and entry.name not in replaced and not os.path.exists(staged_path):
+                    _link_file(entry.path, staged_path)
+        _replace_dir(staging_path, data_path)
+        self.info.update_data_dir(data_path)
+        if split_builder.num_quarantined:
+            logging.warning(
+                "Skipped %d examples that failed, see %s.",
+                split_builder.num_quarantined,
+                os.path.join(data_path, QUARANTINE_FILENAME),
+            )
+
+    def _fingerprint_inputs(self, example_inputs: List[ExampleInput]) -> Dict[Key, str]:
+        """Fingerprints all example inputs, using threads since this is dominated by file system latency."""
+        with ThreadPoolExecutor(max_workers=4 * self.NUM_WORKERS) as executor:
+            fingerprints = executor.map(type(self)._example_fingerprint, example_inputs)
+            return {
+                type(self)._example_key(x): fingerprint
+                for x, fingerprint in zip(example_inputs, fingerprints)
+            }
+
+    def _write_pipeline_stats(
+        self, stats: pipeline_stats.PipelineStats, wall_seconds: float
+    ) -> None:
+        """Writes the per-stage timings of this build next to the dataset and logs them."""
+        processed = stats.stages.get("serialize_example", pipeline_stats.StageStats())
+        summary = stats.write(
+            os.fspath(self.data_path), wall_seconds, processed.count, processed.num_bytes
+        )
+        for name, stage in summary["stages"].items():
+            logging.info(
+                "Stage %s: p50 %.4fs, p95 %.4fs, p99 %.4fs, total %.1fs, %.1f MB/s.",
+                name,
+                stage["p50_seconds"],
+                stage["p95_seconds"],
+                stage["p99_seconds"],
+                stage["total_seconds"],
+                stage["mb_per_second"],
+            )
+        logging.info(
+            "Processed %d examples in %.1fs: %.2f examples/s, %.2f MB/s.",
+            summary["num_examples"],
+            wall_seconds,
+            summary["examples_per_second"],
+            summary["mb_per_second"],
+        )
+        report = stats.write_memory_report(os.fspath(self.data_path))
+        if report is not None:
+            logging.info(
+                "Peak memory per example: mean %.1f MiB, p99 %.1f MiB. Largest, see %s:",
+                report["mean_peak_bytes"] / 2**20,
+                report["p99_peak_bytes"] / 2**20,
+                pipeline_stats.MEMORY_REPORT_FILENAME,
+            )
+            for example in report["largest_examples"][:5]:
+                logging.info(
+                    "  %s: %.1f MiB peak, %d steps, %.1f MiB serialized.",
+                    example["key"],
+                    example["peak_bytes"] / 2**20,
+                    example["num_steps"],
+                    example["serialized_bytes"] / 2**20,
+                )
+
+    def _write_profile(self, profile_dir: str) -> None:
+        """Merges the profiles of the parent and the workers next to the dataset and logs the hottest
+        functions.
+        """
+        num_samples, hottest = profiling.merge(profile_dir, os.fspath(self.data_path))
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        logging.info(
+            "Wrote %s and %s with %d stack samples to %s, e.g. for flamegraph.pl or speedscope.",
+            profiling.COLLAPSED_FILENAME,
+            profiling.PSTATS_FILENAME,
+            num_samples,
+            self.data_path,
+        )
+        for function, share in hottest:
+            logging.info("Profile: %5.1f%% of samples in %s.", share * 100, function)
+
+    def _write_incremental_manifest(self, manifest: Dict[str, Any]) -> None:
+        path = os.path.join(self.data_path, INCREMENTAL_MANIFEST_FILENAME)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _filename_template(self, split_name: str) -> naming.ShardedFileTemplate:
+        return naming.ShardedFileTemplate(
+            split=split_name,
+            dataset_name=self.name,
+            data_dir=self.data_path,
+            filetype_suffix=file_adapters.ADAPTER_FOR_FORMAT[
+                self.info.file_format
+            ].FILE_SUFFIX,
+        )
+
+    def _make_split_builder(
+        self,
+        download_config: download.DownloadConfig,
+        checkpoint_dir: Optional[str] = None,
+    ) -> MultiThreadedSplitBuilder:
+        return MultiThreadedSplitBuilder(
+            process_fn=type(self)._process_example,
+            num_workers=self.NUM_WORKERS,
+            chunksize=self.CHUNKSIZE,
+            streaming=self.STREAMING,
+            max_inflight=self.MAX_INFLIGHT,
+            max_inflight_bytes=self.MAX_INFLIGHT_BYTES,
+            worker_shards=self.WORKER_SHARDS,
+            key_fn=type(self)._example_key,
+            checkpoint_dir=checkpoint_dir,
+            stamp_fn=self._checkpoint_stamp,
+            checkpoint_interval=self.CHECKPOINT_INTERVAL,
+            shared_memory=self.SHARED_MEMORY,
+            example_timeout=self.EXAMPLE_TIMEOUT,
+            max_retries=self.MAX_RETRIES,
+            quarantine_path=(
+                os.path.join(self.data_path, QUARANTINE_FILENAME) if self.QUARANTINE else None
+            ),
+            autotune=self.AUTOTUNE,
+            direct_shards=self.DIRECT_SHARDS,
+            start_method=self.START_METHOD,
+            preload_modules=[
+                module
+                for module in ["tensorflow", "tensorflow_datasets", __name__, type(self).__module__]
+                if module != "__main__"
+            ],
+            write_queue_size=self.WRITE_QUEUE_SIZE,
+            profile_dir=(
+                os.path.join(self.data_path, PROFILE_PARTS_DIRNAME) if self._profile() else None
+            ),
+            profile_interval=self.PROFILE_INTERVAL,
+            profile_every=self.PROFILE_EVERY,
+            track_memory=self.TRACK_MEMORY,
+            memory_fn=self._estimate_example_memory,
+            memory_ceiling=self.MEMORY_CEILING,
+            large_example_concurrency=self.LARGE_EXAMPLE_CONCURRENCY,
+            worker_max_examples=self.WORKER_MAX_EXAMPLES,
+            worker_max_rss=self.WORKER_MAX_RSS,
+            longest_first=self.LONGEST_FIRST,
+            cost_fn=type(self)._estimate_example_cost,
+            worker_threads=self.WORKER_THREADS,
+            files_fn=type(self)._example_files,
+            known_files_fn=self._known_example_files,
+            readahead_threads=self.READAHEAD_THREADS,
+            readahead_per_mount=self.READAHEAD_PER_MOUNT,
+            split_dict=self.info.splits,
+            features=self.info.features,
+            dataset_size=self.info.dataset_size,
+            max_examples_per_split=download_config.max_examples_per_split,
+            beam_options=download_config.beam_options,
+            beam_runner=download_config.beam_runner,
+            file_format=self.info.file_format,
+            shard_config=download_config.get_shard_config(),
+        )
@@ -0,0 +1,173 @@
+"""Cheap validation of encoded JPEG and PNG frames that are passed through without decoding.
+
+Builders that store the original file bytes skip the decode that used to catch bad frames. These checks read
+only the headers instead: the SOF segment of a JPEG and the IHDR chunk of a PNG hold the dimensions, the
+number of channels and the bit depth, and a frame cut short is missing its end marker. The frames of one
+camera share their header layout, so the header fields of a whole trajectory are gathered into one array and
+checked at once; frames laid out differently fall back to parsing their own segments. `decode_sample`
+additionally decodes a random sample of the frames, for damage in the compressed data itself.
+"""
+
+import io
+import random
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_IEND = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}  # by color type, palette images count as one channel
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+# start of frame markers of all coding processes, the other markers in 0xC0-0xCF are DHT, JPG and DAC
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+_JPEG_SOF_SIZE = 10  # marker, length, precision, height, width, number of components
+_PNG_HEADER_SIZE = 26  # signature, IHDR length and type, width, height, bit depth, color type
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+def validate_jpeg(frames: Sequence[bytes], shape: Tuple[int, int, int], name: str = "") -> None:
+    """Checks that all `frames` are complete baseline or progressive JPEGs of `shape` with 8 bits per sample.
+    Raises an `InvalidImageError` naming the first bad frame otherwise.
+    """
+    headers = jpeg_headers(frames, name)
+    _check(headers, np.array(shape[:2] + (shape[2], 8)), frames, JPEG_EOI, name)
+
+
+def validate_png(
+    frames: Sequence[bytes], shape: Tuple[int, int, int], bit_depth: int, name: str = ""
+) -> List[int]:
+    """Checks that all `frames` are complete PNGs of `shape`. Returns the indices of the frames that only
+    differ in their bit depth from `bit_depth`, which a caller may convert, and raises an `InvalidImageError`
+    naming the first bad frame for anything else.
+    """
+    headers = png_headers(frames, name)
+    expected = np.array(shape + (bit_depth,))
+    other_depth = np.flatnonzero(
+        np.all(headers[:, :3] == expected[:3], axis=1) & (headers[:, 3] != bit_depth)
+    )
+    headers[other_depth, 3] = bit_depth
+    _check(headers, expected, frames, PNG_IEND, name)
+    return other_depth.tolist()
+
+
+def jpeg_headers(frames: Sequence[bytes], name: str = "") -> np.ndarray:
+    """Returns the height, width, number of channels and bit depth of every frame as rows of an array."""
+    if not frames:
+        return np.zeros((0, 4), dtype=np.int64)
+    offset = _jpeg_sof_offset(frames[0], f"{name} frame 0")
+    fields = _gather(frames, offset, _JPEG_SOF_SIZE)
+    aligned = (fields[:, 0] == 0xFF) & np.isin(fields[:, 1], list(JPEG_SOF_MARKERS))
+    aligned &= np.all(_gather(frames, 0, 2) == np.frombuffer(JPEG_SOI, dtype=np.uint8), axis=1)
+    headers = np.stack(
+        [
+            fields[:, 5].astype(np.int64) << 8 | fields[:, 6],
+            fields[:, 7].astype(np.int64) << 8 | fields[:, 8],
+            fields[:, 9],
+            fields[:, 4],
+        ],
+        axis=1,
+    )
+    for i in np.flatnonzero(~aligned):
+        frame = frames[i]
+        sof = _jpeg_sof_offset(frame, f"{name} frame {i}")
+        header = frame[sof : sof + _JPEG_SOF_SIZE]
+        headers[i] = [header[5] << 8 | header[6], header[7] << 8 | header[8], header[9], header[4]]
+    return headers
+
+
+def png_headers(frames: Sequence[bytes], name: str = "") -> np.ndarray:
+    """Returns the height, width, number of channels and bit depth of every frame as rows of an array."""
+    if not frames:
+        return np.zeros((0, 4), dtype=np.int64)
+    fields = _gather(frames, 0, _PNG_HEADER_SIZE)
+    expected_start = np.frombuffer(PNG_SIGNATURE + b"\x00\x00\x00\x0dIHDR", dtype=np.uint8)
+    bad = np.flatnonzero(np.any(fields[:, :16] != expected_start, axis=1))
+    if bad.size:
+        raise InvalidImageError(f"{name} frame {bad[0]} is not a PNG.")
+    color_types = fields[:, 25]
+    unknown = np.flatnonzero(~np.isin(color_types, list(PNG_CHANNELS)))
+    if unknown.size:
+        raise InvalidImageError(
+            f"{name} frame {unknown[0]} has unknown PNG color type {color_types[unknown[0]]}."
+        )
+    big_endian = fields[:, 16:24].copy().view(">u4")
+    return np.stack(
+        [
+            big_endian[:, 1].astype(np.int64),
+            big_endian[:, 0].astype(np.int64),
+            np.vectorize(PNG_CHANNELS.get, otypes=[np.int64])(color_types),
+            fields[:, 24],
+        ],
+        axis=1,
+    )
+
+
+def decode_sample(frames: Sequence[bytes], fraction: float, name: str = "") -> int:
+    """Fully decodes each frame with probability `fraction`, seeded by `name` so a rebuild checks the same
+    frames. Raises an `InvalidImageError` naming the first frame that fails to decode, and returns the number
+    of decoded frames.
+    """
+    if fraction <= 0:
+        return 0
+    rng = random.Random(name)
+    indices = [i for i in range(len(frames)) if rng.random() < fraction]
+    for i in indices:
+        try:
+            with Image.open(io.BytesIO(frames[i])) as im:
+                im.load()
+        except (OSError, SyntaxError, ValueError) as e:
+            raise InvalidImageError(f"{name} frame {i} does not decode: {e}") from e
+    return len(indices)
+
+
+def _check(
+    headers: np.ndarray, expected: np.ndarray, frames: Sequence[bytes], end_marker: bytes, name: str
+) -> None:
+    bad = np.flatnonzero(np.any(headers != expected, axis=1))
+    if bad.size:
+        i = bad[0]
+        raise InvalidImageError(
+            f"{name} frame {i} is {_describe(headers[i])}, expected {_describe(expected)}."
+        )
+    for i, frame in enumerate(frames):
+        # encoders may pad a few bytes after the end marker
+        if not frame.endswith(end_marker) and end_marker not in frame[-32:]:
+            raise InvalidImageError(f"{name} frame {i} is truncated.")
+
+
+def _describe(header: np.ndarray) -> str:
+    height, width, channels, bit_depth = (int(x) for x in header)
+    return f"{height}x{width}x{channels} with {bit_depth} bits"
+
+
+def _gather(frames: Sequence[bytes], offset: int, size: int) -> np.ndarray:
+    """Bytes `offset` to `offset + size` of every frame as rows of an array, zero-padded for short frames."""
+    rows = b"".join(frame[offset : offset + size].ljust(size, b"\x00") for frame in frames)
+    return np.frombuffer(rows, dtype=np.uint8).reshape(len(frames), size)
+
+
+def _jpeg_sof_offset(frame: bytes, name: str) -> int:
+    """Offset of the SOF segment, found by walking the segments from the start of the image."""
+    if not frame.startswith(JPEG_SOI):
+        raise InvalidImageError(f"{name} is not a JPEG.")
+    offset = 2
+    while offset + 4 <= len(frame):
+        if frame[offset] != 0xFF:
+            break
+        marker = frame[offset + 1]
+        if marker == 0xFF:  # fill byte
+            offset += 1
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if offset + _JPEG_SOF_SIZE > len(frame):
+                break
+            return offset
+        if marker == 0xDA:  # start of scan without a frame header
+            break
+        offset += 2 + (frame[offset + 2] << 8 | frame[offset + 3])
+    raise InvalidImageError(f"{name} has no JPEG frame header.")
@@ -0,0 +1,95 @@
+"""Builds a MultiThreadedDatasetBuilder dataset as N independent partitions and merges them.
+
+Every partition only converts the examples whose key hashes to it (see `dataset_builder.partition_of`) and
+writes its own shards to `<data_dir>/partitions/<i>-of-<N>`, so partitions can run on different machines
+that share `data_dir`. Run from the directory containing the dataset folder, e.g. for bridge_dataset:
+
+    python partitioned_build.py build bridge_dataset --partition 0/4 --data_dir /data/rlds  # on node 0
+    ...
+    python partitioned_build.py build bridge_dataset --partition 3/4 --data_dir /data/rlds  # on node 3
+    python partitioned_build.py merge bridge_dataset --num_partitions 4 --data_dir /data/rlds
+
+`local` runs all N partitions as local processes and merges them, which is handy for testing on one box.
+"""
+
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+
+import tensorflow_datasets as tfds
+
+from dataset_builder import PARTITION_ENV_VAR, partition_data_dir
+
+
+def make_builder(dataset_name: str, data_dir: str) -> tfds.core.DatasetBuilder:
+    # registers the builder, following the `<name>/<name>_dataset_builder.py` layout used by `tfds build`
+    importlib.import_module(f"{dataset_name}.{dataset_name}_dataset_builder")
+    return tfds.builder(dataset_name, data_dir=data_dir)
+
+
+def build(dataset_name: str, data_dir: str, partition: str, manual_dir: str = None):
+    index, num_partitions = (int(x) for x in partition.split("/"))
+    os.environ[PARTITION_ENV_VAR] = partition
+    builder = make_builder(
+        dataset_name, partition_data_dir(data_dir, index, num_partitions)
+    )
+    builder.download_and_prepare(
+        download_config=tfds.download.DownloadConfig(manual_dir=manual_dir)
+    )
+
+
+def merge(dataset_name: str, data_dir: str, num_partitions: int):
+    builder = make_builder(dataset_name, data_dir)
+    builder.merge_partitions(
+        [partition_data_dir(data_dir, i, num_partitions) for i in range(num_partitions)]
+    )
+    print(f"Merged {num_partitions} partitions into {builder.data_path}.")
+
+
+def build_locally(
+    dataset_name: str, data_dir: str, num_partitions: int, manual_dir: str = None
+):
+    processes = []
+    for i in range(num_partitions):
+        cmd = [
+            sys.executable,
+            os.path.abspath(__file__),
+            "build",
+            dataset_name,
+            "--partition",
+            f"{i}/{num_partitions}",
+            "--data_dir",
+            data_dir,
+        ]
+        if manual_dir:
+            cmd += ["--manual_dir", manual_dir]
+        processes.append(subprocess.Popen(cmd))
+    failed = [i for i, p in enumerate(processes) if p.wait() != 0]
+    if failed:
+        sys.exit(f"Partitions {failed} failed, not merging.")
+    merge(dataset_name, data_dir, num_partitions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ["build", "merge", "local"]:
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument("dataset_name", help="name of the dataset to build")
+        subparser.add_argument("--data_dir", required=True, help="shared output directory")
+        if command == "build":
+            subparser.add_argument("--partition", required=True, help="partition to build as i/N")
+        else:
+            subparser.add_argument("--num_partitions", type=int, required=True)
+        if command != "merge":
+            subparser.add_argument("--manual_dir", help="directory with the raw data")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(args.dataset_name, args.data_dir, args.partition, args.manual_dir)
+    elif args.command == "merge":
+        merge(args.dataset_name, args.data_dir, args.num_partitions)
+    else:
+        build_locally(args.dataset_name, args.data_dir, args.num_partitions, args.manual_dir)
@@ -0,0 +1,309 @@
+"""Lightweight per-stage timers and byte counters for the conversion pipeline.
+
+Code running in a worker wraps its stages in `stage(name)` (or decorates them with `timed(name)`). Time and
+bytes are summed per stage over one example, and `take_sample()` returns these totals so they can travel back
+to the parent with the serialized example. The parent adds the samples to a `PipelineStats`, which keeps a
+log-scale histogram of every stage, so approximate percentiles cost a few counters instead of every sample.
+
+If the worker also measured the memory of the example with `PeakMemory` and passed it to `record_memory`, the
+sample carries it along, and `PipelineStats` keeps the examples with the highest peaks for a report.
+"""
+
+import contextlib
+import functools
+import heapq
+import json
+import math
+import os
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+STATS_FILENAME = "pipeline_stats.json"
+PROMETHEUS_FILENAME = "pipeline_stats.prom"
+MEMORY_REPORT_FILENAME = "memory_report.json"
+MEMORY_REPORT_SIZE = 20  # number of examples with the highest memory peaks that are reported
+MEMORY_KEY = "memory"  # sample entry holding the `ExampleMemory` of the example
+
+_BUCKETS_PER_OCTAVE = 4  # histogram resolution, percentiles are accurate to within ~19%
+_MIN_SECONDS = 1e-6
+QUANTILES = (0.5, 0.95, 0.99)
+
+Sample = Dict[str, Tuple[float, int]]  # stage name -> (seconds, bytes) spent on one example
+
+
+class ExampleMemory(NamedTuple):
+    key: str
+    peak_bytes: int  # peak memory of the worker while processing the example, above the memory before it
+    serialized_bytes: int
+    num_steps: int
+    estimated_bytes: Optional[int]  # estimate the parent made before submitting the example, if any
+
+
+# totals of the example currently being processed in this process
+_sample: Dict[str, list] = {}
+_memory: Optional[ExampleMemory] = None
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Adds the time spent in the block to stage `name` of the current example."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        totals = _sample.setdefault(name, [0.0, 0])
+        totals[0] += time.perf_counter() - start
+
+
+def count_bytes(name: str, num_bytes: int) -> None:
+    """Adds `num_bytes` to stage `name` of the current example."""
+    _sample.setdefault(name, [0.0, 0])[1] += num_bytes
+
+
+def timed(name: str, num_bytes: Optional[Callable[[Any], int]] = None) -> Callable:
+    """Decorator timing every call of a function as stage `name`. If given, `num_bytes(result)` is added to
+    the byte counter of the stage.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                result = fn(*args, **kwargs)
+            if num_bytes is not None:
+                count_bytes(name, num_bytes(result))
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def record_memory(memory: ExampleMemory) -> None:
+    """Attaches the memory measurement of the current example to its sample."""
+    global _memory
+    _memory = memory
+
+
+def take_sample() -> Sample:
+    """Returns the stage totals of the current example and starts a new one."""
+    global _memory
+    sample = {name: (seconds, num_bytes) for name, (seconds, num_bytes) in _sample.items()}
+    if _memory is not None:
+        sample[MEMORY_KEY] = _memory
+    _sample.clear()
+    _memory = None
+    return sample
+
+
+class PeakMemory:
+    """Context manager measuring the peak memory of this process during the block, above the memory at its
+    start, as `peak_bytes`.
+
+    On Linux this is the resident set size: the kernel's high-water mark is reset through
+    /proc/self/clear_refs on entry and read from /proc/self/status on exit, which costs two small file
+    accesses. Elsewhere it falls back to tracemalloc, which only sees allocations made through Python and
+    numpy and slows down allocation-heavy code.
+    """
+
+    def __init__(self):
+        self.peak_bytes = 0
+        self._start = 0
+
+    def __enter__(self) -> "PeakMemory":
+        if _kernel_peak_resettable():
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            self._start = _read_status_bytes("VmRSS")
+        else:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self._start = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if _kernel_peak_resettable():
+            peak = _read_status_bytes("VmHWM")
+        else:
+            peak = tracemalloc.get_traced_memory()[1]
+        self.peak_bytes = max(0, peak - self._start)
+
+
+@functools.lru_cache(maxsize=None)
+def _kernel_peak_resettable() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        _read_status_bytes("VmHWM")
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def _read_status_bytes(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) * 1024
+    raise ValueError(f"{field} not found in /proc/self/status.")
+
+
+class StageStats:
+    """Count, totals and a log-scale histogram of the per-example durations of one stage."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.num_bytes = 0
+        self.histogram: Dict[int, int] = {}
+
+    def add(self, seconds: float, num_bytes: int = 0) -> None:
+        self.count += 1
+        self.seconds += seconds
+        self.num_bytes += num_bytes
+        bucket = max(0, int(math.log2(max(seconds, _MIN_SECONDS) / _MIN_SECONDS) * _BUCKETS_PER_OCTAVE))
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def merge(self, other: "StageStats") -> None:
+        self.count += other.count
+        self.seconds += other.seconds
+        self.num_bytes += other.num_bytes
+        for bucket, count in other.histogram.items():
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + count
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the histogram bucket holding the `q` quantile."""
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= rank:
+                return _MIN_SECONDS * 2 ** ((bucket + 1) / _BUCKETS_PER_OCTAVE)
+        return 0.0
+
+
+class PipelineStats:
+    """Per-stage statistics of a conversion, aggregated from worker samples and parent-side timings."""
+
+    def __init__(self):
+        self.stages: Dict[str, StageStats] = {}
+        self.memory = StageStats()  # peak memory of the examples, in bytes instead of seconds
+        self.largest_examples: List[Tuple[int, ExampleMemory]] = []  # min-heap by peak memory
+
+    def add(self, name: str, seconds: float, num_bytes: int = 0) -> None:
+        self.stages.setdefault(name, StageStats()).add(seconds, num_bytes)
+
+    def add_sample(self, sample: Sample) -> None:
+        for name, value in sample.items():
+            if name == MEMORY_KEY:
+                self.add_memory(value)
+            else:
+                self.add(name, *value)
+
+    def add_memory(self, memory: ExampleMemory) -> None:
+        self.memory.add(memory.peak_bytes)
+        self._keep_if_largest(memory)
+
+    def merge(self, other: "PipelineStats") -> None:
+        for name, stats in other.stages.items():
+            self.stages.setdefault(name, StageStats()).merge(stats)
+        self.memory.merge(other.memory)
+        for _, memory in other.largest_examples:
+            self._keep_if_largest(memory)
+
+    def _keep_if_largest(self, memory: ExampleMemory) -> None:
+        if len(self.largest_examples) < MEMORY_REPORT_SIZE:
+            heapq.heappush(self.largest_examples, (memory.peak_bytes, memory))
+        elif memory.peak_bytes > self.largest_examples[0][0]:
+            heapq.heapreplace(self.largest_examples, (memory.peak_bytes, memory))
+
+    @contextlib.contextmanager
+    def time(self, name: str) -> Iterator[None]:
+        """Records the time spent in the block as one occurrence of stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def summary(self, wall_seconds: float, num_examples: int, num_bytes: int) -> Dict[str, Any]:
+        return {
+            "wall_seconds": wall_seconds,
+            "num_examples": num_examples,
+            "num_bytes": num_bytes,
+            "examples_per_second": num_examples / wall_seconds if wall_seconds else 0.0,
+            "mb_per_second": num_bytes / 1e6 / wall_seconds if wall_seconds else 0.0,
+            "stages": {
+                name: {
+                    "count": stats.count,
+                    "total_seconds": stats.seconds,
+                    "mean_seconds": stats.seconds / stats.count,
+                    **{f"p{round(q * 100)}_seconds": stats.quantile(q) for q in QUANTILES},
+                    "bytes": stats.num_bytes,
+                    "mb_per_second": stats.num_bytes / 1e6 / stats.seconds if stats.seconds else 0.0,
+                }
+                for name, stats in sorted(self.stages.items())
+            },
+        }
+
+    def write(self, directory: str, wall_seconds: float, num_examples: int, num_bytes: int) -> Dict[str, Any]:
+        """Writes the summary as JSON and in Prometheus text format to `directory` and returns it."""
+        summary = self.summary(wall_seconds, num_examples, num_bytes)
+        with open(os.path.join(directory, STATS_FILENAME), "w") as f:
+            json.dump(summary, f, indent=2)
+        with open(os.path.join(directory, PROMETHEUS_FILENAME), "w") as f:
+            f.write(_to_prometheus(summary))
+        return summary
+
+    def memory_report(self) -> Optional[Dict[str, Any]]:
+        """Distribution of the per-example memory peaks and the examples with the highest ones, if measured."""
+        if not self.memory.count:
+            return None
+        return {
+            "num_examples": self.memory.count,
+            "mean_peak_bytes": self.memory.seconds / self.memory.count,
+            **{f"p{round(q * 100)}_peak_bytes": int(self.memory.quantile(q)) for q in QUANTILES},
+            "largest_examples": [
+                memory._asdict() for _, memory in sorted(self.largest_examples, reverse=True)
+            ],
+        }
+
+    def write_memory_report(self, directory: str) -> Optional[Dict[str, Any]]:
+        """Writes `memory_report` as JSON to `directory` and returns it, if memory was measured."""
+        report = self.memory_report()
+        if report is not None:
+            with open(os.path.join(directory, MEMORY_REPORT_FILENAME), "w") as f:
+                json.dump(report, f, indent=2)
+        return report
+
+
+def _to_prometheus(summary: Dict[str, Any]) -> str:
+    lines = [
+        "# HELP rlds_stage_seconds Time spent on one example in a pipeline stage.",
+        "# TYPE rlds_stage_seconds summary",
+    ]
+    for name, stats in summary["stages"].items():
+        for q in QUANTILES:
+            lines.append(
+                f'rlds_stage_seconds{{stage="{name}",quantile="{q}"}} '
+                f'{stats[f"p{round(q * 100)}_seconds"]}'
+            )
+        lines.append(f'rlds_stage_seconds_sum{{stage="{name}"}} {stats["total_seconds"]}')
+        lines.append(f'rlds_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+    lines += [
+        "# HELP rlds_stage_bytes_total Bytes handled by a pipeline stage.",
+        "# TYPE rlds_stage_bytes_total counter",
+    ]
+    for name, stats in summary["stages"].items():
+        lines.append(f'rlds_stage_bytes_total{{stage="{name}"}} {stats["bytes"]}')
+    lines += [
+        "# HELP rlds_examples_per_second Examples converted per second of wall time.",
+        "# TYPE rlds_examples_per_second gauge",
+        f"rlds_examples_per_second {summary['examples_per_second']}",
+        "# HELP rlds_megabytes_per_second Serialized megabytes written per second of wall time.",
+        "# TYPE rlds_megabytes_per_second gauge",
+        f"rlds_megabytes_per_second {summary['mb_per_second']}",
+    ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,186 @@
+"""Low-overhead profiling of a conversion across the parent and all worker processes.
+
+Every process calls `start(directory, name)` once. A background thread then samples the stacks of the
+threads inside a `sampled()` block every `interval` seconds and periodically writes the counts to
+`<directory>/<name>.collapsed`, in the collapsed-stack format of flamegraph.pl and speedscope. `example()`
+additionally runs cProfile around every `cprofile_every`-th example of the process and writes the
+accumulated stats to `<directory>/<name>.prof`. Sampling costs about one stack walk per interval, and
+cProfile only slows down the fraction of examples it profiles, so both can stay on for a full build.
+`merge` combines the files of all processes into one of each.
+"""
+
+import collections
+import contextlib
+import cProfile
+import glob
+import os
+import pstats
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+COLLAPSED_FILENAME = "profile.collapsed"
+PSTATS_FILENAME = "profile.prof"
+FLUSH_INTERVAL = 2.0  # seconds between two writes of the sampled stacks of a busy process
+IDLE_FLUSH_INTERVAL = 0.1  # same once no thread is sampled, so idle workers are up to date when killed
+
+# profiler of this process, set by `start`
+_profiler: Optional["Profiler"] = None
+
+
+class Profiler:
+    """Stack sampler and cProfile of one process, see the module docstring."""
+
+    def __init__(self, directory: str, name: str, interval: float = 0.01, cprofile_every: int = 0):
+        self.interval = interval
+        self.cprofile_every = cprofile_every
+        self._collapsed_path = os.path.join(directory, f"{name}.collapsed")
+        self._pstats_path = os.path.join(directory, f"{name}.prof")
+        self._threads: Dict[int, str] = {}  # ident -> label of the threads being sampled
+        self._counts: Dict[str, int] = collections.Counter()
+        self._dirty = False
+        self._num_examples = 0
+        self._cprofile = cProfile.Profile()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rlds-profiler", daemon=True)
+        self._thread.start()
+
+    @contextlib.contextmanager
+    def sampled(self, label: str = "") -> Iterator[None]:
+        ident = threading.get_ident()
+        self._threads[ident] = label
+        try:
+            yield
+        finally:
+            self._threads.pop(ident, None)
+
+    @contextlib.contextmanager
+    def example(self, label: str = "") -> Iterator[None]:
+        self._num_examples += 1
+        profile = self.cprofile_every > 0 and self._num_examples % self.cprofile_every == 0
+        with self.sampled(label):
+            if not profile:
+                yield
+                return
+            self._cprofile.enable()
+            try:
+                yield
+            finally:
+                self._cprofile.disable()
+                _atomic_write(self._pstats_path, self._cprofile.dump_stats)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._flush()
+
+    def _run(self) -> None:
+        last_flush = time.monotonic()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, label in list(self._threads.items()):
+                frame = frames.get(ident)
+                if frame is not None:
+                    self._counts[_collapse(frame, label)] += 1
+                    self._dirty = True
+            since_flush = time.monotonic() - last_flush
+            if since_flush >= FLUSH_INTERVAL or (not self._threads and since_flush >= IDLE_FLUSH_INTERVAL):
+                self._flush()
+                last_flush = time.monotonic()
+
+    def _flush(self) -> None:
+        if not self._dirty:
+            return
+        self._dirty = False
+        lines = [f"{stack} {count}\n" for stack, count in list(self._counts.items())]
+        _atomic_write(self._collapsed_path, lambda path: _write_lines(path, lines))
+
+
+def start(directory: str, name: str, interval: float = 0.01, cprofile_every: int = 0) -> None:
+    """Starts profiling this process, replacing a profiler inherited from a forked parent."""
+    global _profiler
+    os.makedirs(directory, exist_ok=True)
+    _profiler = Profiler(directory, name, interval, cprofile_every)
+
+
+def stop() -> None:
+    """Stops profiling this process and writes the remaining samples."""
+    global _profiler
+    if _profiler is not None:
+        _profiler.stop()
+        _profiler = None
+
+
+def reset() -> None:
+    """Forgets a profiler inherited from a forked parent without stopping it, its thread was not forked."""
+    global _profiler
+    _profiler = None
+
+
+@contextlib.contextmanager
+def sampled(label: str = "") -> Iterator[None]:
+    """Samples the stacks of the calling thread during the block, prefixed with `label`, if profiling."""
+    if _profiler is None:
+        yield
+    else:
+        with _profiler.sampled(label):
+            yield
+
+
+@contextlib.contextmanager
+def example(label: str = "") -> Iterator[None]:
+    """Profiles the processing of one example by the calling thread, see the module docstring."""
+    if _profiler is None:
+        yield
+    else:
+        with _profiler.example(label):
+            yield
+
+
+def merge(directory: str, output_dir: str, top: int = 10) -> Tuple[int, List[Tuple[str, float]]]:
+    """Combines the profiles of all processes in `directory` into `COLLAPSED_FILENAME` and `PSTATS_FILENAME`
+    in `output_dir`. Returns the number of samples and the `top` functions with the largest share of them.
+    """
+    counts = collections.Counter()
+    leaves = collections.Counter()
+    for path in glob.glob(os.path.join(directory, "*.collapsed")):
+        with open(path) as f:
+            for line in f:
+                stack, count = line.rstrip("\n").rsplit(" ", 1)
+                counts[stack] += int(count)
+                leaves[stack.rsplit(";", 1)[-1]] += int(count)
+    _write_lines(
+        os.path.join(output_dir, COLLAPSED_FILENAME),
+        [f"{stack} {count}\n" for stack, count in sorted(counts.items())],
+    )
+    pstats_paths = sorted(glob.glob(os.path.join(directory, "*.prof")))
+    if pstats_paths:
+        pstats.Stats(*pstats_paths).dump_stats(os.path.join(output_dir, PSTATS_FILENAME))
+    num_samples = sum(counts.values())
+    return num_samples, [
+        (function, count / num_samples) for function, count in leaves.most_common(top)
+    ]
+
+
+def _collapse(frame, label: str) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    if label:
+        names.append(label)
+    return ";".join(reversed(names))
+
+
+def _write_lines(path: str, lines: List[str]) -> None:
+    with open(path, "w") as f:
+        f.writelines(lines)
+
+
+def _atomic_write(path: str, write_fn) -> None:
+    """Writes through a temporary file, so a process killed mid-write leaves the previous version."""
+    tmp_path = f"{path}.tmp"
+    write_fn(tmp_path)
+    os.replace(tmp_path, path)
@@ -0,0 +1,218 @@
+"""Concurrent reads of the files of the current and the next example within a worker.
+
+Reading the frames of a trajectory one after another costs a round trip per file on a network file system,
+which adds up to seconds for a few hundred small files. A `Readahead` lists the files of an example with the
+builder's `_example_files` and reads them from a small pool of threads as soon as the worker starts the
+example, and the worker takes them with `read_file` in whatever order it needs them. A file nobody started to
+read yet is read by the worker itself, so the worker never waits behind the queue of the pool.
+
+While the worker decodes and encodes, the pool goes on with the next example. If the same worker processes
+it, its files are listed and read into memory like those of the current example. For an example another
+worker processes, the listing would not be shared with that worker, so the pool only has the kernel read the
+files the parent already knows of into the page cache with `posix_fadvise`, where the other worker finds
+them. At most `per_mount` of the threads read from the same file system at once.
+
+A read of a hung mount blocks its thread and keeps its slot until the read returns. So a thread waits at most
+`slot_timeout` for a slot and otherwise leaves the read to the worker, which is subject to its own deadline,
+and a worker that gives up on an example calls `abandon` to cancel the reads that did not start yet.
+"""
+
+import contextlib
+import functools
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+ExampleRef = Tuple[Hashable, Any]  # key and input of an example
+
+# readahead of this process, set by `configure`
+_readahead: Optional["Readahead"] = None
+
+
+class _Example:
+    def __init__(self):
+        self.listing: Optional[Future] = None  # the files of the example
+        self.reads: List[Future] = []
+
+
+class Readahead:
+    """Pool of threads reading the files of the current and the next example, see the module docstring."""
+
+    def __init__(
+        self,
+        files_fn: Callable[[Any], Sequence[str]],
+        num_threads: int,
+        per_mount: Optional[int] = None,
+        slot_timeout: Optional[float] = None,
+    ):
+        self._files_fn = files_fn
+        self._per_mount = per_mount or num_threads
+        self._slot_timeout = slot_timeout  # seconds; None waits for a slot as long as it takes
+        self._executor = ThreadPoolExecutor(num_threads, thread_name_prefix="rlds-readahead")
+        self._examples: Dict[Hashable, _Example] = {}
+        self._files: Dict[str, Future] = {}  # reads not taken by `read` yet
+        self._advised: List[Future] = []  # files read into the page cache for another worker
+        self._slots: Dict[int, threading.BoundedSemaphore] = {}  # by device of the file system
+        self._lock = threading.Lock()
+
+    def start(
+        self, current: ExampleRef, upcoming: Optional[ExampleRef] = None, advised: Sequence[str] = ()
+    ) -> None:
+        """Reads the files of `current`, and after them those of `upcoming`, and has the `advised` files of
+        an example another worker processes read into the page cache. Forgets the files of any other example.
+        Returns once the files of `current` are listed, raising the error of the listing if there was one.
+        """
+        key, example_input = current
+        wanted = {key} if upcoming is None else {key, upcoming[0]}
+        with self._lock:
+            for other in set(self._examples) - wanted:
+                self._drop(other)
+            for future in self._advised:
+                future.cancel()
+            self._advised = []
+            example = self._examples.get(key)
+        if example is not None and example.listing.exception() is None:
+            paths = example.listing.result()
+        else:
+            paths = list(self._files_fn(example_input))
+            example = _Example()
+            example.listing = Future()
+            example.listing.set_result(paths)
+            with self._lock:
+                self._examples[key] = example
+        with self._lock:
+            # files read by an earlier attempt at the example are read again
+            self._submit_reads(example, paths)
+            if upcoming is not None and upcoming[0] not in self._examples:
+                ahead = self._examples[upcoming[0]] = _Example()
+                ahead.listing = self._executor.submit(self._list_ahead, upcoming)
+            if hasattr(os, "posix_fadvise"):
+                self._advised = [self._executor.submit(self._advise, path) for path in advised]
+
+    def read(self, path: str) -> bytes:
+        """Returns the contents of the file at `path`, waiting for its read if it was started."""
+        with self._lock:
+            future = self._files.pop(path, None)
+        if future is None or future.cancel():
+            return _read(path)
+        data = future.result()
+        return _read(path) if data is None else data
+
+    def abandon(self) -> None:
+        """Cancels the reads and listings that did not start yet and forgets every example, e.g. once the
+        worker gave up on an example whose reads hang. A thread stuck in a read stays so until it returns.
+        """
+        with self._lock:
+            for example in self._examples.values():
+                example.listing.cancel()
+            for key in list(self._examples):
+                self._drop(key)
+            for future in self._advised:
+                future.cancel()
+            self._advised = []
+
+    def _list_ahead(self, upcoming: ExampleRef) -> List[str]:
+        key, example_input = upcoming
+        paths = list(self._files_fn(example_input))
+        with self._lock:
+            example = self._examples.get(key)  # None if dropped in the meantime
+            if example is not None:
+                self._submit_reads(example, paths)
+        return paths
+
+    def _submit_reads(self, example: _Example, paths: Sequence[str]) -> None:
+        for path in paths:
+            if path not in self._files:
+                self._files[path] = self._executor.submit(self._read_file, path)
+                example.reads.append(self._files[path])
+
+    def _drop(self, key: Hashable) -> None:
+        example = self._examples.pop(key)
+        reads = set(example.reads)
+        for future in reads:
+            future.cancel()
+        for path in [path for path, future in self._files.items() if future in reads]:
+            del self._files[path]
+
+    def _read_file(self, path: str) -> Optional[bytes]:
+        """Returns the contents of the file, or None if no slot was free within the timeout."""
+        with self._slot(path) as acquired:
+            return _read(path) if acquired else None
+
+    def _advise(self, path: str) -> None:
+        with self._slot(path) as acquired:
+            if not acquired:
+                return
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                return  # only a hint, the file may not exist under the name the parent expects
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+
+    @contextlib.contextmanager
+    def _slot(self, path: str) -> Iterator[bool]:
+        """Holds one of the slots of the file system of `path` in the block, if one was free within the
+        timeout. Yields whether it was.
+        """
+        device = _device(os.path.dirname(path))
+        with self._lock:
+            if device not in self._slots:
+                self._slots[device] = threading.BoundedSemaphore(self._per_mount)
+            slots = self._slots[device]
+        if not slots.acquire(timeout=self._slot_timeout):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            slots.release()
+
+
+def configure(
+    files_fn: Callable[[Any], Sequence[str]],
+    num_threads: int,
+    per_mount: Optional[int] = None,
+    slot_timeout: Optional[float] = None,
+) -> None:
+    """Reads ahead the files `files_fn` lists for the examples of this process from `num_threads` threads."""
+    global _readahead
+    _readahead = Readahead(files_fn, num_threads, per_mount, slot_timeout)
+
+
+def reset() -> None:
+    """Forgets a readahead inherited from a forked parent, its threads were not forked."""
+    global _readahead
+    _readahead = None
+
+
+def start(current: ExampleRef, upcoming: Optional[ExampleRef] = None, advised: Sequence[str] = ()) -> None:
+    """Starts reading the files of the example this process is about to process, see `Readahead.start`."""
+    if _readahead is not None:
+        _readahead.start(current, upcoming, advised)
+
+
+def abandon() -> None:
+    """Cancels the pending reads of this process, see `Readahead.abandon`."""
+    if _readahead is not None:
+        _readahead.abandon()
+
+
+def read_file(path: str) -> bytes:
+    """Returns the contents of the file at `path`, read ahead if this process reads ahead."""
+    if _readahead is None:
+        return _read(path)
+    return _readahead.read(path)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@functools.lru_cache(maxsize=1024)
+def _device(directory: str) -> int:
+    return os.stat(directory).st_dev
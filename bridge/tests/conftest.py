@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the builder modules are imported by their flat names, like the dataset builders in this directory do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
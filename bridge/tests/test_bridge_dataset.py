@@ -0,0 +1,37 @@
+import os
+
+import pytest
+import tensorflow_datasets as tfds
+
+from benchmarks.readahead_benchmark import write_trajectories
+from bridge_dataset import bridge_dataset_dataset_builder
+from bridge_dataset.bridge_dataset_dataset_builder import DEPTH, BridgeDataset
+
+NUM_TRAJECTORIES = 6
+
+
+@pytest.fixture
+def manual_dir(tmp_path):
+    root = os.path.join(tmp_path, "raw", *[f"level{i}" for i in range(DEPTH - 1)])
+    write_trajectories(root, NUM_TRAJECTORIES, num_steps=4, num_views=2)
+    return os.path.join(tmp_path, "raw")
+
+
+def test_streaming_build_lists_every_trajectory_once(tmp_path, monkeypatch, manual_dir):
+    monkeypatch.setattr(BridgeDataset, "NUM_WORKERS", 2)
+    listings_path = os.path.join(tmp_path, "listings")
+    list_frames = bridge_dataset_dataset_builder.list_frames
+
+    def logged_list_frames(path):
+        # appended by the forked workers as well
+        with open(listings_path, "a") as f:
+            f.write(f"{path}\n")
+        return list_frames(path)
+
+    monkeypatch.setattr(bridge_dataset_dataset_builder, "list_frames", logged_list_frames)
+    builder = BridgeDataset(data_dir=os.path.join(tmp_path, "data"))
+    builder.download_and_prepare(download_config=tfds.download.DownloadConfig(manual_dir=manual_dir))
+    with open(listings_path) as f:
+        listings = f.read().split()
+    assert len(listings) == len(set(listings)) == NUM_TRAJECTORIES
+    assert sum(split.num_examples for split in builder.info.splits.values()) == NUM_TRAJECTORIES
@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+from toy_dataset.toy_dataset_dataset_builder import ToyDataset, attempts, build, read
+
+
+@pytest.mark.parametrize("attrs", [{}, {"STREAMING": True}])
+def test_resumed_build_skips_the_journaled_examples(tmp_path, monkeypatch, attrs):
+    for name, value in {"CHECKPOINT": True, "CHECKPOINT_INTERVAL": 4, **attrs}.items():
+        monkeypatch.setattr(ToyDataset, name, value)
+    log_path = os.path.join(tmp_path, "attempts")
+    monkeypatch.setattr(ToyDataset, "LOG_PATH", log_path)
+    monkeypatch.setattr(ToyDataset, "FAILING", (30,))
+    with pytest.raises(RuntimeError, match="Cannot process 30"):
+        build(str(tmp_path / "data"))
+    assert os.path.isdir(tmp_path / "data" / "toy_dataset" / "1.0.0.checkpoint")
+    num_interrupted = len(attempts(log_path))
+
+    monkeypatch.setattr(ToyDataset, "FAILING", ())
+    keys = read(build(str(tmp_path / "data")))
+    resumed = attempts(log_path)[num_interrupted:]
+    assert sorted(keys["train"]) == [f"ep_{i:03d}" for i in range(40)]
+    assert sorted(keys["val"]) == [f"ep_{i:03d}" for i in range(100, 110)]
+    assert len(resumed) < 50  # the examples journaled before the failure are not processed again
+    assert 30 in resumed
+    assert not os.path.exists(tmp_path / "data" / "toy_dataset" / "1.0.0.checkpoint")
@@ -0,0 +1,37 @@
+import json
+import os
+
+import pytest
+
+from toy_dataset.toy_dataset_dataset_builder import ToyDataset, attempts, build, read
+
+
+@pytest.mark.parametrize("attrs", [{}, {"STREAMING": True}, {"WORKER_SHARDS": 3}])
+def test_failing_examples_are_retried_and_quarantined(tmp_path, monkeypatch, attrs):
+    log_path = os.path.join(tmp_path, "attempts")
+    for name, value in {
+        "QUARANTINE": True,
+        "MAX_RETRIES": 1,
+        "FAILING": (7, 104),
+        "FLAKY": (3, 20),
+        "LOG_PATH": log_path,
+        **attrs,
+    }.items():
+        monkeypatch.setattr(ToyDataset, name, value)
+    builder = build(str(tmp_path / "data"))
+    keys = read(builder)
+    assert sorted(keys["train"]) == [f"ep_{i:03d}" for i in range(40) if i != 7]
+    assert sorted(keys["val"]) == [f"ep_{i:03d}" for i in range(100, 110) if i != 104]
+    with open(os.path.join(builder.data_path, "quarantine.jsonl")) as f:
+        quarantined = [json.loads(line) for line in f]
+    assert sorted(entry["key"] for entry in quarantined) == ["ep_007", "ep_104"]
+    assert all(entry["attempts"] == 2 for entry in quarantined)
+    logged = attempts(log_path)
+    assert [logged.count(i) for i in (3, 7, 20, 104, 21)] == [2, 2, 2, 2, 1]
+
+
+def test_failing_example_raises_without_quarantine(tmp_path, monkeypatch):
+    monkeypatch.setattr(ToyDataset, "MAX_RETRIES", 1)
+    monkeypatch.setattr(ToyDataset, "FAILING", (7,))
+    with pytest.raises(RuntimeError, match="Cannot process 7"):
+        build(str(tmp_path))
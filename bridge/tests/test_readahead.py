@@ -0,0 +1,80 @@
+import collections
+import os
+import threading
+
+import readahead
+
+
+def write_examples(root, keys, num_files=4):
+    for key in keys:
+        os.makedirs(os.path.join(root, key))
+        for i in range(num_files):
+            with open(os.path.join(root, key, f"{i}.bin"), "wb") as f:
+                f.write(f"{key}-{i}".encode())
+
+
+def test_every_example_is_listed_once_and_read_back(tmp_path):
+    write_examples(str(tmp_path), ["a", "b", "c"])
+    listings = collections.Counter()
+
+    def files_fn(key):
+        listings[key] += 1
+        return sorted(os.path.join(tmp_path, key, name) for name in os.listdir(os.path.join(tmp_path, key)))
+
+    pool = readahead.Readahead(files_fn, num_threads=2)
+    for current, upcoming in [("a", "b"), ("b", "c"), ("c", None)]:
+        pool.start((current, current), None if upcoming is None else (upcoming, upcoming))
+        for i in range(4):
+            assert pool.read(os.path.join(tmp_path, current, f"{i}.bin")) == f"{current}-{i}".encode()
+    assert listings == {"a": 1, "b": 1, "c": 1}
+
+
+def test_advised_files_are_not_listed(tmp_path):
+    write_examples(str(tmp_path), ["a", "b"])
+    listings = collections.Counter()
+
+    def files_fn(key):
+        listings[key] += 1
+        return [os.path.join(tmp_path, key, f"{i}.bin") for i in range(4)]
+
+    pool = readahead.Readahead(files_fn, num_threads=2)
+    advised = [os.path.join(tmp_path, "b", f"{i}.bin") for i in range(6)]  # two of them do not exist
+    pool.start(("a", "a"), advised=advised)
+    assert pool.read(os.path.join(tmp_path, "a", "0.bin")) == b"a-0"
+    pool.start(("b", "b"))
+    assert pool.read(os.path.join(tmp_path, "b", "3.bin")) == b"b-3"
+    assert listings == {"a": 1, "b": 1}
+
+
+def test_a_hung_read_does_not_hold_up_other_reads(tmp_path, monkeypatch):
+    write_examples(str(tmp_path), ["a", "b"])
+    hung_path = os.path.join(tmp_path, "a", "0.bin")
+    hung = threading.Event()
+    released = threading.Event()
+    read = readahead._read
+
+    def hanging_read(path):
+        if path == hung_path:
+            hung.set()
+            released.wait()
+        return read(path)
+
+    monkeypatch.setattr(readahead, "_read", hanging_read)
+    pool = readahead.Readahead(
+        lambda key: [os.path.join(tmp_path, key, f"{i}.bin") for i in range(4)],
+        num_threads=2,
+        per_mount=1,
+        slot_timeout=0.1,
+    )
+    try:
+        pool.start(("a", "a"))
+        assert hung.wait(5)
+        # the other thread gives up on the slot held by the hung read and the file is read by the caller
+        assert pool.read(os.path.join(tmp_path, "a", "1.bin")) == b"a-1"
+        pool.abandon()
+        pool.start(("b", "b"))
+        assert [pool.read(os.path.join(tmp_path, "b", f"{i}.bin")) for i in range(4)] == [
+            f"b-{i}".encode() for i in range(4)
+        ]
+    finally:
+        released.set()
@@ -0,0 +1,28 @@
+import pytest
+import tensorflow_datasets as tfds
+
+from toy_dataset.toy_dataset_dataset_builder import ToyDataset, build
+
+
+def examples(builder: ToyDataset):
+    """Returns the examples of every split as sorted (key, actions) pairs."""
+    return {
+        split_name: sorted(
+            (
+                example["episode_metadata"]["file_path"].decode(),
+                b"".join(step["action"].tobytes() for step in example["steps"]),
+            )
+            for example in tfds.as_numpy(builder.as_dataset(split=split_name))
+        )
+        for split_name in builder.info.splits
+    }
+
+
+@pytest.mark.parametrize("attrs", [{"WORKER_SHARDS": 3}, {"DIRECT_SHARDS": 3}])
+def test_sharded_writes_hold_the_examples_of_the_default_path(tmp_path, monkeypatch, attrs):
+    expected = examples(build(str(tmp_path / "default")))
+    for name, value in attrs.items():
+        monkeypatch.setattr(ToyDataset, name, value)
+    builder = build(str(tmp_path / "sharded"))
+    assert examples(builder) == expected
+    assert all(split.num_shards == 3 for split in builder.info.splits.values())
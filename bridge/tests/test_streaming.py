@@ -0,0 +1,55 @@
+import json
+import os
+
+import pytest
+
+import pipeline_stats
+from toy_dataset.toy_dataset_dataset_builder import ToyDataset, build, read
+
+KEYS = {
+    "train": [f"ep_{i:03d}" for i in ToyDataset.SPLITS["train"]],
+    "val": [f"ep_{i:03d}" for i in ToyDataset.SPLITS["val"]],
+}
+# the mean serialized size of an example is about 200 bytes
+INFLIGHT_BYTES = 500
+
+
+@pytest.mark.parametrize("disable_shuffling", [False, True])
+@pytest.mark.parametrize(
+    "attrs",
+    [
+        {"STREAMING": True, "MAX_INFLIGHT": 3},
+        {"MAX_INFLIGHT_BYTES": INFLIGHT_BYTES},
+        {"MEMORY_CEILING": 2**20, "MAX_INFLIGHT_BYTES": INFLIGHT_BYTES},
+        {"AUTOTUNE": True},
+        {"DIRECT_SHARDS": 2, "MEMORY_CEILING": 2**20, "MAX_INFLIGHT_BYTES": INFLIGHT_BYTES},
+    ],
+)
+def test_streaming_writes_every_example(tmp_path, monkeypatch, attrs, disable_shuffling):
+    monkeypatch.setattr(ToyDataset, "DISABLE_SHUFFLING", disable_shuffling)
+    # consecutive large examples, so the second one waits for the lane while small ones finish after it
+    monkeypatch.setattr(ToyDataset, "LARGE", (0, 1, 2, 20, 21, 101, 102))
+    for name, value in attrs.items():
+        monkeypatch.setattr(ToyDataset, name, value)
+    written = read(build(str(tmp_path)))
+    if disable_shuffling:
+        assert written == KEYS
+    else:
+        assert {split_name: sorted(keys) for split_name, keys in written.items()} == {
+            split_name: sorted(keys) for split_name, keys in KEYS.items()
+        }
+
+
+@pytest.mark.parametrize("attrs", [{"MEMORY_CEILING": 2**20}, {"WORKER_SHARDS": 2}, {}])
+def test_memory_report_holds_the_estimates_of_the_parent(tmp_path, monkeypatch, attrs):
+    monkeypatch.setattr(ToyDataset, "TRACK_MEMORY", True)
+    monkeypatch.setattr(ToyDataset, "LARGE", (0, 1, 2))
+    for name, value in attrs.items():
+        monkeypatch.setattr(ToyDataset, name, value)
+    builder = build(str(tmp_path))
+    with open(os.path.join(builder.data_dir, pipeline_stats.MEMORY_REPORT_FILENAME)) as f:
+        report = json.load(f)
+    assert report["largest_examples"]
+    for example in report["largest_examples"]:
+        large = int(example["key"][len("ep_") :]) in ToyDataset.LARGE
+        assert example["estimated_bytes"] == (2**30 if large else 2**10)
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+# run in a fresh interpreter, the TensorFlow of the test process may have started already
+SCRIPT = """
+import sys
+import tensorflow as tf
+from toy_dataset.toy_dataset_dataset_builder import ToyDataset, build
+
+process_example = ToyDataset._process_example.__func__
+split_generators = ToyDataset._split_generators
+
+
+def limited_process_example(cls, example_input):
+    assert tf.config.threading.get_intra_op_parallelism_threads() == 1
+    assert tf.config.threading.get_inter_op_parallelism_threads() == 1
+    return process_example(cls, example_input)
+
+
+def split_generators_using_tf(self, dl_manager):
+    tf.constant(0) + 1  # starts TensorFlow in the parent before the workers are forked, like INCREMENTAL does
+    return split_generators(self, dl_manager)
+
+
+ToyDataset.START_METHOD = "fork"
+ToyDataset.WORKER_THREADS = 1
+ToyDataset._process_example = classmethod(limited_process_example)
+ToyDataset._split_generators = split_generators_using_tf
+build(sys.argv[1])
+"""
+
+
+def test_forked_workers_limit_tensorflow_threads_after_the_parent_used_it(tmp_path):
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT, str(tmp_path)],
+        cwd=tests_dir,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join([tests_dir, os.path.dirname(tests_dir)])},
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    assert result.returncode == 0, result.stderr
+    assert "the parent used TensorFlow" not in result.stderr
@@ -0,0 +1,22 @@
+import logging
+import re
+
+import pytest
+
+from toy_dataset.toy_dataset_dataset_builder import ToyDataset, build
+
+WRITE_PATHS = [{}, {"STREAMING": True}, {"WORKER_SHARDS": 3}, {"DIRECT_SHARDS": 3}]
+
+
+@pytest.mark.parametrize("attrs", WRITE_PATHS)
+def test_peak_parent_memory_is_logged_per_split(tmp_path, monkeypatch, caplog, attrs):
+    for name, value in attrs.items():
+        monkeypatch.setattr(ToyDataset, name, value)
+    with caplog.at_level(logging.INFO):
+        build(str(tmp_path))
+    peaks = [
+        re.fullmatch(r"Peak parent memory while generating (\w+): [\d.]+ MiB\.", message)
+        for message in caplog.messages
+        if message.startswith("Peak parent memory")
+    ]
+    assert sorted(peak.group(1) for peak in peaks) == ["train", "val"]
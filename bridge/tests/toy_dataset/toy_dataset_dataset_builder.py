@@ -0,0 +1,102 @@
+"""Small synthetic dataset for the tests of `MultiThreadedDatasetBuilder`.
+
+Example `i` is an episode of `3 + i % 5` steps keyed `ep_00i`, its input is the integer `i`. The
+tests set the class attributes with `monkeypatch`, which forked workers inherit. Every attempt at an input is
+appended to the file at `LOG_PATH`, if set, which the workers share.
+"""
+
+import os
+import threading
+from typing import Dict, List
+
+import numpy as np
+import tensorflow_datasets as tfds
+
+from dataset_builder import MultiThreadedDatasetBuilder
+
+
+class ToyDataset(MultiThreadedDatasetBuilder):
+    VERSION = tfds.core.Version("1.0.0")
+    NUM_WORKERS = 2
+    CHUNKSIZE = 8
+
+    DISABLE_SHUFFLING = False
+    SPLITS = {"train": range(40), "val": range(100, 110)}
+    FAILING = ()  # inputs whose processing raises
+    FLAKY = ()  # inputs whose processing raises on the first attempt, requires LOG_PATH
+    LOG_PATH = None
+    LARGE = ()  # inputs estimated above any MEMORY_CEILING
+
+    def _info(self) -> tfds.core.DatasetInfo:
+        return self.dataset_info_from_configs(
+            features=tfds.features.FeaturesDict(
+                {
+                    "steps": tfds.features.Dataset({"action": tfds.features.Tensor(shape=(7,), dtype=np.float32)}),
+                    "episode_metadata": tfds.features.FeaturesDict({"file_path": tfds.features.Text()}),
+                }
+            ),
+            disable_shuffling=self.DISABLE_SHUFFLING,
+        )
+
+    @classmethod
+    def _example_key(cls, example_input):
+        return f"ep_{example_input:03d}"
+
+    @classmethod
+    def _process_example(cls, example_input):
+        if cls.LOG_PATH is not None:
+            attempt = attempts(cls.LOG_PATH).count(example_input) + 1
+            with open(cls.LOG_PATH, "a") as f:
+                f.write(f"{example_input}\n")
+            if example_input in cls.FLAKY and attempt == 1:
+                raise RuntimeError(f"Cannot process {example_input} on the first attempt.")
+        if example_input in cls.FAILING:
+            raise RuntimeError(f"Cannot process {example_input}.")
+        key = cls._example_key(example_input)
+        steps = [{"action": np.full(7, example_input, np.float32)} for _ in range(3 + example_input % 5)]
+        return key, {"steps": steps, "episode_metadata": {"file_path": key}}
+
+    def _estimate_example_memory(self, example_input):
+        return 2**30 if example_input in self.LARGE else 2**10
+
+    def _split_generators(self, dl_manager):
+        return {split_name: iter(inputs) for split_name, inputs in self.SPLITS.items()}
+
+
+def build(data_dir: str, timeout: float = 60.0) -> ToyDataset:
+    """Builds the dataset in a thread and returns the builder, failing the test if it takes over `timeout`."""
+    builder = ToyDataset(data_dir=data_dir)
+    errors = []
+
+    def prepare():
+        try:
+            builder.download_and_prepare()
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=prepare, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), f"The build did not finish within {timeout}s."
+    if errors:
+        raise errors[0]
+    return builder
+
+
+def attempts(log_path: str) -> List[int]:
+    """Returns the inputs attempted so far, in order, with one entry per attempt."""
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path) as f:
+        return [int(line) for line in f]
+
+
+def read(builder: ToyDataset) -> Dict[str, List[str]]:
+    """Returns the keys of the examples of every split, in the order they were written."""
+    return {
+        split_name: [
+            example["episode_metadata"]["file_path"].numpy().decode()
+            for example in builder.as_dataset(split=split_name)
+        ]
+        for split_name in builder.info.splits
+    }
@@ -0,0 +1,246 @@
+"""Cached discovery of the trajectories in a Bridge-style raw data directory.
+
+The raw data is laid out as `<root>/<depth levels>/<dated folder>/raw/traj_group*/traj*/`, with a
+`config.json` holding the camera topics in every dated folder and one directory of frames per camera in
+every trajectory. Finding the trajectories takes a listing of every one of these directories, which on a
+network file system is slow enough to dominate short builds.
+
+`TrajectoryManifest` lists the directories with `os.scandir` from a pool of threads, and records the tree in
+one gzipped JSON file together with the modification time of every directory. Adding or removing an entry of
+a directory updates its modification time, so a later scan only needs to `stat` a directory to know whether
+its recorded listing is still valid, and lists again only the directories that changed. Modification times
+within `RACY_SECONDS` of the scan are not recorded, since the directory may change again within the
+resolution of the clock.
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from absl import logging
+
+MANIFEST_FILENAME = "trajectory_manifest.json.gz"
+MANIFEST_VERSION = 1
+RACY_SECONDS = 2.0
+IMAGE_DIRS = tuple(f"images{i}" for i in range(4)) + ("depth_images0",)
+FRAME_PREFIX = "im_"
+
+
+class Trajectory(NamedTuple):
+    path: str
+    camera_topics: Optional[List[str]]  # from the `config.json` of the dated folder, if there is one
+    image_dirs: Tuple[str, ...]  # the directories of `IMAGE_DIRS` present in the trajectory
+    num_frames: int  # frames in the first image directory
+    mtime_ns: int
+
+
+# recorded directory: [modification time in ns or None if unknown, frames, {name: subdirectory}]
+_Node = List[Any]
+# directory being scanned: (path components below the root, its new node, its recorded node if any)
+_Entry = Tuple[Tuple[str, ...], _Node, Optional[_Node]]
+
+
+class TrajectoryManifest:
+    """Scans `root` for trajectories, reusing and updating the manifest at `path`, see the module docstring.
+
+    `depth` is the number of directory levels between `root` and the dated folders. Directories whose name
+    contains "cache", dated folders whose name contains "lmdb" and hidden directories are skipped.
+    """
+
+    def __init__(self, root: str, path: Optional[str], depth: int, num_threads: int = 32):
+        self.root = os.path.abspath(root)
+        self.path = path
+        self.depth = depth
+        self.num_threads = num_threads
+        self.num_listed = 0
+        self.num_reused = 0
+        self._lock = threading.Lock()
+        self._old_tree, self._old_configs = self._load()
+        self._tree: _Node = [None, 0, {}]
+        self._configs: Dict[str, Tuple[Optional[int], Optional[List[str]]]] = {}
+        self._scan_start_ns = 0
+
+    def trajectories(self) -> Iterator[Trajectory]:
+        """Yields the trajectories with at least one image directory, in sorted path order per dated folder.
+
+        The listing of a level is done in parallel, and the trajectories of a dated folder are yielded as
+        soon as their image directories are listed. `save` records the scan once it is complete.
+        """
+        self._scan_start_ns = time.time_ns()
+        start = time.perf_counter()
+        num_trajectories = 0
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            level = [((), self._tree, self._old_tree)]
+            for filter_fn in [self._is_data_dir] * self.depth + [self._is_dated_folder]:
+                list(executor.map(lambda entry: self._list(entry, filter_fn), level))
+                level = _children(level)
+            for dated in executor.map(self._list_dated_folder, level):
+                for trajectory in dated:
+                    num_trajectories += 1
+                    yield trajectory
+        logging.info(
+            "Found %d trajectories in %.1fs, listed %d directories and reused %d from the manifest.",
+            num_trajectories,
+            time.perf_counter() - start,
+            self.num_listed,
+            self.num_reused,
+        )
+
+    def save(self) -> None:
+        """Writes the manifest of the last complete scan."""
+        if self.path is None:
+            return
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "root": self.root,
+            "tree": self._tree,
+            "configs": self._configs,
+        }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with gzip.open(f"{self.path}.tmp", "wt") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def stamp(self, path: str) -> Optional[str]:
+        """Returns the modification times and frame counts of the trajectory at `path` and of its image
+        directories as found by the current scan, which change whenever frames are added, removed or renamed.
+        None if the scan did not find the trajectory.
+        """
+        node = self._node(path)
+        if node is None:
+            return None
+        children = {name: child[:2] for name, child in sorted(node[2].items())}
+        return json.dumps([node[0], node[1], children], separators=(",", ":"))
+
+    def frame_counts(self, path: str) -> Optional[Dict[str, int]]:
+        """Returns the number of frames in each image directory of the trajectory at `path` as found by the
+        current scan, or None if the scan did not find the trajectory.
+        """
+        node = self._node(path)
+        if node is None:
+            return None
+        return {name: child[1] for name, child in node[2].items()}
+
+    def _node(self, path: str) -> Optional[_Node]:
+        node = self._tree
+        for part in os.path.relpath(path, self.root).split(os.sep):
+            node = node[2].get(part)
+            if node is None:
+                return None
+        return node
+
+    def _load(self) -> Tuple[_Node, Dict[str, Any]]:
+        if self.path is None or not os.path.exists(self.path):
+            return [None, 0, {}], {}
+        try:
+            with gzip.open(self.path, "rt") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable trajectory manifest %s: %s", self.path, e)
+            return [None, 0, {}], {}
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("root") != self.root:
+            return [None, 0, {}], {}
+        return manifest["tree"], manifest["configs"]
+
+    def _list(self, entry: _Entry, filter_fn: Callable[[str], bool]) -> Optional[int]:
+        """Fills the node of `entry` with the subdirectories passing `filter_fn` and the number of frames, from
+        the recorded node if it is still valid. Returns the modification time, or None if the directory
+        disappeared.
+        """
+        parts, node, old = entry
+        path = os.path.join(self.root, *parts)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        node[0] = mtime_ns if mtime_ns < self._scan_start_ns - RACY_SECONDS * 1e9 else None
+        if old is not None and old[0] == mtime_ns:
+            with self._lock:
+                self.num_reused += 1
+            node[1] = old[1]
+            node[2] = {name: [None, 0, {}] for name in old[2]}
+            return mtime_ns
+        with self._lock:
+            self.num_listed += 1
+        subdirs, num_frames = [], 0
+        try:
+            with os.scandir(path) as entries:
+                for dir_entry in entries:
+                    if dir_entry.is_dir():
+                        if filter_fn(dir_entry.name):
+                            subdirs.append(dir_entry.name)
+                    elif dir_entry.name.startswith(FRAME_PREFIX):
+                        num_frames += 1
+        except FileNotFoundError:
+            return None
+        node[1] = num_frames
+        node[2] = {name: [None, 0, {}] for name in sorted(subdirs)}
+        return mtime_ns
+
+    def _list_dated_folder(self, entry: _Entry) -> List[Trajectory]:
+        """Lists the trajectories of a dated folder and their image directories."""
+        camera_topics = self._camera_topics(entry[0])
+        self._list(entry, lambda name: name == "raw")
+        raw = _children([entry])
+        for raw_entry in raw:
+            self._list(raw_entry, lambda name: name.startswith("traj_group"))
+        groups = _children(raw)
+        for group in groups:
+            self._list(group, lambda name: name.startswith("traj"))
+        trajectories = []
+        for traj in _children(groups):
+            mtime_ns = self._list(traj, lambda name: name in IMAGE_DIRS)
+            image_dirs = _children([traj])
+            for image_dir in image_dirs:
+                self._list(image_dir, lambda name: False)
+            parts, node, _ = traj
+            present = tuple(name for name in IMAGE_DIRS if name in node[2])
+            if any(name in present for name in IMAGE_DIRS[:-1]):
+                trajectories.append(
+                    Trajectory(
+                        os.path.join(self.root, *parts),
+                        camera_topics,
+                        present,
+                        node[2][present[0]][1],
+                        mtime_ns,
+                    )
+                )
+        return trajectories
+
+    def _camera_topics(self, parts: Tuple[str, ...]) -> Optional[List[str]]:
+        key = "/".join(parts)
+        config_path = os.path.join(self.root, *parts, "config.json")
+        try:
+            mtime_ns = os.stat(config_path).st_mtime_ns
+        except FileNotFoundError:
+            self._configs[key] = (None, None)
+            return None
+        cached = self._old_configs.get(key)
+        if cached is not None and cached[0] == mtime_ns:
+            camera_topics = cached[1]
+        else:
+            with open(config_path, "rb") as f:
+                camera_topics = json.load(f)["agent"]["env"][1]["camera_topics"]
+        racy = mtime_ns >= self._scan_start_ns - RACY_SECONDS * 1e9
+        self._configs[key] = (None if racy else mtime_ns, camera_topics)
+        return camera_topics
+
+    @staticmethod
+    def _is_data_dir(name: str) -> bool:
+        return not name.startswith(".") and "cache" not in name
+
+    @staticmethod
+    def _is_dated_folder(name: str) -> bool:
+        return not name.startswith(".") and "lmdb" not in name
+
+
+def _children(level: List[_Entry]) -> List[_Entry]:
+    return [
+        (parts + (name,), child, old[2].get(name) if old else None)
+        for parts, node, old in level
+        for name, child in node[2].items()
+    ]